@@ -7,14 +7,17 @@ from app.config import settings
 from app.controllers.replay_controller import ReplayController
 from app.db_manager import DBManager
 from app.core import limiter
+from app.services.blob_store import create_blob_store
 from app.services.replay_service import ReplayService
+from app.services.spool_service import UploadSpool
 
 # Set the event loop explicitly so the DBManager and Flask use the same loop
 asyncio.set_event_loop(asyncio.new_event_loop())
 
 db_manager = DBManager()
-replay_service = ReplayService(db_manager)
-replay_controller = ReplayController(replay_service)
+replay_service = ReplayService(db_manager, blob_store=create_blob_store())
+upload_spool = UploadSpool(settings.upload_spool_dir, replay_service) if settings.upload_spool_dir else None
+replay_controller = ReplayController(replay_service, spool=upload_spool)
 
 
 def create_app():
@@ -28,6 +31,7 @@ def create_app():
     app.config["API_KEY"] = settings.api_key
     app.config["SECRET_KEY"] = settings.secret
     app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB limit
+    app.config["MAX_BULK_CONTENT_LENGTH"] = 256 * 1024 * 1024  # 256MB limit, 4096 replays
     # Initialize DBManager with a logger instance
     logger_handler_instance = app.logger  # Use Flask's logger
     db_manager.initialize(logger_handler_instance)
@@ -45,6 +49,21 @@ def create_app():
         return app
 
 
+def start_background_work():
+    """
+    Work only the web server runs, never the manage.py commands that also call create_app: warms the player name
+    index, keeps the in-memory filename filter built and drains the upload spool into the database. Called once per
+    worker, from gunicorn's post_worker_init hook or the development server.
+    """
+    replay_service.start_upkeep()
+    if upload_spool:
+        upload_spool.start()
+
+
 # Add a method to initialize the models
 async def init_models():
     await db_manager.init_models()
+
+
+async def run_migrations():
+    return await db_manager.run_migrations()
@@ -9,6 +9,31 @@ class Settings(BaseSettings):
     database_url: str = os.getenv("DATABASE_URL")
     api_key: str = os.getenv("API_KEY")
     secret: str = os.getenv("SECRET_KEY")
+    # Processes used to parse and hash replays during bulk ingest
+    ingest_workers: int = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+    # Sizing of the in-memory duplicate filter over replay filenames, a capacity of 0 disables it
+    filename_filter_capacity: int = int(os.getenv("FILENAME_FILTER_CAPACITY", 10_000_000))
+    filename_filter_error_rate: float = float(os.getenv("FILENAME_FILTER_ERROR_RATE", 0.001))
+    # Seconds between rebuilds of the filter, which bounds how long it misses filenames other processes stored
+    filename_filter_ttl: float = float(os.getenv("FILENAME_FILTER_TTL", 900))
+    # Directory of the durable upload spool, uploads are written there and inserted in the background when set
+    upload_spool_dir: str = os.getenv("UPLOAD_SPOOL_DIR", "")
+    # Where replay bytes are kept, "database" (the replays table) or "packfile" (segment files under blob_store_path)
+    blob_store: str = os.getenv("BLOB_STORE", "database")
+    blob_store_path: str = os.getenv("BLOB_STORE_PATH", "blobs")
+    # Rows fetched per round trip when streaming query results
+    stream_yield_per: int = int(os.getenv("STREAM_YIELD_PER", 1000))
+    # zlib level replays are compressed with at ingest, 0 stores them raw
+    replay_compression_level: int = int(os.getenv("REPLAY_COMPRESSION_LEVEL", 6))
+
+    # Where the stats page is computed, "sql" (the aggregate tables) or "numpy" (in process, over columns of the
+    # replays' metadata refreshed every stats_engine_refresh seconds and reloaded whole every stats_engine_reload)
+    stats_engine: str = os.getenv("STATS_ENGINE", "sql")
+    stats_engine_refresh: float = float(os.getenv("STATS_ENGINE_REFRESH", 5))
+    stats_engine_reload: float = float(os.getenv("STATS_ENGINE_RELOAD", 3600))
+
+    # Seconds a cached filter count lives, which bounds how stale writes from other processes can leave it
+    count_cache_ttl: float = float(os.getenv("COUNT_CACHE_TTL", 60))
 
     class Config:
         env_file = ".env"
@@ -1,8 +1,10 @@
-from typing import Union
+import typing
+from typing import Union, Optional
 
 from flask import Response
 
 from app.services import file_service
+from app.utils.constants import REPLAY_SIZE
 
 
 class CorruptedFile(Exception):
@@ -18,8 +20,7 @@ def allowed_file(filename):
 
 
 def verify_size(data: bytes):
-    min_required_size = 0x8D0 + 0xF730  # Starting offset of "replay_inputs" + its size
-    return len(data) == min_required_size
+    return len(data) == REPLAY_SIZE
 
 
 async def upload_file(filename: str, data: bytes) -> Union[Response, tuple[Response, int]]:
@@ -27,3 +28,20 @@ async def upload_file(filename: str, data: bytes) -> Union[Response, tuple[Respo
         return await file_service.upload_replay(data)
 
     raise CorruptedFile(f"Invalid replay data for file {filename}: data is too small/big or corrupted")
+
+
+def spool_files(files: typing.Iterable[tuple[str, bytes]]) -> tuple[Optional[str], list[str]]:
+    """Queue every valid replay on the upload spool under one ticket, returns the ticket and the rejected filenames."""
+    records = []
+    rejected = []
+    for filename, data in files:
+        if allowed_file(filename) and verify_size(data) and file_service.validate_replay(data):
+            records.append(data)
+        else:
+            rejected.append(filename)
+
+    return file_service.spool_replays(records), rejected
+
+
+def spool_enabled() -> bool:
+    return file_service.spool_enabled()
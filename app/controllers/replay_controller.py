@@ -1,10 +1,13 @@
 import contextlib
+import shutil
 import typing
 from io import BytesIO
 
+from datetime import date, datetime, timedelta, timezone
 from zipfile import ZipFile
 from typing import Union, Dict, Optional, Any
 
+import pytz
 import sqlalchemy
 from sqlalchemy.exc import NoResultFound
 
@@ -12,25 +15,32 @@ from flask import request
 
 from app.schema import ReplayCreate, ReplayUpdate, ReplayQuery
 from app.models.replay import Replay
-from app.controllers.validation import validate_model_data, cast_attributes_to_types
-from app.services.replay_service import ReplayService
+from app.controllers.validation import validate_model_data, cast_attributes_to_types, resolve_date_range
+from app.services.ingest_service import IngestPipeline, is_valid_record
+from app.services.spool_service import UploadSpool
+from app.services.replay_service import ReplayService, ACTIVITY_BUCKETS, TREND_BUCKETS
 
-from app.utils.helpers import read_data
-from app.utils.constants import CHARACTERS
+from app.utils.helpers import read_data, read_records, collapse_replays_into_sets, character_icons
+from app.utils.constants import CHARACTERS, REPLAY_SIZE
+from app.utils.date_range import date_range
 
 
 class ReplayController:
-    def __init__(self, service: ReplayService):
+    def __init__(self, service: ReplayService, spool: UploadSpool = None):
         self.service = service
+        self.pipeline = IngestPipeline(service)
+        self.spool = spool
 
-    async def get_replay(self, query_params: Dict[str, Union[int, str, bytes]], per_page=None, page=1) -> \
-            typing.AsyncGenerator[Replay, None]:
+    async def get_replay(self, query_params: Dict[str, Union[int, str, bytes]], per_page=None, page=1,
+                         include_replay_data=False, cursor: Optional[tuple[datetime, int]] = None) \
+            -> typing.AsyncGenerator[Replay, None]:
         validated_data = validate_model_data(query_params, ReplayQuery)
         if type(validated_data) in (Replay, ReplayQuery):
 
             try:
                 cast_attributes_to_types(query_params)
-                async for replay in self.service.get_replays(query_params, per_page=per_page, page=page):
+                async for replay in self.service.get_replays(query_params, per_page=per_page, page=page,
+                                                             include_replay_data=include_replay_data, cursor=cursor):
                     yield replay
 
             except NoResultFound:
@@ -39,9 +49,35 @@ class ReplayController:
             # Data is invalid, return error response
             yield {"message": "data is invalid"}.update(validated_data)
 
-    async def get_character_usage_statistics(self):
+    @staticmethod
+    def resolve_days(start: str = None, end: str = None, days: int = None) -> typing.Tuple[Optional[date], Optional[date]]:
+        """
+        The UTC days a windowed stats request covers, as the first day and the first day after it. `end` includes its
+        whole step like the recorded_at search, `days` counts back from today. Raises ValueError when invalid.
+        """
+        if days is not None:
+            if days < 1:
+                raise ValueError("days has to be at least 1")
+            end_day = datetime.now(timezone.utc).date() + timedelta(days=1)
+            return end_day - timedelta(days=days), end_day
+
+        start_day = date_range(start).start.date() if start else None
+        # A partial last day still counts, the rollups are per day
+        end_day = (date_range(end).end - timedelta(microseconds=1)).date() + timedelta(days=1) if end else None
+        if start_day and end_day and end_day <= start_day:
+            raise ValueError("A date range has to end after it starts")
+        return start_day, end_day
+
+    async def get_character_usage_statistics(self, start: str = None, end: str = None, days: int = None):
+        try:
+            start_day, end_day = self.resolve_days(start, end, days)
+        except ValueError:
+            return
+        return self.format_character_usage(
+            await self.service.get_character_usage_statistics(start=start_day, end=end_day))
 
-        rows = await self.service.get_character_usage_statistics()
+    @staticmethod
+    def format_character_usage(rows) -> list:
         character_stats = [
             {
                 "character_id": row.character_id,
@@ -53,9 +89,85 @@ class ReplayController:
 
         return character_stats
 
-    async def get_character_matchup_statistics(self, character_id: int = None):
-        rows = await self.service.get_matchup_statistics(character_id)
+    async def get_character_matchup_statistics(self, character_id: int = None, start: str = None, end: str = None,
+                                               days: int = None):
+        try:
+            start_day, end_day = self.resolve_days(start, end, days)
+        except ValueError:
+            return
+        return self.format_matchup_statistics(
+            await self.service.get_matchup_statistics(character_id, start=start_day, end=end_day))
+
+    @staticmethod
+    def window(bucket: str, start_day: Optional[date], end_day: Optional[date]) -> Dict[str, Any]:
+        return {
+            "bucket": bucket,
+            "from": start_day.isoformat() if start_day else None,
+            # The last day included
+            "to": (end_day - timedelta(days=1)).isoformat() if end_day else None,
+        }
+
+    async def get_character_trend(self, character_id: int = None, bucket: str = None, start: str = None,
+                                  end: str = None, days: int = None, side: str = None) -> Optional[Dict[str, Any]]:
+        bucket = bucket or "day"
+        if character_id not in CHARACTERS or bucket not in TREND_BUCKETS or side not in (None, "p1", "p2"):
+            return
+        try:
+            start_day, end_day = self.resolve_days(start, end, days)
+        except ValueError:
+            return
+
+        rows = await self.service.get_character_trend(character_id, bucket, start_day, end_day,
+                                                      side=None if side is None else int(side == "p2"))
+        return {
+            "character_id": character_id,
+            "character_name": CHARACTERS[character_id],
+            "side": side,
+            **self.window(bucket, start_day, end_day),
+            "series": [
+                {
+                    "start": row.bucket_start.isoformat(),
+                    "matches": row.matches,
+                    "wins": row.wins,
+                    "win_rate": row.win_rate,
+                    "usage_rate": row.usage_rate
+                }
+                for row in rows
+            ]
+        }
+
+    async def get_matchup_trend(self, character_1_id: int = None, character_2_id: int = None, bucket: str = None,
+                                start: str = None, end: str = None, days: int = None) -> Optional[Dict[str, Any]]:
+        bucket = bucket or "day"
+        if character_1_id not in CHARACTERS or character_2_id not in CHARACTERS or bucket not in TREND_BUCKETS:
+            return
+        try:
+            start_day, end_day = self.resolve_days(start, end, days)
+        except ValueError:
+            return
 
+        rows = await self.service.get_matchup_trend(character_1_id, character_2_id, bucket, start_day, end_day)
+        # The rollups keep the lower id first, the series follows the order asked for
+        swapped = character_1_id > character_2_id
+        return {
+            "character_1_id": character_1_id,
+            "character_2_id": character_2_id,
+            "character_1_name": CHARACTERS[character_1_id],
+            "character_2_name": CHARACTERS[character_2_id],
+            **self.window(bucket, start_day, end_day),
+            "series": [
+                {
+                    "start": row.bucket_start.isoformat(),
+                    "matches": row.matches,
+                    "character_1_win_rate": row.p2_win_rate if swapped else row.p1_win_rate,
+                    "character_2_win_rate": row.p1_win_rate if swapped else row.p2_win_rate
+                }
+                for row in rows
+            ]
+        }
+
+    @staticmethod
+    def format_matchup_statistics(rows) -> list:
         matchup_stats = [
             {
                 "character_1_id": row.character_1_id,
@@ -75,7 +187,10 @@ class ReplayController:
         return await self.service.get_total_replays()
 
     async def get_total_replays_per_character(self):
-        rows = await self.service.get_total_replays_per_character()
+        return self.format_total_per_character(await self.service.get_total_replays_per_character())
+
+    @staticmethod
+    def format_total_per_character(rows) -> list:
         total_per_character = [
             {
                 "character_id": row.character_id,
@@ -87,7 +202,10 @@ class ReplayController:
         return total_per_character
 
     async def get_matchup_rarity(self):
-        rows = await self.service.get_matchup_rarity()
+        return self.format_matchup_rarity(await self.service.get_matchup_rarity())
+
+    @staticmethod
+    def format_matchup_rarity(rows) -> list:
         matchup_rarity = [
             {
                 "character_1_id": row.character_1_id,
@@ -105,18 +223,148 @@ class ReplayController:
     async def get_total_unique_players(self):
         return await self.service.get_total_unique_players()
 
-    async def get_all_replay_timestamps(self):
-        return self.service.get_all_replay_timestamps()
+    async def get_stats_bundle(self) -> Dict[str, Any]:
+        bundle = await self.service.get_stats_bundle()
+        return {
+            "version": bundle["version"],
+            "total_replays": bundle["total_replays"],
+            "total_players": bundle["total_players"],
+            "total_per_character": self.format_total_per_character(bundle["total_per_character"]),
+            "character_usage": self.format_character_usage(bundle["character_usage"]),
+            "matchup_rarity": self.format_matchup_rarity(bundle["matchup_rarity"]),
+            "matchup_stats": self.format_matchup_statistics(bundle["matchup_stats"]),
+            "replays_per_hour": bundle["replays_per_hour"],
+            "character_icons": character_icons()
+        }
+
+    def get_filter_stats(self) -> Dict[str, Any]:
+        return self.service.get_filter_stats()
+
+    def get_count_cache_stats(self) -> Dict[str, Any]:
+        return self.service.get_count_cache_stats()
+
+    @staticmethod
+    def win_rate(wins: int, matches: int) -> float:
+        return round(wins * 100 / matches, 2) if matches else 0.0
+
+    async def get_player_profile(self, steamid64: int) -> Optional[Dict[str, Any]]:
+        try:
+            profile = await self.service.get_player_profile(steamid64)
+        except NoResultFound:
+            return
 
-    async def get_replays(self, query_params: Dict[str, Union[int, str, bytes]] = None, per_page=None, page=1) \
+        player = profile["player"]
+        total_matches = sum(row.matches for row in profile["characters"])
+        wins = sum(row.wins for row in profile["characters"])
+        replays = [replay.to_dict() for replay in profile["replays"]]
+        recent_sets = collapse_replays_into_sets(replays) if replays else []
+        recent_sets.sort(key=lambda r: r["recorded_at"], reverse=True)
+
+        return {
+            "steamid64": steamid64,
+            "name": player.name if player else None,
+            "first_seen": player.first_seen if player else None,
+            "last_seen": player.last_seen if player else None,
+            "total_matches": total_matches,
+            "wins": wins,
+            "win_rate": self.win_rate(wins, total_matches),
+            "characters": [
+                {
+                    "character_id": row.character_id,
+                    "character_name": CHARACTERS[row.character_id],
+                    "matches": row.matches,
+                    "wins": row.wins,
+                    "win_rate": self.win_rate(row.wins, row.matches)
+                }
+                for row in profile["characters"]
+            ],
+            "opponents": [
+                {
+                    "steamid64": row.PlayerOpponentStats.opponent_steamid64,
+                    "name": row.name,
+                    "matches": row.PlayerOpponentStats.matches,
+                    "wins": row.PlayerOpponentStats.wins,
+                    "win_rate": self.win_rate(row.PlayerOpponentStats.wins, row.PlayerOpponentStats.matches)
+                }
+                for row in profile["opponents"]
+            ],
+            "opponent_characters": [
+                {
+                    "character_id": row.opponent_character_id,
+                    "character_name": CHARACTERS[row.opponent_character_id],
+                    "matches": row.matches,
+                    "wins": row.wins,
+                    "win_rate": self.win_rate(row.wins, row.matches)
+                }
+                for row in profile["matchups"]
+            ],
+            "recent_sets": recent_sets
+        }
+
+    async def suggest_players(self, prefix: str, limit=10) -> typing.List[Dict[str, Any]]:
+        return await self.service.suggest_players(prefix, max(1, min(limit, 50)))
+
+    async def get_activity(self, bucket: str = None, start: str = None, end: str = None,
+                           tz: str = None) -> Optional[Dict[str, Any]]:
+        bucket = bucket or "day"
+        if bucket not in ACTIVITY_BUCKETS:
+            return
+        try:
+            zone = pytz.timezone(tz or "UTC")
+            # `to` is inclusive of its step, like the recorded_at search, to=2024-05 runs to the end of May
+            period_start = date_range(start, tz=zone.zone).start if start else None
+            period_end = date_range(end, tz=zone.zone).end if end else None
+        except (ValueError, pytz.UnknownTimeZoneError):
+            return
+        if period_start and period_end and period_end <= period_start:
+            return
+
+        activity = await self.service.get_activity(bucket, period_start, period_end, zone.zone)
+        return {
+            "bucket": bucket,
+            "tz": zone.zone,
+            "from": period_start.isoformat() if period_start else None,
+            "to": period_end.isoformat() if period_end else None,
+            "buckets": [{"start": bucket_start.astimezone(zone).isoformat(), "count": count}
+                        for bucket_start, count in activity]
+        }
+
+    def get_activity_cache_stats(self) -> Dict[str, Any]:
+        return self.service.get_activity_cache_stats()
+
+    async def get_replays(self, query_params: Dict[str, Union[int, str, bytes]] = None, per_page=None, page=1,
+                          include_replay_data=False, cursor: Optional[tuple[datetime, int]] = None) \
             -> typing.AsyncGenerator[Replay, None]:
         if query_params:
-            async for replay in self.get_replay(query_params, per_page=per_page, page=page):
+            async for replay in self.get_replay(query_params, per_page=per_page, page=page,
+                                                include_replay_data=include_replay_data, cursor=cursor):
                 yield replay
         else:
-            async for replay in self.service.get_all_replays(per_page=per_page, page=page):
+            async for replay in self.service.get_all_replays(per_page=per_page, page=page,
+                                                             include_replay_data=include_replay_data, cursor=cursor):
                 yield replay
 
+    async def get_replay_page(self, query_params: Dict[str, Union[int, str, bytes]], per_page: int, page=1,
+                              include_replay_data=False, cursor: Optional[tuple[datetime, int]] = None,
+                              count="exact", granularity: str = None, tz: str = None) \
+            -> Optional[tuple[typing.List[Replay], Optional[int], bool]]:
+        """
+        A page of replays with its total and whether more follow, None if the query parameters are invalid.
+        A recorded_at search covers the `granularity` it is written to, read in the `tz` timezone.
+        """
+        if query_params:
+            try:
+                resolve_date_range(query_params, granularity=granularity, tz=tz)
+            except ValueError:
+                return
+            validated_data = validate_model_data(query_params, ReplayQuery)
+            if type(validated_data) not in (Replay, ReplayQuery):
+                return
+            cast_attributes_to_types(query_params)
+
+        return await self.service.get_replay_page(query_params, per_page, page=page,
+                                                  include_replay_data=include_replay_data, cursor=cursor, count=count)
+
     async def get_total_pages(self, query_params: dict = None, per_page=10) -> int:
         return await self.service.get_total_pages(query_params, per_page=per_page)
 
@@ -130,6 +378,31 @@ class ReplayController:
             return
         return replay
 
+    async def create_replays(self, stream: typing.BinaryIO) -> typing.List[Dict[str, Any]]:
+        """Parse back-to-back replay records from a stream as it arrives and insert them in batches.
+        Returns a result per record, in order, with a status of created, duplicate or corrupt."""
+        return [result async for result in self.pipeline.run(read_records(stream, REPLAY_SIZE))]
+
+    def spool_replays(self, records: typing.Sequence[bytes]) -> Optional[str]:
+        """Queue already validated replays on the upload spool, returns the ticket or None when nothing was queued."""
+        if not records:
+            return
+        return self.spool.append(records)
+
+    @staticmethod
+    def validate_replay(data: bytes) -> bool:
+        return is_valid_record(data)
+
+    def get_upload_status(self, ticket: str) -> Optional[Dict[str, Any]]:
+        if not self.spool:
+            return
+        return self.spool.status(ticket)
+
+    async def get_missing_replays(self, filenames: typing.Sequence[str]) -> typing.List[str]:
+        # Clients may send bare hashes, stored filenames always carry the extension
+        filenames = [filename if filename.endswith(".dat") else f"{filename}.dat" for filename in filenames]
+        return await self.service.missing_filenames(list(dict.fromkeys(filenames)))
+
     async def update_replay(self, replay_id: int) -> Optional[Union[dict[str, str], Replay]]:
         data = request.get_json()
         replay_update = ReplayUpdate(**data)
@@ -183,7 +456,9 @@ class ReplayController:
                     p2_toon_initials = filename[2][0] + filename[2][-6]
                     filename = f"{p1_initials}_{p1_toon_initials}_{p2_initials}_{p2_toon_initials}{extension}".lower()
 
-                    zf.writestr(filename, data.getvalue())
+                    # Copied in chunks, blobs read from the blob store are never materialised as a whole
+                    with zf.open(filename, "w") as entry:
+                        shutil.copyfileobj(data, entry)
 
             stream.seek(0)
             return stream, base_filename, archive_mimetype
@@ -8,7 +8,11 @@ from dateutil import parser
 from pydantic import ValidationError
 
 from app.models.replay import Replay
-from app.schema import ReplayQuery
+from app.schema import ReplayQuery, MULTI_VALUE_FIELDS, MAX_FILTER_VALUES
+from app.utils.date_range import DateRange, date_range
+
+# Lists arrive in query strings as e.g. ["2024-05-01", "2024-05-03"]
+LIST_PATTERN = r'"(.*?)"'
 
 
 def cast_attributes_to_types(replay_instance: typing.Union[Replay, ReplayQuery, dict]):
@@ -39,7 +43,10 @@ def cast_attributes_to_types(replay_instance: typing.Union[Replay, ReplayQuery,
 
         if attr_value is not None:
 
-            casted_value = attr_type(attr_value)
+            if isinstance(attr_value, frozenset):
+                casted_value = frozenset(attr_type(element) for element in attr_value)
+            else:
+                casted_value = attr_type(attr_value)
 
             if not isinstance(replay_instance, dict):
                 setattr(replay_instance, attr_name, casted_value)
@@ -49,6 +56,8 @@ def cast_attributes_to_types(replay_instance: typing.Union[Replay, ReplayQuery,
 
 def parse_date_string(date_object: typing.Union[str, datetime, typing.Tuple[Any], typing.List[Any]]) -> Union[
                     datetime, tuple[Union[datetime, tuple[datetime]], ...]]:
+    if isinstance(date_object, DateRange):
+        return date_object
     try:
         # Parse object into a datetime object
         timezone = pytz.timezone("UTC")
@@ -67,11 +76,42 @@ def parse_date_string(date_object: typing.Union[str, datetime, typing.Tuple[Any]
             raise TypeError("Invalid object was passed for date.")
 
 
+def parse_query_args(args) -> Dict[str, Any]:
+    """
+    Query parameters as a dict. A multi-value filter repeated with different values becomes a frozenset of them,
+    any other repeated parameter keeps its first value like request.args.get. Raises ValueError past
+    MAX_FILTER_VALUES values.
+    """
+    params = {}
+    for key, values in args.to_dict(flat=False).items():
+        distinct = frozenset(values)
+        if key not in MULTI_VALUE_FIELDS or len(distinct) == 1:
+            params[key] = values[0]
+        elif len(distinct) > MAX_FILTER_VALUES:
+            raise ValueError(f"At most {MAX_FILTER_VALUES} values can be given for `{key}`")
+        else:
+            params[key] = distinct
+    return params
+
+
+def resolve_date_range(data: Dict[str, Any], granularity: str = None, tz: str = None) -> None:
+    """Turn a recorded_at search into the half-open range it covers, raises ValueError if it can't be read."""
+    value = data.get("recorded_at")
+    if value is None or isinstance(value, DateRange):
+        return
+    if isinstance(value, int):
+        # A bare year, cast to int along with every other numeric parameter
+        value = str(value)
+    if isinstance(value, str) and value.startswith(("[", "(")):
+        value = re.findall(LIST_PATTERN, value)
+    data["recorded_at"] = date_range(value, granularity=granularity, tz=tz)
+
+
 def validate_model_data(data: Dict[str, Union[str, int, bytes]],
                         model: typing.Union[typing.Type[Replay], typing.Type[ReplayQuery]]) \
         -> Union[Replay, ReplayQuery, Dict[str, Any]]:
     try:
-        pattern = r'"(.*?)"'
+        pattern = LIST_PATTERN
         # validate
         for key, value in data.items():
             # check if it's tuple or list string
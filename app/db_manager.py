@@ -4,6 +4,7 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base, scoped_session
 from sqlalchemy.pool import NullPool
 from app.config import settings
+from app.migrations import run_migrations
 
 Base = declarative_base()
 
@@ -45,3 +46,6 @@ class DBManager:
         async with self.engine.begin() as conn:
             # Create tables if they don't already exist
             await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+
+    async def run_migrations(self, out=print):
+        return await run_migrations(self.engine, out=out)
@@ -0,0 +1,80 @@
+import logging
+import typing
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.migrations import m0001_pg_trgm, m0002_search_indexes, m0003_keyset_index, m0004_players, \
+    m0005_drop_replay_name_indexes, m0006_player_stats, m0007_character_stats, m0008_daily_stats, \
+    m0009_upload_date_index
+from app.migrations.base import Migration
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS: typing.List[Migration] = sorted(
+    (m0001_pg_trgm.migration, m0002_search_indexes.migration, m0003_keyset_index.migration,
+     m0004_players.migration, m0005_drop_replay_name_indexes.migration, m0006_player_stats.migration,
+     m0007_character_stats.migration, m0008_daily_stats.migration,
+     m0009_upload_date_index.migration),
+    key=lambda migration: migration.version
+)
+
+CREATE_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+)
+"""
+
+# A failed CREATE INDEX CONCURRENTLY leaves an invalid index behind that IF NOT EXISTS would then skip over
+INVALID_INDEXES = """
+SELECT index.relname FROM pg_index
+JOIN pg_class index ON index.oid = pg_index.indexrelid
+JOIN pg_class tbl ON tbl.oid = pg_index.indrelid
+WHERE NOT pg_index.indisvalid AND tbl.relname = 'replays'
+"""
+
+
+async def applied_versions(engine: AsyncEngine) -> typing.Set[int]:
+    async with engine.begin() as conn:
+        await conn.execute(text(CREATE_MIGRATIONS_TABLE))
+        return set((await conn.execute(text("SELECT version FROM schema_migrations"))).scalars())
+
+
+async def pending_migrations(engine: AsyncEngine) -> typing.List[Migration]:
+    applied = await applied_versions(engine)
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+async def _record(conn, migration: Migration) -> None:
+    await conn.execute(text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                       {"version": migration.version, "name": migration.name})
+
+
+async def run_migrations(engine: AsyncEngine, out: typing.Callable[[str], None] = print) -> typing.List[Migration]:
+    """Apply every pending migration in version order, returns the ones applied."""
+    applied = []
+
+    for migration in await pending_migrations(engine):
+        out(f"Applying {migration.version:04} {migration.name}")
+
+        if migration.transactional:
+            async with engine.begin() as conn:
+                for statement in migration.statements:
+                    await conn.execute(text(statement))
+                await _record(conn, migration)
+        else:
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                for index in (await conn.execute(text(INVALID_INDEXES))).scalars().all():
+                    out(f"Dropping invalid index {index} left by an interrupted build")
+                    await conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index}"'))
+                for statement in migration.statements:
+                    await conn.execute(text(statement))
+                await _record(conn, migration)
+
+        logger.info(f"Applied migration {migration.version:04} {migration.name}")
+        applied.append(migration)
+
+    return applied
@@ -0,0 +1,19 @@
+import typing
+
+
+class Migration:
+    """
+    One numbered schema change. Transactional migrations run in a single transaction together with their entry in
+    schema_migrations. The rest run statement by statement in autocommit mode, which is what CREATE INDEX
+    CONCURRENTLY needs, and are recorded once every statement went through. Their statements have to be safe to
+    rerun (IF NOT EXISTS) since a failure part way leaves the earlier ones applied.
+    """
+
+    def __init__(self, version: int, name: str, statements: typing.Sequence[str], transactional=True):
+        self.version = version
+        self.name = name
+        self.statements = statements
+        self.transactional = transactional
+
+    def __repr__(self):
+        return f"<Migration {self.version:04} {self.name}>"
@@ -0,0 +1,6 @@
+from app.migrations.base import Migration
+
+# Trigram operator classes, lets the name indexes serve LIKE '%term%'
+migration = Migration(1, "pg_trgm", [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+])
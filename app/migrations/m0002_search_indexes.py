@@ -0,0 +1,25 @@
+from app.migrations.base import Migration
+
+# Matched to the predicates ReplayService.build_conditions emits, every list orders by recorded_at DESC so the
+# equality filters carry it as a second column and a page comes straight off the index
+migration = Migration(2, "search_indexes", [
+    # lower(name) LIKE '%term%' on either side
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_replays_p1_lower_trgm ON replays USING gin (lower(p1) gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_replays_p2_lower_trgm ON replays USING gin (lower(p2) gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_replays_recorder_lower_trgm "
+    "ON replays USING gin (lower(recorder) gin_trgm_ops)",
+    # character_id = x on either side
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_replays_p1_character_recorded_at "
+    "ON replays (p1_character_id, recorded_at DESC)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_replays_p2_character_recorded_at "
+    "ON replays (p2_character_id, recorded_at DESC)",
+    # steamid64 = x on either side, and the recorder's
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_replays_p1_steamid64_recorded_at "
+    "ON replays (p1_steamid64, recorded_at DESC)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_replays_p2_steamid64_recorded_at "
+    "ON replays (p2_steamid64, recorded_at DESC)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_replays_recorder_steamid64_recorded_at "
+    "ON replays (recorder_steamid64, recorded_at DESC)",
+    # Unfiltered listings and date ranges
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_replays_recorded_at ON replays (recorded_at DESC)",
+], transactional=False)
@@ -0,0 +1,9 @@
+from app.migrations.base import Migration
+
+# Listings order by (recorded_at, replay_id) DESC and keyset pages seek to a (recorded_at, replay_id) cursor, the
+# composite index serves both and everything the recorded_at index did, so it replaces it
+migration = Migration(3, "keyset_index", [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_replays_recorded_at_replay_id "
+    "ON replays (recorded_at DESC, replay_id DESC)",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_replays_recorded_at",
+], transactional=False)
@@ -0,0 +1,43 @@
+from app.migrations.base import Migration
+
+# Every (steamid64, name) a replay was played or recorded under, for the backfill below
+SIDES = """
+    SELECT steamid64, name, min(recorded_at) AS first_seen, max(recorded_at) AS last_seen
+    FROM (
+        SELECT p1_steamid64 AS steamid64, p1 AS name, recorded_at FROM replays
+        UNION ALL SELECT p2_steamid64, p2, recorded_at FROM replays
+        UNION ALL SELECT recorder_steamid64, recorder, recorded_at FROM replays
+    ) AS sides
+    WHERE steamid64 IS NOT NULL AND name IS NOT NULL
+    GROUP BY steamid64, name
+"""
+
+# Players keyed by steamid64 with their name history, name searches look names up here and join the replays on the
+# steamid64 indexes. Replays keep their name columns, listings show them as recorded
+migration = Migration(4, "players", [
+    "CREATE TABLE IF NOT EXISTS players ("
+    "steamid64 BIGINT PRIMARY KEY, "
+    "name VARCHAR(255) NOT NULL, "
+    "first_seen TIMESTAMP WITH TIME ZONE, "
+    "last_seen TIMESTAMP WITH TIME ZONE)",
+    "CREATE TABLE IF NOT EXISTS player_names ("
+    "steamid64 BIGINT REFERENCES players (steamid64) ON DELETE CASCADE, "
+    "name VARCHAR(255), "
+    "first_seen TIMESTAMP WITH TIME ZONE, "
+    "last_seen TIMESTAMP WITH TIME ZONE, "
+    "PRIMARY KEY (steamid64, name))",
+    # One pass over the replays, the players come out of the same names (foreign keys are checked at the end of the
+    # statement)
+    f"WITH names AS ({SIDES}), "
+    "new_players AS ("
+    "    INSERT INTO players (steamid64, name, first_seen, last_seen) "
+    "    SELECT DISTINCT ON (steamid64) steamid64, name, "
+    "        min(first_seen) OVER (PARTITION BY steamid64), max(last_seen) OVER (PARTITION BY steamid64) "
+    "    FROM names ORDER BY steamid64, last_seen DESC "
+    "    ON CONFLICT (steamid64) DO NOTHING) "
+    "INSERT INTO player_names (steamid64, name, first_seen, last_seen) "
+    "SELECT steamid64, name, first_seen, last_seen FROM names "
+    "ON CONFLICT (steamid64, name) DO NOTHING",
+    # lower(name) LIKE '%term%'
+    "CREATE INDEX IF NOT EXISTS ix_player_names_lower_trgm ON player_names USING gin (lower(name) gin_trgm_ops)",
+])
@@ -0,0 +1,9 @@
+from app.migrations.base import Migration
+
+# Name searches go through player_names since 0004, the trigram indexes on the replays' own name columns are only
+# upkeep on every insert
+migration = Migration(5, "drop_replay_name_indexes", [
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_replays_p1_lower_trgm",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_replays_p2_lower_trgm",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_replays_recorder_lower_trgm",
+], transactional=False)
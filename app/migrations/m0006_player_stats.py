@@ -0,0 +1,47 @@
+from app.migrations.base import Migration
+
+# Both sides of every replay, from the point of view of the player on that side. winner 0 is a p1 win
+SIDES = """
+    SELECT p1_steamid64 AS steamid64, p1_character_id AS character_id, p2_steamid64 AS opponent_steamid64,
+           p2_character_id AS opponent_character_id, winner = 0 AS won
+    FROM replays
+    UNION ALL
+    SELECT p2_steamid64, p2_character_id, p1_steamid64, p1_character_id, winner = 1
+    FROM replays
+"""
+
+# Recompute every per-player counter from the replays, also what rebuild-player-stats runs
+REBUILD_STATEMENTS = [
+    "DELETE FROM player_character_stats",
+    "DELETE FROM player_opponent_stats",
+    "DELETE FROM player_matchup_stats",
+    "INSERT INTO player_character_stats (steamid64, character_id, matches, wins) "
+    "SELECT steamid64, character_id, count(*), count(*) FILTER (WHERE won) "
+    f"FROM ({SIDES}) AS sides WHERE steamid64 IS NOT NULL AND character_id IS NOT NULL "
+    "GROUP BY steamid64, character_id",
+    "INSERT INTO player_opponent_stats (steamid64, opponent_steamid64, matches, wins) "
+    "SELECT steamid64, opponent_steamid64, count(*), count(*) FILTER (WHERE won) "
+    f"FROM ({SIDES}) AS sides WHERE steamid64 IS NOT NULL AND opponent_steamid64 IS NOT NULL "
+    "GROUP BY steamid64, opponent_steamid64",
+    "INSERT INTO player_matchup_stats (steamid64, opponent_character_id, matches, wins) "
+    "SELECT steamid64, opponent_character_id, count(*), count(*) FILTER (WHERE won) "
+    f"FROM ({SIDES}) AS sides WHERE steamid64 IS NOT NULL AND opponent_character_id IS NOT NULL "
+    "GROUP BY steamid64, opponent_character_id",
+]
+
+# Counters behind /api/player/<steamid64>, the profile reads a handful of rows instead of aggregating replays
+migration = Migration(6, "player_stats", [
+    "CREATE TABLE IF NOT EXISTS player_character_stats ("
+    "steamid64 BIGINT, character_id SMALLINT, "
+    "matches INTEGER NOT NULL DEFAULT 0, wins INTEGER NOT NULL DEFAULT 0, "
+    "PRIMARY KEY (steamid64, character_id))",
+    "CREATE TABLE IF NOT EXISTS player_opponent_stats ("
+    "steamid64 BIGINT, opponent_steamid64 BIGINT, "
+    "matches INTEGER NOT NULL DEFAULT 0, wins INTEGER NOT NULL DEFAULT 0, "
+    "PRIMARY KEY (steamid64, opponent_steamid64))",
+    "CREATE TABLE IF NOT EXISTS player_matchup_stats ("
+    "steamid64 BIGINT, opponent_character_id SMALLINT, "
+    "matches INTEGER NOT NULL DEFAULT 0, wins INTEGER NOT NULL DEFAULT 0, "
+    "PRIMARY KEY (steamid64, opponent_character_id))",
+    *REBUILD_STATEMENTS,
+])
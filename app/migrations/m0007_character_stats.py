@@ -0,0 +1,55 @@
+from app.migrations.base import Migration
+
+# Per character: the replays it appears in (a mirror match once), the sides it played and won. winner 0 is a p1 win
+CHARACTER_STATS = """
+    SELECT character_id, count(*) FILTER (WHERE NOT mirror) AS replays, count(*) AS matches,
+           count(*) FILTER (WHERE won) AS wins
+    FROM (
+        SELECT p1_character_id AS character_id, winner = 0 AS won, false AS mirror FROM replays
+        UNION ALL
+        SELECT p2_character_id, winner = 1, p2_character_id = p1_character_id IS TRUE FROM replays
+    ) AS sides
+    WHERE character_id IS NOT NULL
+    GROUP BY character_id
+"""
+
+# Per unordered character pair, character_1_id <= character_2_id. In a mirror match the p1 side is character 1
+MATCHUP_STATS = """
+    SELECT least(p1_character_id, p2_character_id) AS character_1_id,
+           greatest(p1_character_id, p2_character_id) AS character_2_id,
+           count(*) AS matches,
+           count(*) FILTER (WHERE CASE WHEN p1_character_id <= p2_character_id THEN winner = 0 ELSE winner = 1 END)
+               AS character_1_wins,
+           count(*) FILTER (WHERE CASE WHEN p1_character_id <= p2_character_id THEN winner = 1 ELSE winner = 0 END)
+               AS character_2_wins
+    FROM replays
+    WHERE p1_character_id IS NOT NULL AND p2_character_id IS NOT NULL
+    GROUP BY 1, 2
+"""
+
+# Table: (key columns, counter columns, the query recomputing it from the replays)
+AGGREGATES = {
+    "character_stats": (("character_id",), ("replays", "matches", "wins"), CHARACTER_STATS),
+    "matchup_stats": (("character_1_id", "character_2_id"), ("matches", "character_1_wins", "character_2_wins"),
+                      MATCHUP_STATS),
+}
+
+# Recompute both tables from the replays, also what check-aggregates --repair runs
+REBUILD_STATEMENTS = [
+    statement
+    for table, (keys, counters, query) in AGGREGATES.items()
+    for statement in (f"DELETE FROM {table}",
+                      f"INSERT INTO {table} ({', '.join(keys + counters)}) {query}")
+]
+
+# Counters behind the stats page, at most 36 and 36 * 37 / 2 rows, kept in step with the replays at write time
+migration = Migration(7, "character_stats", [
+    "CREATE TABLE IF NOT EXISTS character_stats ("
+    "character_id SMALLINT PRIMARY KEY, "
+    "replays INTEGER NOT NULL DEFAULT 0, matches INTEGER NOT NULL DEFAULT 0, wins INTEGER NOT NULL DEFAULT 0)",
+    "CREATE TABLE IF NOT EXISTS matchup_stats ("
+    "character_1_id SMALLINT, character_2_id SMALLINT, matches INTEGER NOT NULL DEFAULT 0, "
+    "character_1_wins INTEGER NOT NULL DEFAULT 0, character_2_wins INTEGER NOT NULL DEFAULT 0, "
+    "PRIMARY KEY (character_1_id, character_2_id))",
+    *REBUILD_STATEMENTS,
+])
@@ -0,0 +1,52 @@
+from app.migrations.base import Migration
+
+# The replays of one period, {period} narrows them to recorded_at >= :start AND recorded_at < :end for backfills
+PERIOD = "AND recorded_at >= :start AND recorded_at < :end"
+
+# Per UTC day, character and side (0 for p1, 1 for p2): the sides played and won. winner 0 is a p1 win
+CHARACTER_DAILY_STATS = """
+    SELECT (recorded_at AT TIME ZONE 'UTC')::date AS day, character_id, side, count(*) AS matches,
+           count(*) FILTER (WHERE won) AS wins
+    FROM (
+        SELECT recorded_at, p1_character_id AS character_id, 0 AS side, winner = 0 AS won FROM replays
+        UNION ALL
+        SELECT recorded_at, p2_character_id, 1, winner = 1 FROM replays
+    ) AS sides
+    WHERE character_id IS NOT NULL AND recorded_at IS NOT NULL {period}
+    GROUP BY 1, 2, 3
+"""
+
+# Per UTC day and unordered character pair, counted like matchup_stats in migration 0007
+MATCHUP_DAILY_STATS = """
+    SELECT (recorded_at AT TIME ZONE 'UTC')::date AS day,
+           least(p1_character_id, p2_character_id) AS character_1_id,
+           greatest(p1_character_id, p2_character_id) AS character_2_id,
+           count(*) AS matches,
+           count(*) FILTER (WHERE CASE WHEN p1_character_id <= p2_character_id THEN winner = 0 ELSE winner = 1 END)
+               AS character_1_wins,
+           count(*) FILTER (WHERE CASE WHEN p1_character_id <= p2_character_id THEN winner = 1 ELSE winner = 0 END)
+               AS character_2_wins
+    FROM replays
+    WHERE p1_character_id IS NOT NULL AND p2_character_id IS NOT NULL AND recorded_at IS NOT NULL {period}
+    GROUP BY 1, 2, 3
+"""
+
+# Table: (key columns, counter columns, the query recomputing it from the replays)
+DAILY_AGGREGATES = {
+    "character_daily_stats": (("day", "character_id", "side"), ("matches", "wins"), CHARACTER_DAILY_STATS),
+    "matchup_daily_stats": (("day", "character_1_id", "character_2_id"),
+                            ("matches", "character_1_wins", "character_2_wins"), MATCHUP_DAILY_STATS),
+}
+
+# Daily rollups behind the trend and windowed stats, a few hundred rows per month instead of every replay. Only the
+# tables are created here, backfill-daily-stats fills them month by month without holding up uploads for long
+migration = Migration(8, "daily_stats", [
+    "CREATE TABLE IF NOT EXISTS character_daily_stats ("
+    "day DATE, character_id SMALLINT, side SMALLINT, "
+    "matches INTEGER NOT NULL DEFAULT 0, wins INTEGER NOT NULL DEFAULT 0, "
+    "PRIMARY KEY (day, character_id, side))",
+    "CREATE TABLE IF NOT EXISTS matchup_daily_stats ("
+    "day DATE, character_1_id SMALLINT, character_2_id SMALLINT, matches INTEGER NOT NULL DEFAULT 0, "
+    "character_1_wins INTEGER NOT NULL DEFAULT 0, character_2_wins INTEGER NOT NULL DEFAULT 0, "
+    "PRIMARY KEY (day, character_1_id, character_2_id))",
+])
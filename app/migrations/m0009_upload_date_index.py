@@ -0,0 +1,6 @@
+from app.migrations.base import Migration
+
+# The numpy stats engine refreshes by fetching the replays uploaded since its last refresh, a range on upload_date
+migration = Migration(9, "upload_date_index", [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_replays_upload_date ON replays (upload_date)",
+], transactional=False)
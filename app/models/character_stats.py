@@ -0,0 +1,47 @@
+from app.models import Base
+
+from sqlalchemy import Column, Integer, Date
+
+from sqlalchemy.dialects.postgresql import SMALLINT
+
+
+# Stats page counters kept in step with the replays as they are inserted and deleted, rebuilt by migration 0007 and
+# check-aggregates --repair
+
+class CharacterStats(Base):
+    __tablename__ = "character_stats"
+    character_id = Column(SMALLINT, primary_key=True)
+    # Replays the character appears in, a mirror match counts once here and twice in matches
+    replays = Column(Integer, nullable=False, default=0)
+    matches = Column(Integer, nullable=False, default=0)
+    wins = Column(Integer, nullable=False, default=0)
+
+
+class MatchupStats(Base):
+    # One row per unordered pair, character_1_id <= character_2_id
+    __tablename__ = "matchup_stats"
+    character_1_id = Column(SMALLINT, primary_key=True)
+    character_2_id = Column(SMALLINT, primary_key=True)
+    matches = Column(Integer, nullable=False, default=0)
+    character_1_wins = Column(Integer, nullable=False, default=0)
+    character_2_wins = Column(Integer, nullable=False, default=0)
+
+
+class CharacterDailyStats(Base):
+    # Per UTC day, character and side (0 for p1, 1 for p2), filled by backfill-daily-stats
+    __tablename__ = "character_daily_stats"
+    day = Column(Date, primary_key=True)
+    character_id = Column(SMALLINT, primary_key=True)
+    side = Column(SMALLINT, primary_key=True)
+    matches = Column(Integer, nullable=False, default=0)
+    wins = Column(Integer, nullable=False, default=0)
+
+
+class MatchupDailyStats(Base):
+    __tablename__ = "matchup_daily_stats"
+    day = Column(Date, primary_key=True)
+    character_1_id = Column(SMALLINT, primary_key=True)
+    character_2_id = Column(SMALLINT, primary_key=True)
+    matches = Column(Integer, nullable=False, default=0)
+    character_1_wins = Column(Integer, nullable=False, default=0)
+    character_2_wins = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,27 @@
+from app.models import Base
+
+from sqlalchemy import Column, String, ForeignKey
+
+from sqlalchemy.dialects.postgresql import TIMESTAMP, BIGINT
+
+
+class Player(Base):
+    # One row per steam account, under the name of its latest replay. Filled at ingest and by migration 0004, the
+    # name index is created there too
+    __tablename__ = "players"
+    steamid64 = Column(BIGINT, primary_key=True)
+    name = Column(String(255), nullable=False)
+    first_seen = Column(type_=TIMESTAMP(timezone=True))
+    last_seen = Column(type_=TIMESTAMP(timezone=True))
+
+    def to_dict(self):
+        return {column.name: getattr(self, column.name) for column in self.__table__.columns}
+
+
+class PlayerName(Base):
+    # Every name a steam account played under and when, name searches go through here to the replays' steamid64
+    __tablename__ = "player_names"
+    steamid64 = Column(BIGINT, ForeignKey("players.steamid64", ondelete="CASCADE"), primary_key=True)
+    name = Column(String(255), primary_key=True)
+    first_seen = Column(type_=TIMESTAMP(timezone=True))
+    last_seen = Column(type_=TIMESTAMP(timezone=True))
@@ -0,0 +1,32 @@
+from app.models import Base
+
+from sqlalchemy import Column, Integer
+
+from sqlalchemy.dialects.postgresql import SMALLINT, BIGINT
+
+
+# Per-player counters kept in step with the replays as they are inserted and deleted, rebuilt by migration 0006 and
+# the rebuild-player-stats command. A match counts once for each side, wins as recorded by the replay's winner
+
+class PlayerCharacterStats(Base):
+    __tablename__ = "player_character_stats"
+    steamid64 = Column(BIGINT, primary_key=True)
+    character_id = Column(SMALLINT, primary_key=True)
+    matches = Column(Integer, nullable=False, default=0)
+    wins = Column(Integer, nullable=False, default=0)
+
+
+class PlayerOpponentStats(Base):
+    __tablename__ = "player_opponent_stats"
+    steamid64 = Column(BIGINT, primary_key=True)
+    opponent_steamid64 = Column(BIGINT, primary_key=True)
+    matches = Column(Integer, nullable=False, default=0)
+    wins = Column(Integer, nullable=False, default=0)
+
+
+class PlayerMatchupStats(Base):
+    __tablename__ = "player_matchup_stats"
+    steamid64 = Column(BIGINT, primary_key=True)
+    opponent_character_id = Column(SMALLINT, primary_key=True)
+    matches = Column(Integer, nullable=False, default=0)
+    wins = Column(Integer, nullable=False, default=0)
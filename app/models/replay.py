@@ -13,6 +13,8 @@ from sqlalchemy.dialects.postgresql import BYTEA, SMALLINT, TIMESTAMP, BIGINT
 
 
 class Replay(Base):
+    # Indexes beyond the unique filename are created by the migrations in app/migrations, they need pg_trgm and
+    # are built concurrently on live tables
     __tablename__ = "replays"
     replay_id = Column(Integer, Sequence("replays_id_seq", start=1, increment=1), primary_key=True)
     replay = Column(BYTEA)
@@ -30,13 +32,11 @@ class Replay(Base):
     recorder_steamid64 = Column(BIGINT)
 
     def to_dict(self, include_replay_data=False):
-        model_dict = {column.name: getattr(self, column.name) for column in self.__table__.columns}
-        if include_replay_data:
-            replay = model_dict.get("replay")
-            if replay:
-                # Convert binary data to base64-encoded string
-                model_dict["replay"] = base64.b64encode(self.replay).decode("utf-8")
-        else:
-            model_dict.pop("replay", None)
+        # The blob is skipped rather than popped afterwards, listings load it deferred and must not touch it
+        model_dict = {column.name: getattr(self, column.name) for column in self.__table__.columns
+                      if column.name != "replay"}
+        if include_replay_data and self.replay:
+            # Convert binary data to base64-encoded string
+            model_dict["replay"] = base64.b64encode(self.replay).decode("utf-8")
 
         return model_dict
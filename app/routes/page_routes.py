@@ -29,6 +29,15 @@ async def index():
 async def upload():
     form = UploadForm()
     if form.validate_on_submit():
+        if file_controller.spool_enabled():
+            # Queue everything under one ticket and let the background writer insert it
+            ticket, rejected = file_controller.spool_files(("1.dat", file.read()) for file in form.files.data)
+            if ticket:
+                flash(f"Replays queued for upload, ticket {ticket}.", "success")
+            if rejected:
+                flash(f"{len(rejected)} file(s) had invalid replay data: data is too small/big or corrupted.")
+            return render_template("upload.html", form=form)
+
         for file in form.files.data:
             file = file
             data = file.read()
@@ -1,39 +1,43 @@
 import os
+import re
 import typing
 
 from urllib.parse import urlencode
 
-from flask import Blueprint, request, jsonify, Flask, send_file, Response
+from flask import Blueprint, request, jsonify, Flask, send_file, Response, current_app, url_for
 from pydantic import BaseModel
-from sqlalchemy.exc import NoResultFound
+from werkzeug.wsgi import get_input_stream
 
 from app.utils.cache import cache
-from app.utils.constants import CHARACTERS
-from app.utils.helpers import require_api_key, get_character_icon, clear_cache_on_success, order_by_criteria_replays
-from app.utils.helpers import collapse_replays_into_sets
+from app.utils.helpers import require_api_key, clear_cache_on_success, order_by_criteria_replays
+from app.utils.helpers import collapse_replays_into_sets, encode_cursor, decode_cursor, character_icons
 from app.core import limiter
 from app import replay_controller as controller
 from app.schema import ReplayQuery
+from app.controllers.validation import parse_query_args
+from app.services.replay_service import COUNT_MODES
 
 app = Flask("app")
 bp = Blueprint("replays", __name__, url_prefix="/")
+MAX_MANIFEST_SIZE = 50000
+FILENAME_PATTERN = re.compile(r"[0-9a-f]{25}(\.dat)?")
 # Set a default limit of 1 request per second,
 # which can be changed granular in each route.
 limiter.limit("1/second")(bp)
 
 
-def page_out_of_bounds(page: int, max_page: int) -> tuple[Response, int]:
-    if page > max_page > 1:
+def page_out_of_bounds(page: int, max_page: typing.Optional[int]) -> tuple[Response, int]:
+    if page < 1:
         return jsonify({
             "error": "Page out of bounds",
-            "message": f"The requested page {page} exceeds the maximum page number {max_page}.",
+            "message": f"The requested page {page} is less than 1.",
             "max_page": max_page
         }), 404
 
-    if page < 0:
+    if page > max_page > 1:
         return jsonify({
             "error": "Page out of bounds",
-            "message": f"The requested page {page} is less than 0.",
+            "message": f"The requested page {page} exceeds the maximum page number {max_page}.",
             "max_page": max_page
         }), 404
 
@@ -47,7 +51,14 @@ def validate_replay_query(params: dict, model: typing.Type[BaseModel]) -> None:
 
 
 def dict_to_url_query(params: dict):
-    return urlencode(params)
+    return urlencode(params, doseq=True)
+
+
+def next_page_cursor(replays: typing.List[dict], has_more: bool) -> typing.Optional[str]:
+    """Cursor for the page after this one, None once there is nothing left."""
+    if not has_more or not replays:
+        return
+    return encode_cursor(replays[-1]["recorded_at"], replays[-1]["replay_id"])
 
 
 @bp.route("/api/replay-sets", methods=["GET"])
@@ -55,89 +66,127 @@ def dict_to_url_query(params: dict):
 async def get_replays_into_sets():
     page = request.args.get("page", 1, type=int)
     per_page = 100  # Default number of replays per page
-    params = dict(request.args)
-    params["page"] = str(page)
+    try:
+        params = parse_query_args(request.args)
+        params.pop("page", None)
+        cursor = decode_cursor(params.pop("cursor")) if "cursor" in params else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # A page is cached under its page number or its cursor on top of the filter
+    cache_key = {**params, "cursor": request.args["cursor"]} if cursor else {**params, "page": str(page)}
     replay_cache = cache
-    cached_data = replay_cache.get(params)
-    params.pop("page", None)
+    cached_data = replay_cache.get(cache_key)
     pos = request.cookies.get('pos', '')
     outcome = request.cookies.get('outcome', '')
     validate_replay_query(params, ReplayQuery)
 
-    if cached_data:
-        replays = cached_data
+    if page < 1:
+        return page_out_of_bounds(page, None)
+
+    if cached_data is not None:
+        replays, total, has_more = cached_data
     else:
-        try:
-            replays_list = [replay.to_dict() async for replay in controller.get_replays(params, page=page,
-                                                                                        per_page=per_page)]
-        except NoResultFound:
-            return jsonify({"error": f"Replay(s) with query parameters `{dict_to_url_query(params)}` not found"}), 404
+        # Pages by number need max_page, scrolling on by cursor only needs to know whether there is more
+        page_data = await controller.get_replay_page(params, per_page, page=page, cursor=cursor,
+                                                     count="has_more" if cursor else "exact",
+                                                     granularity=request.args.get("granularity"),
+                                                     tz=request.args.get("tz"))
+        if page_data is None:
+            return jsonify({"error": f"Invalid query parameters `{dict_to_url_query(params)}`"}), 400
+
+        replay_rows, total, has_more = page_data
+        replays = [replay.to_dict() for replay in replay_rows]
+        replay_cache.set(cache_key, (replays, total, has_more))
+
+    if cursor is None:
+        max_page = (total + per_page - 1) // per_page
 
-        replay_cache.set(params, replays_list)
-        replays = replay_cache.get(params)
+        check = page_out_of_bounds(page, max_page)
 
-    max_page = await controller.get_total_pages(params, per_page=per_page)
+        if check:
+            return check
 
-    check = page_out_of_bounds(page, max_page)
+        if not replays:
+            return jsonify({"error": f"Replay(s) with query parameters `{dict_to_url_query(params)}` not found"}), 404
 
-    if check:
-        return check
+    next_cursor = next_page_cursor(replays, has_more)
 
-    replays = collapse_replays_into_sets(replays)
+    replays = collapse_replays_into_sets(replays) if replays else []
     replays.sort(key=lambda r: r["recorded_at"], reverse=True)
 
     if outcome or pos:
-        search = [params[key] for key in params]
+        search = [term for value in params.values()
+                  for term in (value if isinstance(value, frozenset) else (value,))]
         order_by_criteria_replays(replays, pos=pos, outcome=outcome, search=search)
 
-    return jsonify(replays=replays, current_page=page, max_page=max_page)
+    if cursor is not None:
+        return jsonify(replays=replays, next_cursor=next_cursor)
+    return jsonify(replays=replays, current_page=page, max_page=max_page, next_cursor=next_cursor)
 
 
 @bp.route("/api/character-icons", methods=["GET"])
 @limiter.limit("20 per 10 second")
 def get_character_icons():
-    character_icons = []
-    for key, val in CHARACTERS.items():
-        icon = get_character_icon(val)
-        img_path = f"/static/img/{icon}"
-        character_icons.append(
-            {"id": key, "path": img_path, "name": val}
-        )
-    return jsonify(character_icons)
+    return jsonify(character_icons())
 
 
 @bp.route("/api/replays", methods=["GET"])
 @limiter.limit("20 per 10 second")
 async def get_replays_api():
-    query_params = request.args.to_dict()
+    try:
+        query_params = parse_query_args(request.args)
+        cursor = decode_cursor(query_params.pop("cursor")) if "cursor" in query_params else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Paging options are taken out before validation, which drops every key that isn't a replay field
+    limit = 10000
+    per_page = request.args.get("per_page", 100, type=int)
+    page = request.args.get("page", 1, type=int)
+    include = request.args.get("include", "").lower() not in ("", "0", "false")
     validate_replay_query(query_params, ReplayQuery)
     for key in query_params:
         try:
             query_params[key] = int(query_params[key])
-        except ValueError:
+        except (ValueError, TypeError):
             pass  # Keep as is if it cannot be converted to int
 
-    limit = 10000
-    per_page = query_params.pop("per_page", 100)
-    page = query_params.pop("page", 1)
-    include = query_params.pop("include", False)
     # Enforce limits
     per_page = max(1, min(per_page, limit))
-    max_page = await controller.get_total_pages(query_params, per_page=per_page)
 
-    check = page_out_of_bounds(page, max_page)
+    count = request.args.get("count", "exact")
+    if count not in COUNT_MODES:
+        return jsonify({"error": f"Invalid count `{count}`, expected one of {', '.join(COUNT_MODES)}"}), 400
 
-    if check:
-        return check
+    if page < 1:
+        return page_out_of_bounds(page, None)
 
-    try:
-        replays = [replay.to_dict(include_replay_data=bool(include))
-                   async for replay in controller.get_replays(query_params, per_page=per_page, page=page)]
+    # The page and its total come back from a single query
+    page_data = await controller.get_replay_page(query_params, per_page, page=page, include_replay_data=include,
+                                                 cursor=cursor, count=count,
+                                                 granularity=request.args.get("granularity"),
+                                                 tz=request.args.get("tz"))
+    if page_data is None:
+        return jsonify({"error": f"Invalid query parameters `{dict_to_url_query(query_params)}`"}), 400
+    replay_rows, total, has_more = page_data
+
+    response = {}
+    if total is not None:
+        max_page = (total + per_page - 1) // per_page
+
+        check = page_out_of_bounds(page, max_page)
 
-    except NoResultFound:
+        if check:
+            return check
+
+        response.update(current_page=page, max_page=max_page, total=total)
+    elif cursor is None:
+        response.update(current_page=page)
+
+    if not replay_rows and cursor is None:
         return jsonify({"error": f"Replay(s) with query parameters `{dict_to_url_query(query_params)}` not found"}), 404
 
-    return jsonify(replays=replays, current_page=page, max_page=max_page)
+    replays = [replay.to_dict(include_replay_data=include) for replay in replay_rows]
+    return jsonify(replays=replays, has_more=has_more, next_cursor=next_page_cursor(replays, has_more), **response)
 
 
 @bp.route("/api/replay/<replay_id>", methods=["GET"])
@@ -149,7 +198,7 @@ async def get_replay_api(replay_id):
     except ValueError:
         return jsonify({"error": f"Invalid parameter given for replay_id, {replay_id} is not an integer"}), 401
 
-    async for replay in controller.get_replay({"replay_id": replay_id}):
+    async for replay in controller.get_replay({"replay_id": replay_id}, include_replay_data=True):
         if replay is None:
             response = {"error": "Replay doesn't exist"}
             code = 404
@@ -162,6 +211,13 @@ async def get_replay_api(replay_id):
 @bp.route("/api/replay", methods=["POST"])
 @limiter.limit("10 per 10 second")
 async def create_replay_api():
+    if controller.spool:
+        if not controller.validate_replay(request.data):
+            return jsonify({"error": "Invalid replay data: data is too small/big or corrupted"}), 400
+
+        ticket = controller.spool_replays([request.data])
+        return jsonify(ticket=ticket, status_url=url_for("replays.get_upload_status_api", ticket=ticket)), 202
+
     replay = await controller.create_replay(request.data)
     if replay is None:
         response = {"error": "Replay already exists"}
@@ -172,6 +228,54 @@ async def create_replay_api():
     return clear_cache_on_success(response, code)
 
 
+@bp.route("/api/replay/bulk", methods=["POST"])
+@limiter.limit("2 per 10 second")
+async def create_replays_bulk_api():
+    # Read the raw body incrementally instead of buffering it, with its own size limit
+    stream = get_input_stream(request.environ, max_content_length=current_app.config["MAX_BULK_CONTENT_LENGTH"])
+    results = await controller.create_replays(stream)
+
+    totals = {"created": 0, "duplicate": 0, "corrupt": 0}
+    for result in results:
+        totals[result["status"]] += 1
+
+    code = 201 if totals["created"] else 200
+    response = jsonify(results=results, **totals)
+    return clear_cache_on_success(response, code), code
+
+
+@bp.route("/api/upload/<ticket>", methods=["GET"])
+@limiter.limit("20 per 10 second")
+async def get_upload_status_api(ticket):
+    status = controller.get_upload_status(ticket)
+    if status is None:
+        return jsonify({"error": f"Upload ticket {ticket} not found"}), 404
+    return jsonify(status)
+
+
+@bp.route("/api/replay/missing", methods=["POST"])
+@limiter.limit("5 per 10 second")
+async def get_missing_replays_api():
+    data = request.get_json(silent=True) or {}
+    filenames = data.get("filenames")
+
+    if not isinstance(filenames, list):
+        return jsonify({"error": "filenames, a list of replay hashes is a required parameter"}), 400
+
+    if len(filenames) > MAX_MANIFEST_SIZE:
+        return jsonify({"error": f"At most {MAX_MANIFEST_SIZE} filenames can be checked at once"}), 400
+
+    # Hex digests come in either case, stored filenames are lowercase
+    filenames = [filename.lower() if isinstance(filename, str) else filename for filename in filenames]
+    invalid = [filename for filename in filenames
+               if not isinstance(filename, str) or not FILENAME_PATTERN.fullmatch(filename)]
+    if invalid:
+        return jsonify({"error": f"Invalid replay hash(es): {', '.join(map(str, invalid[:10]))}"}), 400
+
+    missing = await controller.get_missing_replays(filenames)
+    return jsonify(missing=missing, checked=len(filenames))
+
+
 @bp.route("/api/replay/<replay_id>", methods=["PUT"])
 @limiter.limit("5 per 10 second")
 @require_api_key
@@ -263,7 +367,10 @@ async def download_set():
 
 @bp.route("/api/replay/character-usage", methods=["GET"])
 async def character_usage():
-    data = await controller.get_character_usage_statistics()
+    data = await controller.get_character_usage_statistics(request.args.get("from"), request.args.get("to"),
+                                                           request.args.get("days", None, type=int))
+    if data is None:
+        return jsonify({"error": "Invalid date range"}), 400
     return jsonify(data)
 
 
@@ -296,11 +403,87 @@ async def character_matchup():
 
     character_id = request.args.get("character_id", None, type=int)
 
-    data = await controller.get_character_matchup_statistics(character_id)
+    data = await controller.get_character_matchup_statistics(character_id, request.args.get("from"),
+                                                             request.args.get("to"),
+                                                             request.args.get("days", None, type=int))
+    if data is None:
+        return jsonify({"error": "Invalid date range"}), 400
+    return jsonify(data)
+
+
+@bp.route("/api/replay/character-trend", methods=["GET"])
+@limiter.limit("20 per 10 second")
+async def character_trend():
+    data = await controller.get_character_trend(request.args.get("character_id", None, type=int),
+                                                request.args.get("bucket"), request.args.get("from"),
+                                                request.args.get("to"), request.args.get("days", None, type=int),
+                                                request.args.get("side"))
+    if data is None:
+        return jsonify({"error": "Invalid character, bucket, side or date range"}), 400
+    return jsonify(data)
+
+
+@bp.route("/api/replay/matchup-trend", methods=["GET"])
+@limiter.limit("20 per 10 second")
+async def matchup_trend():
+    data = await controller.get_matchup_trend(request.args.get("character_1_id", None, type=int),
+                                              request.args.get("character_2_id", None, type=int),
+                                              request.args.get("bucket"), request.args.get("from"),
+                                              request.args.get("to"), request.args.get("days", None, type=int))
+    if data is None:
+        return jsonify({"error": "Invalid characters, bucket or date range"}), 400
+    return jsonify(data)
+
+
+@bp.route("/api/replay/stats-bundle", methods=["GET"])
+@limiter.limit("20 per 10 second")
+async def stats_bundle():
+    # The version names the database snapshot the bundle was computed from, a client holding it gets a 304
+    data = await controller.get_stats_bundle()
+    response = jsonify(data)
+    response.set_etag(data["version"])
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@bp.route("/api/replay/filter-stats", methods=["GET"])
+async def filter_stats():
+    return jsonify(controller.get_filter_stats())
+
+
+@bp.route("/api/player/<int:steamid64>", methods=["GET"])
+@limiter.limit("20 per 10 second")
+async def get_player_profile(steamid64):
+    profile = await controller.get_player_profile(steamid64)
+    if profile is None:
+        return jsonify({"error": f"Player {steamid64} not found"}), 404
+    return jsonify(profile)
+
+
+@bp.route("/api/players/suggest", methods=["GET"])
+@limiter.limit("10 per second")
+async def suggest_players():
+    # Fired on every keystroke of the search box, answered from the in-memory name index without a query
+    prefix = request.args.get("q", "")
+    limit = request.args.get("limit", 10, type=int)
+    return jsonify(await controller.suggest_players(prefix, limit))
+
+
+@bp.route("/api/replay/count-cache-stats", methods=["GET"])
+async def count_cache_stats():
+    return jsonify(controller.get_count_cache_stats())
+
+
+@bp.route("/api/replay/activity", methods=["GET"])
+@limiter.limit("20 per 10 second")
+async def get_activity():
+    data = await controller.get_activity(request.args.get("bucket"), request.args.get("from"),
+                                         request.args.get("to"), request.args.get("tz"))
+    if data is None:
+        return jsonify({"error": "Invalid bucket, date or timezone"}), 400
     return jsonify(data)
 
 
-@bp.route("api/replay-timestamps", methods=["GET"])
-async def get_all_timestamps():
-    data = await controller.get_all_replay_timestamps()
-    return jsonify([timestamp async for timestamp in data])
+@bp.route("/api/replay/activity-cache-stats", methods=["GET"])
+async def activity_cache_stats():
+    return jsonify(controller.get_activity_cache_stats())
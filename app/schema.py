@@ -35,6 +35,20 @@ class ReplayUpdate(BaseModel):
     recorder_steamid64: int = None
 
 
+# Filters that take several values as a repeated parameter, ?p1_character_id=3&p1_character_id=5 matches either
+MULTI_VALUE_FIELDS = ("p1", "p2", "recorder", "p1_character_id", "p2_character_id", "p1_steamid64", "p2_steamid64",
+                      "recorder_steamid64")
+MAX_FILTER_VALUES = 100
+
+
 class ReplayQuery(ReplayUpdate):
     recorded_at: typing.Union[datetime, tuple[typing.Union[str, datetime]], list[typing.Union[str, datetime]]] = None
+    p1: typing.Union[str, list[str]] = None
+    p1_character_id: typing.Union[int, list[int]] = None
+    p2: typing.Union[str, list[str]] = None
+    p2_character_id: typing.Union[int, list[int]] = None
+    recorder: typing.Union[str, list[str]] = None
+    p1_steamid64: typing.Union[int, list[int]] = None
+    p2_steamid64: typing.Union[int, list[int]] = None
+    recorder_steamid64: typing.Union[int, list[int]] = None
 
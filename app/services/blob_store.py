@@ -0,0 +1,190 @@
+import abc
+import fcntl
+import io
+import mmap
+import os
+import struct
+import threading
+import typing
+
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from app.config import settings
+
+
+class BlobIO(io.RawIOBase):
+    """Read-only file object over a memoryview, lets send_file stream a blob without copying it into bytes first."""
+
+    def __init__(self, view: memoryview, name: str = None):
+        super().__init__()
+        self.view = view
+        self.position = 0
+        self.name = name
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), len(self.view) - self.position)
+        buffer[:size] = self.view[self.position:self.position + size]
+        self.position += size
+        return size
+
+    def seek(self, offset: int, whence=io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: len(self.view)}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+
+class BlobStore(abc.ABC):
+    """Where replay bytes live when they are kept out of the replays table, keyed by the content hash filename."""
+
+    @abc.abstractmethod
+    def put_many(self, blobs: typing.Iterable[tuple[str, bytes]], replace=False) -> None:
+        """Store blobs under their keys, a key already stored keeps its bytes unless replace is set."""
+
+    def put(self, key: str, data: bytes) -> None:
+        self.put_many([(key, data)])
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[memoryview]:
+        """The bytes stored under key, None when there are none."""
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+
+@contextmanager
+def _locked(path: str):
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class PackfileBlobStore(BlobStore):
+    """
+    Append-only segment files plus an index log, both shared by every process using the directory.
+
+    Blobs are appended to the newest segment-NNNNNN.pack and an entry of (key, segment, offset, length) is appended to
+    index.log once the data is on disk. Every process keeps the index in memory and catches up on entries written by
+    others when it misses a key. Reads map segments with mmap and hand out memoryviews over them.
+
+    Blobs are immutable and never removed, deleting a replay leaves its bytes behind in the segment. Replacing one
+    appends the new bytes and a later index entry, which wins. Processes that already indexed the key keep reading
+    the old bytes, a replay recompressed or stored raw, until they refresh after a miss.
+    """
+    ENTRY = struct.Struct("<32sIQI")
+
+    def __init__(self, directory: str, segment_size=1024 ** 3):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.index_path = os.path.join(directory, "index.log")
+        self.lock_path = os.path.join(directory, "append.lock")
+        self.index: Dict[str, tuple[int, int, int]] = {}
+        self.index_position = 0
+        self.maps: Dict[int, mmap.mmap] = {}
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.refresh()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment:06}.pack")
+
+    def refresh(self) -> None:
+        """Read index entries appended since the last refresh, possibly by another process."""
+        with self.lock:
+            try:
+                with open(self.index_path, "rb") as index_file:
+                    index_file.seek(self.index_position)
+                    data = index_file.read()
+            except FileNotFoundError:
+                return
+
+            # A trailing partial entry is an append that never finished, it is ignored until overwritten
+            whole = len(data) - len(data) % self.ENTRY.size
+            for key, segment, offset, length in self.ENTRY.iter_unpack(data[:whole]):
+                self.index[key.rstrip(b"\x00").decode("ascii")] = (segment, offset, length)
+            self.index_position += whole
+
+    def put_many(self, blobs: typing.Iterable[tuple[str, bytes]], replace=False) -> None:
+        blobs = [(key, data) for key, data in blobs if replace or key not in self.index]
+        if not blobs:
+            return
+
+        with _locked(self.lock_path):
+            self.refresh()
+            blobs = [(key, data) for key, data in blobs if replace or key not in self.index]
+            if not blobs:
+                return
+
+            segment = max((segment for segment, _, _ in self.index.values()), default=0)
+            entries = []
+            data_file = open(self._segment_path(segment), "ab")
+            try:
+                for key, data in dict(blobs).items():
+                    offset = data_file.seek(0, os.SEEK_END)
+                    if offset and offset + len(data) > self.segment_size:
+                        data_file.flush()
+                        os.fsync(data_file.fileno())
+                        data_file.close()
+                        segment += 1
+                        data_file = open(self._segment_path(segment), "ab")
+                        offset = 0
+                    data_file.write(data)
+                    entries.append(self.ENTRY.pack(key.encode("ascii"), segment, offset, len(data)))
+                data_file.flush()
+                os.fsync(data_file.fileno())
+            finally:
+                data_file.close()
+
+            # Entries only go in once their data is durable, so an entry never points at missing bytes
+            with open(self.index_path, "ab") as index_file:
+                index_file.truncate(self.index_position)
+                index_file.write(b"".join(entries))
+                index_file.flush()
+                os.fsync(index_file.fileno())
+
+            self.refresh()
+
+    def get(self, key: str) -> Optional[memoryview]:
+        if key not in self.index:
+            self.refresh()
+        location = self.index.get(key)
+        if location is None:
+            return
+
+        segment, offset, length = location
+        segment_map = self.maps.get(segment)
+        if segment_map is None or len(segment_map) < offset + length:
+            # Segments grow after they are mapped, map again to see the new end. Old maps are left to be garbage
+            # collected since views handed out earlier may still point into them
+            with open(self._segment_path(segment), "rb") as segment_file:
+                segment_map = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[segment] = segment_map
+
+        return memoryview(segment_map)[offset:offset + length]
+
+
+BLOB_STORES = {
+    "packfile": PackfileBlobStore,
+}
+
+
+def create_blob_store() -> Optional[BlobStore]:
+    """The configured blob store, or None when blobs stay in the replays table."""
+    if settings.blob_store == "database":
+        return
+
+    if settings.blob_store not in BLOB_STORES:
+        raise ValueError(f"Unknown blob store {settings.blob_store}, expected database or one of {list(BLOB_STORES)}")
+    return BLOB_STORES[settings.blob_store](settings.blob_store_path)
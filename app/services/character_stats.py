@@ -0,0 +1,127 @@
+import typing
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from app.migrations.m0007_character_stats import AGGREGATES, REBUILD_STATEMENTS
+from app.migrations.m0008_daily_stats import DAILY_AGGREGATES, PERIOD
+from app.models.character_stats import CharacterStats, MatchupStats, CharacterDailyStats, MatchupDailyStats
+from app.services.player_stats import row_value
+
+# Every table moved at write time, with its key and counter columns and the query recomputing all of it
+TABLES = {
+    **AGGREGATES,
+    **{table: (keys, counters, query.format(period="")) for table, (keys, counters, query) in DAILY_AGGREGATES.items()},
+}
+
+
+def utc_day(recorded_at: typing.Optional[datetime]) -> typing.Optional[date]:
+    # Naive timestamps are stored as UTC, which is the database's zone for them
+    if recorded_at is None:
+        return None
+    if recorded_at.tzinfo is not None:
+        recorded_at = recorded_at.astimezone(timezone.utc)
+    return recorded_at.date()
+
+
+def character_deltas(rows: typing.Iterable, sign=1, replaced: typing.Iterable = ()) \
+        -> typing.Dict[type, typing.Dict[tuple, typing.List[int]]]:
+    """
+    How much each character and matchup counter row, all time and daily, moves when `rows` are inserted (sign 1) or
+    deleted (sign -1), taking back what the `replaced` rows counted, like the queries in migrations 0007 and 0008.
+    """
+    deltas = {CharacterStats: {}, MatchupStats: {}, CharacterDailyStats: {}, MatchupDailyStats: {}}
+    signed = [(row, sign) for row in rows] + [(row, -sign) for row in replaced]
+    for row, sign in signed:
+        p1, p2, winner = (row_value(row, name) for name in ("p1_character_id", "p2_character_id", "winner"))
+        winner = None if winner is None else int(winner)
+        day = utc_day(row_value(row, "recorded_at"))
+
+        for side, character_id, won, mirror in ((0, p1, winner == 0, False), (1, p2, winner == 1, p1 == p2)):
+            if character_id is None:
+                continue
+            delta = deltas[CharacterStats].setdefault((character_id,), [0, 0, 0])
+            delta[0] += sign * (not mirror)
+            delta[1] += sign
+            delta[2] += sign * won
+            if day is not None:
+                delta = deltas[CharacterDailyStats].setdefault((day, character_id, side), [0, 0])
+                delta[0] += sign
+                delta[1] += sign * won
+
+        if p1 is None or p2 is None:
+            continue
+        first = p1 <= p2
+        pairs = [(MatchupStats, (min(p1, p2), max(p1, p2)))]
+        if day is not None:
+            pairs.append((MatchupDailyStats, (day, min(p1, p2), max(p1, p2))))
+        for model, key in pairs:
+            delta = deltas[model].setdefault(key, [0, 0, 0])
+            delta[0] += sign
+            delta[1] += sign * (winner == (0 if first else 1))
+            delta[2] += sign * (winner == (1 if first else 0))
+    return deltas
+
+
+async def apply_character_stats(session, rows: typing.Iterable, sign=1, replaced: typing.Iterable = ()) -> None:
+    """
+    Move the stats page counters for `rows` in the caller's transaction, so they commit or roll back with the
+    replays. Rows are upserted in key order, concurrent writers queue on shared characters instead of deadlocking.
+    """
+    deltas = character_deltas(rows, sign, replaced)
+    for model in deltas:
+        keys, counters, _ = TABLES[model.__tablename__]
+        values = [dict(zip(keys + counters, key + tuple(delta)))
+                  for key, delta in sorted(deltas[model].items()) if any(delta)]
+        if not values:
+            continue
+        statement = insert(model).values(values)
+        await session.execute(statement.on_conflict_do_update(
+            index_elements=[getattr(model, key) for key in keys],
+            set_={counter: getattr(model, counter) + getattr(statement.excluded, counter) for counter in counters},
+        ))
+
+
+async def rebuild_character_stats(session) -> None:
+    """Recompute character_stats and matchup_stats from the replays, in the caller's transaction."""
+    for statement in REBUILD_STATEMENTS:
+        await session.execute(text(statement))
+
+
+async def backfill_daily_stats(session, start: datetime, end: datetime) -> None:
+    """
+    Recompute the daily rollups of the UTC days from `start` up to `end`, both midnights, in the caller's transaction.
+    The lock waits for uploads already moving these tables and holds new ones back until the commit, so none is
+    counted twice or lost between the recomputation and their own update.
+    """
+    await session.execute(text("LOCK TABLE character_daily_stats, matchup_daily_stats IN SHARE ROW EXCLUSIVE MODE"))
+    for table, (keys, counters, query) in DAILY_AGGREGATES.items():
+        await session.execute(text(f"DELETE FROM {table} WHERE day >= :start_day AND day < :end_day"),
+                              {"start_day": utc_day(start), "end_day": utc_day(end)})
+        await session.execute(text(f"INSERT INTO {table} ({', '.join(keys + counters)}) {query.format(period=PERIOD)}"),
+                              {"start": start, "end": end})
+
+
+async def diff_character_stats(session) -> typing.List[dict]:
+    """
+    Recompute the character and matchup tables from the replays and return the rows whose stored counters differ, a
+    missing row reads as zeros. Empty when the incremental updates kept up.
+    """
+    differences = []
+    for table, (keys, counters, query) in TABLES.items():
+        stored = ", ".join(f"coalesce(stored.{counter}, 0)" for counter in counters)
+        fresh = ", ".join(f"coalesce(fresh.{counter}, 0)" for counter in counters)
+        rows = await session.execute(text(
+            f"SELECT {', '.join(keys)}, ARRAY[{stored}] AS stored, ARRAY[{fresh}] AS expected "
+            f"FROM {table} AS stored FULL JOIN ({query}) AS fresh USING ({', '.join(keys)}) "
+            f"WHERE ({stored}) IS DISTINCT FROM ({fresh}) ORDER BY {', '.join(keys)}"
+        ))
+        for row in rows.mappings():
+            differences.append({
+                "table": table,
+                "key": {key: row[key] for key in keys},
+                "stored": dict(zip(counters, row["stored"])),
+                "expected": dict(zip(counters, row["expected"])),
+            })
+    return differences
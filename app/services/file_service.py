@@ -1,6 +1,20 @@
+import typing
+from typing import Optional
+
 from app import replay_controller
 
 
 async def upload_replay(data: bytes):
     return await replay_controller.create_replay(data)
 
+
+def spool_enabled() -> bool:
+    return replay_controller.spool is not None
+
+
+def spool_replays(records: typing.Sequence[bytes]) -> Optional[str]:
+    return replay_controller.spool_replays(records)
+
+
+def validate_replay(data: bytes) -> bool:
+    return replay_controller.validate_replay(data)
@@ -0,0 +1,108 @@
+import bisect
+import json
+import logging
+import os
+import time
+import typing
+
+from app.services.ingest_service import IngestPipeline
+from app.utils.constants import REPLAY_SIZE
+from app.utils.helpers import get_files
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayImporter:
+    """
+    Imports every .dat file under a directory through the ingest pipeline.
+
+    Files are processed in sorted path order and the last committed path is written to a checkpoint file, so an
+    interrupted import picks up after it instead of starting over.
+    """
+
+    def __init__(self, service, directory: str, checkpoint: str = None, workers: int = None, batch_size=2000,
+                 report_every=2.0, out: typing.Callable[[str], None] = print):
+        self.directory = os.path.abspath(directory)
+        self.checkpoint = checkpoint or os.path.join(self.directory, ".import-checkpoint")
+        self.pipeline = IngestPipeline(service, workers=workers, batch_size=batch_size)
+        self.report_every = report_every
+        self.out = out
+        self.totals = {"created": 0, "duplicate": 0, "corrupt": 0}
+
+    def load_checkpoint(self) -> typing.Optional[str]:
+        try:
+            with open(self.checkpoint) as file:
+                checkpoint = json.load(file)
+        except (OSError, ValueError):
+            return
+
+        if checkpoint.get("directory") != self.directory:
+            return
+        self.totals.update(checkpoint.get("totals", {}))
+        return checkpoint.get("last_path")
+
+    def save_checkpoint(self, last_path: str, totals: typing.Dict[str, int]) -> None:
+        # Write then rename, so a crash mid-write never leaves a truncated checkpoint behind
+        temp = f"{self.checkpoint}.tmp"
+        with open(temp, "w") as file:
+            json.dump({"directory": self.directory, "last_path": last_path, "totals": totals}, file)
+        os.replace(temp, self.checkpoint)
+
+    async def run(self) -> typing.Dict[str, int]:
+        paths = sorted(path for path, _ in get_files("*.dat", self.directory))
+        last_path = self.load_checkpoint()
+        start = bisect.bisect_right(paths, last_path) if last_path else 0
+
+        if start:
+            self.out(f"Resuming after {last_path} ({start}/{len(paths)} files already imported).")
+        else:
+            self.totals = dict.fromkeys(self.totals, 0)
+
+        # Pipeline index -> position in paths, files with the wrong size never reach the pipeline
+        positions = []
+        # Positions of the files with the wrong size. The sources run ahead of the checkpoint, a checkpoint counts
+        # only those up to its path, the files after it are counted again when a resumed run reaches them
+        corrupt, resumed_corrupt = [], self.totals["corrupt"]
+        started = reported = time.monotonic()
+        processed = 0
+
+        def sources():
+            for position in range(start, len(paths)):
+                try:
+                    valid = os.path.getsize(paths[position]) == REPLAY_SIZE
+                except OSError:
+                    valid = False
+
+                if valid:
+                    positions.append(position)
+                    yield paths[position]
+                else:
+                    corrupt.append(position)
+                    self.totals["corrupt"] += 1
+
+        async for result in self.pipeline.run(sources()):
+            self.totals[result["status"]] += 1
+            processed += 1
+
+            now = time.monotonic()
+            if now - reported >= self.report_every:
+                # Every result handed out belongs to a committed batch, so everything up to it is safe to skip
+                position = positions[result["index"]]
+                self.save_checkpoint(paths[position], {
+                    **self.totals, "corrupt": resumed_corrupt + bisect.bisect_right(corrupt, position)})
+                self.report(position + 1 - start, len(paths) - start, processed, now - started)
+                reported = now
+
+        self.report(len(paths) - start, len(paths) - start, processed, time.monotonic() - started)
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+        logger.info(f"Imported replays from {self.directory}: {self.totals}")
+        return self.totals
+
+    def report(self, done: int, total: int, processed: int, elapsed: float) -> None:
+        elapsed = max(elapsed, 1e-9)
+        self.out(f"{done}/{total} files, {processed / elapsed:.0f} replays/s, "
+                 f"{processed * REPLAY_SIZE / elapsed / 1024 / 1024:.1f} MB/s "
+                 f"(created {self.totals['created']}, duplicate {self.totals['duplicate']}, "
+                 f"corrupt {self.totals['corrupt']})")
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import typing
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Union
+
+from pydantic import ValidationError
+
+from app.config import settings
+from app.schema import ReplayCreate
+from app.utils import replay_codec, replay_parser
+from app.utils.constants import CHARACTERS, REPLAY_SIZE
+
+logger = logging.getLogger(__name__)
+
+# A source is either the raw replay bytes or a path for the worker to read them from
+Source = Union[bytes, str]
+
+_executors: Dict[int, ProcessPoolExecutor] = {}
+
+
+def get_executor(workers: int) -> ProcessPoolExecutor:
+    """Process pools are expensive to start, so keep one per worker count for the life of the process."""
+    if workers not in _executors:
+        _executors[workers] = ProcessPoolExecutor(max_workers=workers)
+    return _executors[workers]
+
+
+def parse_record(data: bytes) -> Optional[ReplayCreate]:
+    """Parse, hash and validate one replay, returns None if the record is corrupt."""
+    if len(data) != REPLAY_SIZE:
+        return
+
+    try:
+        replay_create = ReplayCreate(**replay_parser.parse_replay(data))
+    except (ValueError, ValidationError):
+        return
+
+    # Out of range ids would violate the check constraints and fail the whole batch
+    if replay_create.p1_character_id not in CHARACTERS or replay_create.p2_character_id not in CHARACTERS:
+        return
+
+    # Compressed here rather than in the writer, so the work is spread over the worker processes
+    replay_create.replay = replay_codec.encode(replay_create.replay, settings.replay_compression_level)
+    return replay_create
+
+
+def is_valid_record(data: bytes) -> bool:
+    """Cheap structural check of one replay that skips the hash, for acknowledging uploads before parsing them."""
+    if len(data) != REPLAY_SIZE:
+        return False
+
+    try:
+        header = replay_parser.parse_header(data)
+    except ValueError:
+        return False
+
+    return header["p1_character_id"] in CHARACTERS and header["p2_character_id"] in CHARACTERS and \
+        header["winner"] in (0, 1)
+
+
+def parse_sources(sources: typing.List[Source]) -> typing.List[Optional[ReplayCreate]]:
+    """Runs in a worker process, reads (when given paths) and parses a chunk of replays."""
+    replays = []
+    for source in sources:
+        if isinstance(source, str):
+            try:
+                with open(source, "rb") as file:
+                    source = file.read(REPLAY_SIZE + 1)
+            except OSError:
+                replays.append(None)
+                continue
+        replays.append(parse_record(source))
+    return replays
+
+
+class IngestPipeline:
+    """
+    Fans parse/hash/decode work out across a process pool and feeds the decoded replays to a single writer that
+    inserts them in batches.
+
+    Memory stays bounded however many sources there are: at most `max_pending` chunks are being parsed at once and
+    at most `max_batches` parsed batches wait for the writer, reading more sources stalls until they drain.
+    """
+
+    def __init__(self, service, workers: int = None, chunk_size=64, batch_size=500, max_pending: int = None,
+                 max_batches=2):
+        self.service = service
+        self.workers = workers or settings.ingest_workers
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.max_pending = max_pending or self.workers * 2
+        self.max_batches = max_batches
+
+    async def run(self, sources: typing.Iterable[Source]) -> typing.AsyncGenerator[Dict[str, Any], None]:
+        """
+        Ingest every source and yield a result per source with its index and a status of created, duplicate or
+        corrupt. Results come out in source order, and every result yielded belongs to a committed batch.
+        """
+        batches = asyncio.Queue(maxsize=self.max_batches)
+        results = asyncio.Queue()
+        producer = asyncio.create_task(self._produce(sources, batches))
+        writer = asyncio.create_task(self._write(batches, results))
+
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                if isinstance(result, BaseException):
+                    raise result
+                yield result
+
+            await producer
+        finally:
+            for task in (producer, writer):
+                task.cancel()
+            await asyncio.gather(producer, writer, return_exceptions=True)
+
+    async def _produce(self, sources: typing.Iterable[Source], batches: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        executor = get_executor(self.workers)
+        pending = []
+        batch = []
+        chunk = []
+        index = 0
+
+        async def collect():
+            nonlocal batch
+            start, future = pending.pop(0)
+            for offset, replay_create in enumerate(await future):
+                batch.append((start + offset, replay_create))
+            if len(batch) >= self.batch_size:
+                await batches.put(batch)
+                batch = []
+
+        try:
+            for source in sources:
+                chunk.append(source)
+                if len(chunk) < self.chunk_size:
+                    continue
+
+                pending.append((index, loop.run_in_executor(executor, parse_sources, chunk)))
+                index += len(chunk)
+                chunk = []
+                # Backpressure, stop reading sources until the oldest chunk is parsed
+                if len(pending) >= self.max_pending:
+                    await collect()
+
+            if chunk:
+                pending.append((index, loop.run_in_executor(executor, parse_sources, chunk)))
+
+            while pending:
+                await collect()
+
+            if batch:
+                await batches.put(batch)
+        finally:
+            await batches.put(None)
+
+    async def _write(self, batches: asyncio.Queue, results: asyncio.Queue) -> None:
+        try:
+            while True:
+                batch = await batches.get()
+                if batch is None:
+                    break
+                for result in await self._insert_batch(batch):
+                    results.put_nowait(result)
+        except Exception as e:
+            logger.exception("Ingest writer failed")
+            results.put_nowait(e)
+        finally:
+            results.put_nowait(None)
+
+    async def _insert_batch(self, batch: typing.List[tuple[int, Optional[ReplayCreate]]]) \
+            -> typing.List[Dict[str, Any]]:
+        rows = await self.service.create_replays([replay_create for _, replay_create in batch if replay_create])
+        created = {row.filename: row.replay_id for row in rows}
+        results = []
+
+        for index, replay_create in batch:
+            if replay_create is None:
+                results.append({"index": index, "status": "corrupt"})
+                continue
+
+            # Popping makes a repeated filename within the same batch count as a duplicate
+            replay_id = created.pop(replay_create.filename, None)
+            if replay_id is None:
+                results.append({"index": index, "status": "duplicate", "filename": replay_create.filename})
+            else:
+                results.append({"index": index, "status": "created", "filename": replay_create.filename,
+                                "replay_id": replay_id})
+
+        return results
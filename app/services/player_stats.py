@@ -0,0 +1,78 @@
+import itertools
+import typing
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from app.migrations.m0006_player_stats import REBUILD_STATEMENTS
+from app.models.player_stats import PlayerCharacterStats, PlayerOpponentStats, PlayerMatchupStats
+from app.utils.helpers import chunks
+
+# The counter tables and the column each keys its player's rows by after steamid64
+STATS_KEYS = (
+    (PlayerCharacterStats, "character_id"),
+    (PlayerOpponentStats, "opponent_steamid64"),
+    (PlayerMatchupStats, "opponent_character_id"),
+)
+
+
+def row_value(row, name: str):
+    return row.get(name) if isinstance(row, dict) else getattr(row, name, None)
+
+
+def player_sides(row) -> typing.Generator[dict, None, None]:
+    """Both sides of a replay from the point of view of the player on that side, like SIDES in migration 0006."""
+    winner = row_value(row, "winner")
+    for side, other, winning in (("p1", "p2", 0), ("p2", "p1", 1)):
+        yield {
+            "steamid64": row_value(row, f"{side}_steamid64"),
+            "character_id": row_value(row, f"{side}_character_id"),
+            "opponent_steamid64": row_value(row, f"{other}_steamid64"),
+            "opponent_character_id": row_value(row, f"{other}_character_id"),
+            "won": winner is not None and int(winner) == winning,
+        }
+
+
+def stat_deltas(rows: typing.Iterable, sign=1, replaced: typing.Iterable = ()) \
+        -> typing.Dict[type, typing.Dict[tuple, typing.List[int]]]:
+    """
+    How much each counter row moves when `rows` are inserted (sign 1) or deleted (sign -1), taking back what the
+    `replaced` rows counted.
+    """
+    deltas = {model: {} for model, _ in STATS_KEYS}
+    for row, row_sign in itertools.chain(((row, sign) for row in rows), ((row, -sign) for row in replaced)):
+        for side in player_sides(row):
+            if side["steamid64"] is None:
+                continue
+            for model, column in STATS_KEYS:
+                if side[column] is None:
+                    continue
+                delta = deltas[model].setdefault((side["steamid64"], side[column]), [0, 0])
+                delta[0] += row_sign
+                delta[1] += row_sign * side["won"]
+    return deltas
+
+
+async def apply_stats(session, rows: typing.Iterable, sign=1, chunk_size=5000,
+                      replaced: typing.Iterable = ()) -> None:
+    """
+    Move the counters of the players in `rows`, in the caller's transaction so they commit with the replays. One
+    multi-row upsert per table, in key order so concurrent writers lock shared rows in the same order.
+    """
+    deltas = stat_deltas(rows, sign, replaced)
+    for model, column in STATS_KEYS:
+        values = [{"steamid64": steamid64, column: key, "matches": matches, "wins": wins}
+                  for (steamid64, key), (matches, wins) in sorted(deltas[model].items()) if matches or wins]
+        for chunk in chunks(values, chunk_size):
+            statement = insert(model).values(chunk)
+            await session.execute(statement.on_conflict_do_update(
+                index_elements=[model.steamid64, getattr(model, column)],
+                set_={"matches": model.matches + statement.excluded.matches,
+                      "wins": model.wins + statement.excluded.wins},
+            ))
+
+
+async def rebuild_stats(session) -> None:
+    """Recompute every counter from the replays, in the caller's transaction."""
+    for statement in REBUILD_STATEMENTS:
+        await session.execute(text(statement))
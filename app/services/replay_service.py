@@ -1,22 +1,53 @@
+import asyncio
+import contextlib
+import hashlib
 import logging
+import threading
+import time
 import typing
 
 from io import BytesIO
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
+
+from dateutil.relativedelta import relativedelta
 
 import sqlalchemy
-from sqlalchemy import func, extract, or_, and_, desc, case, cast
+from sqlalchemy import func, or_, and_, union_all, desc, case, cast, any_, bindparam, tuple_, text, update
+from sqlalchemy.dialects.postgresql import insert, ARRAY, BIGINT
 from sqlalchemy.future import select
+from sqlalchemy.orm import defer
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.exc import NoResultFound
 
 from app import db_manager
+from app.config import settings
+from app.migrations.m0007_character_stats import AGGREGATES
+from app.migrations.m0008_daily_stats import DAILY_AGGREGATES
+from app.models.character_stats import CharacterStats, MatchupStats, CharacterDailyStats, MatchupDailyStats
+from app.models.player import Player, PlayerName
+from app.models.player_stats import PlayerCharacterStats, PlayerOpponentStats, PlayerMatchupStats
 from app.models.replay import Replay
 from app.schema import ReplayCreate, ReplayUpdate
-from app.utils.helpers import friendly_file
+from app.services.blob_store import BlobStore, BlobIO
+from app.services.character_stats import apply_character_stats, rebuild_character_stats, diff_character_stats, \
+    backfill_daily_stats, utc_day
+from app.services.player_stats import apply_stats, rebuild_stats
+from app.services.stats_engine import StatsEngine
+from app.utils import replay_codec
+from app.utils.bloom import BloomFilter
+from app.utils.count_cache import CountCache
+from app.utils.date_range import DateRange, date_range
+from app.utils.name_index import NameIndex
+from app.utils.helpers import friendly_file, chunks
 
 logger = logging.getLogger(__name__)
 
 
+@contextlib.asynccontextmanager
+async def _borrowed(session):
+    yield session
+
+
 class _ContextDBAcquire:
     __slots__ = ("ctx", "session")
 
@@ -40,13 +71,214 @@ class _ContextDBAcquire:
         await self.session.close()
 
 
+# Name columns and the steamid64 columns name searches go through instead
+NAME_STEAMID_COLUMNS = {
+    "p1": ("p1_steamid64", "p2_steamid64"),
+    "p2": ("p1_steamid64", "p2_steamid64"),
+    "recorder": ("recorder_steamid64",),
+}
+
+# Name filters matching more players than this are left to a subquery rather than bound as a list of steam ids
+MAX_RESOLVED_PLAYERS = 1000
+
+
+class PlayerIds:
+    """The steam ids a name filter was resolved to in the name history."""
+    __slots__ = ("steamid64s",)
+
+    def __init__(self, steamid64s: typing.FrozenSet[int]):
+        self.steamid64s = steamid64s
+
+
+# How much a page request counts: the exact total, only whether there is another page, or nothing
+COUNT_MODES = ("exact", "has_more", "none")
+
+# Sizes of an activity histogram's buckets, as date_trunc names them
+ACTIVITY_BUCKETS = ("hour", "day", "week")
+
+# Sizes of a trend series' buckets, summed from the daily rollups
+TREND_BUCKETS = ("day", "week", "month")
+
+
 class ReplayService:
-    def __init__(self, session_factory: db_manager):
+    def __init__(self, session_factory: db_manager, blob_store: BlobStore = None):
         self.db_manager = session_factory
-
-    def acquire(self):
+        # Replay bytes go to the blob store when one is configured, otherwise they stay in the replays table
+        self.blob_store = blob_store
+        self.filename_filter: typing.Optional[BloomFilter] = None
+        # Guards the filename filter and the loads below, request threads and the spool writer both write to them
+        self.memory_lock = threading.Lock()
+        # Writes made while a load scans the replays, applied to what it built before that replaces the old one
+        self.filename_loads: typing.List[typing.List[str]] = []
+        self.player_loads: typing.List[typing.List[tuple]] = []
+        self.filter_stats = {"definitely_new": 0, "probably_exists": 0, "false_positives": 0}
+        self.upkeep_thread: typing.Optional[threading.Thread] = None
+        # Totals per filter, shared by every page of it and dropped only by writes that could change them
+        self.count_cache = CountCache(ttl=settings.count_cache_ttl)
+        self.name_index: typing.Optional[NameIndex] = None
+        # Activity histograms per bucket, zone and period, dropped by writes recorded inside their period
+        self.activity_cache = CountCache(ttl=settings.count_cache_ttl)
+        # The last stats bundle, good for as long as no write commits
+        self.stats_bundle: typing.Optional[typing.Dict[str, typing.Any]] = None
+        # Computes the stats page in process instead of in SQL when configured
+        self.stats_engine: typing.Optional[StatsEngine] = None
+        if settings.stats_engine == "numpy":
+            self.stats_engine = StatsEngine(refresh_interval=settings.stats_engine_refresh,
+                                            reload_interval=settings.stats_engine_reload)
+        elif settings.stats_engine != "sql":
+            raise ValueError(f"Unknown stats engine {settings.stats_engine}, expected sql or numpy")
+
+    def acquire(self, session=None):
+        # A session handed in by the caller is used as is and left for the caller to close
+        if session is not None:
+            return _borrowed(session)
         return _ContextDBAcquire(self.db_manager)
 
+    def independent_session(self):
+        """A session of its own rather than the thread's scoped one, for queries running side by side."""
+        return self.db_manager.session_factory.session_factory()
+
+    async def load_filename_filter(self) -> BloomFilter:
+        bloom = BloomFilter(settings.filename_filter_capacity, settings.filename_filter_error_rate)
+        written = []
+        with self.memory_lock:
+            self.filename_loads.append(written)
+
+        try:
+            async with self.acquire() as session:
+                query = select(Replay.filename).execution_options(yield_per=10000)
+                async for filename in await session.stream_scalars(query):
+                    bloom.add(filename)
+        finally:
+            with self.memory_lock:
+                self.filename_loads.remove(written)
+                # Inserts that committed after the scan passed them would otherwise read as definitely new
+                for filename in written:
+                    bloom.add(filename)
+                self.filename_filter = bloom
+        logger.info(f"Loaded filename filter: {bloom.stats()}")
+        return bloom
+
+    def start_upkeep(self) -> None:
+        """Warm the name index, then build the filename filter and rebuild it every filename_filter_ttl."""
+        if self.upkeep_thread is None or not self.upkeep_thread.is_alive():
+            self.upkeep_thread = threading.Thread(target=self._run_upkeep, name="replay-memory-upkeep", daemon=True)
+            self.upkeep_thread.start()
+
+    def _run_upkeep(self) -> None:
+        loop = asyncio.new_event_loop()
+        while self.name_index is None:
+            try:
+                loop.run_until_complete(self.load_name_index())
+            except Exception:
+                logger.exception("Loading the name index failed, retrying")
+                time.sleep(10)
+
+        while settings.filename_filter_capacity:
+            try:
+                loop.run_until_complete(self.load_filename_filter())
+            except Exception:
+                logger.exception("Loading the filename filter failed, retrying")
+            time.sleep(settings.filename_filter_ttl)
+
+    async def load_name_index(self) -> NameIndex:
+        sides = union_all(
+            select(Replay.p1.label("name"), Replay.p1_steamid64.label("steamid64")),
+            select(Replay.p2.label("name"), Replay.p2_steamid64.label("steamid64")),
+        ).subquery()
+        query = select(sides.c.name, sides.c.steamid64, func.count()).group_by(sides.c.name, sides.c.steamid64)
+
+        written = []
+        with self.memory_lock:
+            self.player_loads.append(written)
+
+        try:
+            async with self.acquire() as session:
+                result = await session.stream(query.execution_options(yield_per=10000))
+                index = NameIndex.from_counts([tuple(row) async for row in result])
+        finally:
+            with self.memory_lock:
+                self.player_loads.remove(written)
+        with self.memory_lock:
+            # A write the scan saw as well counts twice, which only nudges its rank
+            for name, steamid64, count in written:
+                self.apply_player_count(index, name, steamid64, count)
+            self.name_index = index
+        logger.info(f"Loaded name index of {len(index)} player name(s)")
+        return index
+
+    async def suggest_players(self, prefix: str, limit=10) -> typing.List[dict]:
+        """Player names starting with `prefix`, answered from memory, none until the index has been warmed."""
+        index = self.name_index
+        return index.suggest(prefix, limit) if index is not None else []
+
+    def index_players(self, rows: typing.Iterable, count=1) -> None:
+        """Keep the name index in step with written rows, a negative count takes rows that went away back out."""
+        players = [(self._row_value(row, side), self._row_value(row, f"{side}_steamid64"), count)
+                   for row in rows for side in ("p1", "p2")]
+        with self.memory_lock:
+            for written in self.player_loads:
+                written.extend(players)
+            if self.name_index is not None:
+                for name, steamid64, count in players:
+                    self.apply_player_count(self.name_index, name, steamid64, count)
+
+    @staticmethod
+    def apply_player_count(index: NameIndex, name: str, steamid64: typing.Optional[int], count: int) -> None:
+        if count > 0:
+            index.add(name, steamid64, count)
+        else:
+            index.remove(name, steamid64, -count)
+
+    def remember_filenames(self, filenames: typing.Iterable[str]) -> None:
+        """Add stored filenames to the filter, and to any filter being loaded."""
+        filenames = list(filenames)
+        with self.memory_lock:
+            for written in self.filename_loads:
+                written.extend(filenames)
+            if self.filename_filter is not None:
+                for filename in filenames:
+                    self.filename_filter.add(filename)
+
+    async def existing_filenames(self, filenames: typing.Collection[str], chunk_size=10000,
+                                 use_filter=True) -> typing.Set[str]:
+        """Return which filenames are already stored."""
+        bloom = self.filename_filter
+        use_filter = use_filter and settings.filename_filter_capacity and bloom is not None
+        if use_filter:
+            candidates = [filename for filename in filenames if filename in bloom]
+            self.filter_stats["definitely_new"] += len(filenames) - len(candidates)
+            self.filter_stats["probably_exists"] += len(candidates)
+        else:
+            candidates = list(filenames)
+
+        existing = set()
+        async with self.acquire() as session:
+            for candidate_chunk in chunks(candidates, chunk_size):
+                # One bound array per chunk, answered from the unique index on filename
+                filename_array = bindparam("filenames", candidate_chunk, type_=ARRAY(sqlalchemy.String))
+                result = await session.scalars(select(Replay.filename).where(Replay.filename == any_(filename_array)))
+                existing.update(result.all())
+
+        if use_filter:
+            self.filter_stats["false_positives"] += len(candidates) - len(existing)
+        return existing
+
+    async def missing_filenames(self, filenames: typing.Collection[str]) -> typing.List[str]:
+        """Return the filenames not stored yet, in the order given."""
+        # Not the filter, it misses what other workers stored since it was built
+        existing = await self.existing_filenames(filenames, use_filter=False)
+        logger.info(f"Diffed manifest of {len(filenames)} filename(s), {len(existing)} already stored")
+        return [filename for filename in filenames if filename not in existing]
+
+    def get_filter_stats(self) -> dict:
+        stats = dict(self.filter_stats)
+        probable = stats["probably_exists"]
+        stats["observed_error_rate"] = round(stats["false_positives"] / probable, 6) if probable else 0.0
+        if self.filename_filter is not None:
+            stats.update(self.filename_filter.stats())
+        return stats
+
     async def get_replay(self, replay_id: int) -> Replay:
 
         async with self.acquire() as session:
@@ -58,12 +290,58 @@ class ReplayService:
             logger.info(f"Returned replay with ID: {replay_id}")
             return replay
 
+    async def resolve_player_names(self, session, query_params: typing.Dict[str, typing.Any]) \
+            -> typing.Dict[str, typing.Any]:
+        """Replace name filters with the steam ids they match in the name history, when few enough."""
+        resolved = dict(query_params)
+        for key, value in query_params.items():
+            if key not in NAME_STEAMID_COLUMNS or not isinstance(value, (str, frozenset)):
+                continue
+            names = value if isinstance(value, frozenset) else (value,)
+            patterns = bindparam("patterns", sorted(f"%{name.strip().lower()}%" for name in names),
+                                 type_=ARRAY(sqlalchemy.String))
+            query = (select(PlayerName.steamid64).distinct()
+                     .where(func.lower(PlayerName.name).like(any_(patterns)))
+                     .limit(MAX_RESOLVED_PLAYERS + 1))
+            steamid64s = (await session.scalars(query)).all()
+            if len(steamid64s) <= MAX_RESOLVED_PLAYERS:
+                resolved[key] = PlayerIds(frozenset(steamid64s))
+        return resolved
+
+    @staticmethod
+    def played_under(model, key, name_condition) -> typing.List:
+        """Conditions matching every account that ever played under a name meeting `name_condition`."""
+        steamids = func.array(select(PlayerName.steamid64).where(name_condition).scalar_subquery(),
+                              type_=ARRAY(BIGINT))
+        return [getattr(model, column) == any_(steamids) for column in NAME_STEAMID_COLUMNS[key]]
+
     def build_conditions(self, model, key, value, use_or=True):
         conditions = []
 
-        if isinstance(value, str):
+        if isinstance(value, PlayerIds):
+            array = bindparam(f"{key}_steamid64s", sorted(value.steamid64s), type_=ARRAY(BIGINT))
+            conditions.extend(getattr(model, column) == any_(array) for column in NAME_STEAMID_COLUMNS[key])
+
+        elif isinstance(value, frozenset):
+            # Any of several values. They go in one bound array, so the statement is the same however many there are
+            # and its compiled form and prepared statement are reused
+            names = (key.replace("2", "1"), key.replace("2", "1").replace("1", "2")) if key.startswith("p") else (key,)
+            if all(isinstance(element, str) for element in value):
+                patterns = sorted(f"%{element.strip().lower()}%" for element in value)
+                array = bindparam(f"{key}_values", patterns, type_=ARRAY(sqlalchemy.String))
+                if key in NAME_STEAMID_COLUMNS:
+                    conditions.extend(self.played_under(model, key, func.lower(PlayerName.name).like(any_(array))))
+                else:
+                    conditions.extend(func.lower(getattr(model, name)).like(any_(array)) for name in names)
+            else:
+                array = bindparam(f"{key}_values", sorted(value), type_=ARRAY(getattr(model, names[0]).type))
+                conditions.extend(getattr(model, name) == any_(array) for name in names)
+
+        elif isinstance(value, str):
             value = value.strip().lower()
-            if key.startswith("p"):
+            if key in NAME_STEAMID_COLUMNS:
+                conditions.extend(self.played_under(model, key, func.lower(PlayerName.name).like(f"%{value}%")))
+            elif key.startswith("p"):
                 p1 = key.replace("2", "1")
                 p2 = p1.replace("1", "2")
                 conditions.append(func.lower(getattr(model, p1)).like(f"%{value}%"))
@@ -71,12 +349,12 @@ class ReplayService:
             else:
                 conditions.append(func.lower(getattr(model, key)).like(f"%{value}%"))
 
-        elif isinstance(value, datetime):
-            day_condition = extract("day", getattr(model, key)) == value.day
-            month_condition = extract("month", getattr(model, key)) == value.month
-            hour_condition = extract("hour", getattr(model, key)) == value.hour
-            minute_condition = extract("minute", getattr(model, key)) == value.minute
-            conditions.extend([day_condition, month_condition, hour_condition, minute_condition])
+        elif isinstance(value, (datetime, DateRange)):
+            # A plain range on the column, so the recorded_at indexes serve it. A bare datetime covers its minute
+            if isinstance(value, datetime):
+                value = date_range(value, "minute")
+            column = getattr(model, key)
+            return and_(column >= value.start, column < value.end)
 
         elif isinstance(value, tuple) or isinstance(value, list) and len(value) == 2:
             start, end = value
@@ -96,6 +374,76 @@ class ReplayService:
         else:
             return and_(*conditions)
 
+    @staticmethod
+    def _row_value(row, name: str):
+        return row.get(name) if isinstance(row, dict) else getattr(row, name, None)
+
+    @staticmethod
+    def row_matches(query_params: typing.Dict[str, typing.Any], row) -> bool:
+        """Whether a row satisfies a filter, anything it can't compare counts as a match."""
+        def column(name):
+            return ReplayService._row_value(row, name)
+
+        for key, value in query_params.items():
+            if key.startswith("p"):
+                p1 = key.replace("2", "1")
+                keys = (p1, p1.replace("1", "2"))
+            else:
+                keys = (key,)
+
+            try:
+                if isinstance(value, frozenset):
+                    matched = any(ReplayService.row_matches({key: element}, row) for element in value)
+                elif isinstance(value, str) and key in NAME_STEAMID_COLUMNS:
+                    # Matched through the players' past names too, which the row alone can't tell
+                    matched = True
+                elif isinstance(value, str):
+                    value = value.strip().lower()
+                    matched = any(value in str(column(name) or "").lower() for name in keys)
+                elif isinstance(value, (datetime, DateRange)):
+                    if isinstance(value, datetime):
+                        value = date_range(value, "minute")
+                    matched = column(key) is not None and value.contains(column(key))
+                elif isinstance(value, tuple) or isinstance(value, list) and len(value) == 2:
+                    start, end = value
+                    matched = column(key) is not None and start <= column(key) <= end
+                else:
+                    matched = any(column(name) == value for name in keys)
+            except TypeError:
+                matched = True
+
+            if not matched:
+                return False
+        return True
+
+    @staticmethod
+    def in_period(params: typing.Dict[str, typing.Any], row) -> bool:
+        """Whether a written row lands in the period of a cached activity histogram."""
+        recorded_at = ReplayService._row_value(row, "recorded_at")
+        if recorded_at is None:
+            return False
+        try:
+            return ((params["from"] is None or recorded_at >= params["from"]) and
+                    (params["to"] is None or recorded_at < params["to"]))
+        except TypeError:
+            # A naive timestamp can't be placed, drop the entry rather than guess
+            return True
+
+    def invalidate_counts(self, rows: typing.Iterable) -> None:
+        rows = list(rows)
+        dropped = self.count_cache.invalidate(rows, self.row_matches)
+        dropped += self.activity_cache.invalidate(rows, self.in_period)
+        if dropped:
+            logger.info(f"Invalidated {dropped} cached count(s)")
+
+    def mark_stats(self, replay_ids: typing.Iterable[int]) -> None:
+        # The stats engine re-fetches written replays on its next read, deleted ones drop out
+        if self.stats_engine is not None:
+            self.stats_engine.mark(replay_ids)
+
+    def get_count_cache_stats(self) -> dict:
+        return self.count_cache.stats()
+
     def build_query(self, model, query_params, use_or=True):
         query = select(model)
         for key, value in query_params.items():
@@ -104,9 +452,17 @@ class ReplayService:
         return query
 
     async def get_total_replays_query_count(self, query_params: dict = None) -> int:
+        key = self.count_cache.key(query_params)
+        total_replays = self.count_cache.get(key)
+        if total_replays is not None:
+            self.count_cache.record_hit(key, 0.0)
+            return total_replays
+
+        generation = self.count_cache.generation
+        start = time.perf_counter()
         async with self.acquire() as session:
             if query_params:
-                query = self.build_query(Replay, query_params)
+                query = self.build_query(Replay, await self.resolve_player_names(session, query_params))
                 count_query = query.with_only_columns(func.count())  # Count query
                 result = await session.execute(count_query)
                 total_replays = result.scalar()
@@ -114,7 +470,8 @@ class ReplayService:
                 result = await session.execute(select(func.count(Replay.replay_id)))
                 total_replays = result.scalar()  # Get the total count of replays
 
-            return total_replays
+        self.count_cache.set(key, query_params, total_replays, time.perf_counter() - start, generation)
+        return total_replays
 
     async def get_total_pages(self, query_params: dict = None, per_page=10) -> int:
         """Calculate the total number of pages."""
@@ -123,23 +480,47 @@ class ReplayService:
         return total_pages
 
     @staticmethod
-    async def _stream_replays(query, session) -> typing.AsyncGenerator[Replay, None]:
-        # Peek at the first result to check if there are any results
-        query = query.order_by(desc(Replay.recorded_at))
-        first_replay = await (await session.stream_scalars(query)).first()
-        if not first_replay:
-            raise NoResultFound("Replay(s) not found")
-
-        async for replay in await session.stream_scalars(query):
-            yield replay
+    async def _stream_replays(query, session, yield_per: int = None) -> typing.AsyncGenerator[Replay, None]:
+        """Stream the query's rows off a server side cursor, raises NoResultFound when there are none."""
+        query = query.order_by(desc(Replay.recorded_at), desc(Replay.replay_id))
+        query = query.execution_options(yield_per=yield_per or settings.stream_yield_per)
+        result = await session.stream_scalars(query)
+
+        try:
+            rows = aiter(result)
+            try:
+                first_replay = await anext(rows)
+            except StopAsyncIteration:
+                raise NoResultFound("Replay(s) not found")
+
+            yield first_replay
+            async for replay in rows:
+                yield replay
+        finally:
+            # Closes the cursor when the caller stops early
+            await result.close()
 
-    async def get_total_replays(self):
+    async def stats_columns(self) -> typing.Dict[str, typing.Any]:
+        if not self.stats_engine.due():
+            return self.stats_engine.columns
         async with self.acquire() as session:
+            return await self.stats_engine.refresh(session)
+
+    def uses_stats_engine(self, session) -> bool:
+        # A session handed in asks for the database's view, e.g. one snapshot for a whole bundle
+        return session is None and self.stats_engine is not None
+
+    async def get_total_replays(self, session=None):
+        if self.uses_stats_engine(session):
+            return self.stats_engine.total_replays(await self.stats_columns())
+        async with self.acquire(session) as session:
             logger.info(f"Returned total count of replays.")
             return (await session.execute(select(func.count(Replay.replay_id)))).scalar()
 
-    async def get_total_unique_players(self):
-        async with self.acquire() as session:
+    async def get_total_unique_players(self, session=None):
+        if self.uses_stats_engine(session):
+            return self.stats_engine.total_players(await self.stats_columns())
+        async with self.acquire(session) as session:
             result = await session.execute(select(
                 func.count(func.distinct(Replay.recorder_steamid64)))
             )
@@ -147,206 +528,584 @@ class ReplayService:
             logger.info(f"Returned total count of unique players.")
             return total_players
 
-    async def get_total_replays_per_character(self):
-        async with self.acquire() as session:
+    @staticmethod
+    def percentage(part, whole):
+        # Numeric division, the counters are integers
+        return func.round(cast(part, sqlalchemy.Numeric) * 100 / func.nullif(whole, 0), 2)
+
+    async def get_total_replays_per_character(self, session=None):
+        if self.uses_stats_engine(session):
+            return self.stats_engine.total_replays_per_character(await self.stats_columns())
+        async with self.acquire(session) as session:
+            # Ties by id, the order the stats engine gives too
             query = select(
-                func.count(Replay.p1_character_id == Replay.p2_character_id).label("total"),
-                Replay.p1_character_id.label("character_id")
-            ).group_by(
-                Replay.p1_character_id
-            ).order_by(func.count().desc())
+                CharacterStats.replays.label("total"),
+                CharacterStats.character_id
+            ).where(CharacterStats.replays > 0).order_by(CharacterStats.replays.desc(), CharacterStats.character_id)
 
             results = (await session.execute(query)).fetchall()
 
             logger.info(f"Returned total replays per character.")
             return results
 
-    async def get_matchup_statistics(self, character_id: int = None):
-        async with self.acquire() as session:
+    @staticmethod
+    def in_days(day_column, start: date = None, end: date = None) -> list:
+        # `end` is the first day left out
+        conditions = []
+        if start is not None:
+            conditions.append(day_column >= start)
+        if end is not None:
+            conditions.append(day_column < end)
+        return conditions
+
+    async def get_matchup_statistics(self, character_id: int = None, session=None, start: date = None,
+                                     end: date = None):
+        """All time matchup stats, or summed from the daily rollups over the UTC days from `start` up to `end`."""
+        if self.uses_stats_engine(session):
+            return self.stats_engine.matchup_statistics(await self.stats_columns(), character_id, start, end)
+        async with self.acquire(session) as session:
+            if start is not None or end is not None:
+                matches = func.sum(MatchupDailyStats.matches)
+                matchup_query = (
+                    select(
+                        MatchupDailyStats.character_1_id,
+                        MatchupDailyStats.character_2_id,
+                        matches.label("matches_played"),
+                        self.percentage(func.sum(MatchupDailyStats.character_1_wins), matches).label("p1_win_rate"),
+                        self.percentage(func.sum(MatchupDailyStats.character_2_wins), matches).label("p2_win_rate")
+                    )
+                    .where(*self.in_days(MatchupDailyStats.day, start, end))
+                    .group_by(MatchupDailyStats.character_1_id, MatchupDailyStats.character_2_id)
+                    .having(matches > 0)
+                    .order_by(matches.desc(), MatchupDailyStats.character_1_id, MatchupDailyStats.character_2_id)
+                )
+                if character_id:
+                    matchup_query = matchup_query.where(
+                        or_(MatchupDailyStats.character_1_id == character_id,
+                            MatchupDailyStats.character_2_id == character_id))
+
+                results = (await session.execute(matchup_query)).fetchall()
+                logger.info(f"Returned matchup statistics from {start} to {end}.")
+                return results
+
             matchup_query = (
                 select(
-                    func.least(Replay.p1_character_id, Replay.p2_character_id).label("character_1_id"),
-                    func.greatest(Replay.p1_character_id, Replay.p2_character_id).label("character_2_id"),
-                    func.count().label("matches_played"),
-                    # Calculate win rates for each character by dividing their wins by total matches and converting that to a percentage
-                    func.round(
-                        (func.sum(
-                            case(
-
-                                ((Replay.p1_character_id == func.least(Replay.p1_character_id,
-                                                                       Replay.p2_character_id)) & (
-                                         Replay.winner == 0), 1),
-                                ((Replay.p2_character_id == func.least(Replay.p1_character_id,
-                                                                       Replay.p2_character_id)) & (
-                                         Replay.winner == 1), 1)
-                                ,
-                                else_=0
-                            )
-                        ) / func.count()) * 100, 2
-                    ).label("p1_win_rate"),
-
-                    func.round(
-                        (func.sum(
-                            case(
-
-                                ((Replay.p1_character_id == func.greatest(Replay.p1_character_id,
-                                                                          Replay.p2_character_id)) & (
-                                         Replay.winner == 0), 1),
-                                ((Replay.p2_character_id == func.greatest(Replay.p1_character_id,
-                                                                          Replay.p2_character_id)) & (
-                                         Replay.winner == 1), 1)
-                                ,
-                                else_=0
-                            )
-                        ) / func.count()) * 100, 2
-                    ).label("p2_win_rate")
+                    MatchupStats.character_1_id,
+                    MatchupStats.character_2_id,
+                    MatchupStats.matches.label("matches_played"),
+                    self.percentage(MatchupStats.character_1_wins, MatchupStats.matches).label("p1_win_rate"),
+                    self.percentage(MatchupStats.character_2_wins, MatchupStats.matches).label("p2_win_rate")
                 )
-                .group_by(
-                    func.least(Replay.p1_character_id, Replay.p2_character_id),
-                    func.greatest(Replay.p1_character_id, Replay.p2_character_id)
-                )
-                .order_by(func.count().desc())
+                .where(MatchupStats.matches > 0)
+                .order_by(MatchupStats.matches.desc(), MatchupStats.character_1_id, MatchupStats.character_2_id)
             )
             if character_id:
                 matchup_query = matchup_query.where(
-                    or_(Replay.p1_character_id == character_id,
-                        Replay.p2_character_id == character_id))
+                    or_(MatchupStats.character_1_id == character_id,
+                        MatchupStats.character_2_id == character_id))
 
             results = (await session.execute(matchup_query)).fetchall()
             logger.info(f"Returned matchup statistics.")
             return results
 
-    async def get_matchup_rarity(self):
-        async with self.acquire() as session:
-            # Subquery to calculate total replays
-            total_replays_subquery = select(func.count(Replay.replay_id)).scalar_subquery()
+    async def get_matchup_rarity(self, session=None):
+        if self.uses_stats_engine(session):
+            return self.stats_engine.matchup_rarity(await self.stats_columns())
+        async with self.acquire(session) as session:
+            # Every replay counts towards exactly one pair
+            total_replays_subquery = select(func.sum(MatchupStats.matches)).scalar_subquery()
 
             matchup_rarity = (
                 select(
-                    func.least(Replay.p1_character_id, Replay.p2_character_id).label("character_1_id"),
-                    func.greatest(Replay.p1_character_id, Replay.p2_character_id).label("character_2_id"),
-                    func.count().label("matchup_count"),
-                    func.round(
-                        (func.count() / total_replays_subquery)
-                        * 100, 2).label("percentage")
+                    MatchupStats.character_1_id,
+                    MatchupStats.character_2_id,
+                    MatchupStats.matches.label("matchup_count"),
+                    self.percentage(MatchupStats.matches, total_replays_subquery).label("percentage")
                 )
-                .group_by(
-                    func.least(Replay.p1_character_id, Replay.p2_character_id),
-                    func.greatest(Replay.p1_character_id, Replay.p2_character_id)
-                )
-                .order_by("matchup_count")
+                .where(MatchupStats.matches > 0)
+                .order_by("matchup_count", MatchupStats.character_1_id, MatchupStats.character_2_id)
             )
             results = (await session.execute(matchup_rarity)).fetchall()
 
             logger.info(f"Returned matchup statistics.")
             return results
 
-    async def get_character_usage_statistics(self):
-        async with self.acquire() as session:
-            # Subquery for player 1 statistics
-            p1_query = (
+    async def get_character_usage_statistics(self, session=None, start: date = None, end: date = None):
+        """All time usage, or summed from the daily rollups over the UTC days from `start` up to `end`."""
+        if self.uses_stats_engine(session):
+            return self.stats_engine.character_usage(await self.stats_columns(), start, end)
+        async with self.acquire(session) as session:
+            if start is not None or end is not None:
+                matches = func.sum(CharacterDailyStats.matches)
+                query = (
+                    select(
+                        CharacterDailyStats.character_id,
+                        matches.label("total_matches"),
+                        self.percentage(func.sum(CharacterDailyStats.wins), matches).label("average_win_rate")
+                    )
+                    .where(*self.in_days(CharacterDailyStats.day, start, end))
+                    .group_by(CharacterDailyStats.character_id)
+                    .having(matches > 0)
+                    .order_by(matches.desc(), CharacterDailyStats.character_id)
+                )
+                results = (await session.execute(query)).fetchall()
+                logger.info(f"Returned character usage statistics from {start} to {end}.")
+                return results
+
+            # Sides played and won, a mirror match counts for both sides
+            query = (
                 select(
-                    Replay.p1_character_id.label("character_id"),
-                    func.count().label("matches_played"),
-                    func.round(
-                        func.avg(
-                            case(
-                                # If p1 is the recorder and Replay.winner == 0, p1 won;
-                                (Replay.recorder_steamid64 == Replay.p1_steamid64,
-                                 cast(not Replay.winner == 0, sqlalchemy.Integer)),
-                                else_=0
-                            )
-                        ) * 100, 2
-                    ).label("win_rate")
+                    CharacterStats.character_id,
+                    CharacterStats.matches.label("total_matches"),
+                    self.percentage(CharacterStats.wins, CharacterStats.matches).label("average_win_rate")
                 )
-                .group_by(Replay.p1_character_id)
+                .where(CharacterStats.matches > 0)
+                .order_by(CharacterStats.matches.desc(), CharacterStats.character_id)
             )
 
-            # Subquery for player 2 statistics
-            p2_query = (
+            results = (await session.execute(query)).fetchall()
+            logger.info(f"Returned character usage statistics.")
+
+            return results
+
+    async def get_replays_per_hour(self, session=None) -> typing.List[int]:
+        """Replays recorded in each hour of the day in UTC, 0 to 23."""
+        if self.uses_stats_engine(session):
+            return self.stats_engine.replays_per_hour(await self.stats_columns())
+        async with self.acquire(session) as session:
+            # date_part returns a float, cheaper to compute than extract's numeric
+            hour = func.date_part("hour", func.timezone("UTC", Replay.recorded_at))
+            rows = (await session.execute(
+                select(hour, func.count()).where(Replay.recorded_at.isnot(None)).group_by(hour)
+            )).all()
+
+        hours = [0] * 24
+        for value, count in rows:
+            hours[int(value)] = count
+        logger.info(f"Returned replays per hour.")
+        return hours
+
+    @staticmethod
+    async def begin_snapshot(session, snapshot_id: str = None) -> None:
+        """Start a read only repeatable read transaction, on the exported `snapshot_id` when given."""
+        await session.connection(execution_options={"isolation_level": "REPEATABLE READ",
+                                                    "postgresql_readonly": True})
+        if snapshot_id is not None:
+            # SET TRANSACTION takes no bind parameters, the id comes from pg_export_snapshot
+            await session.execute(text(f"SET TRANSACTION SNAPSHOT '{snapshot_id}'"))
+
+    @staticmethod
+    def snapshot_version(snapshot: str) -> str:
+        # Two snapshots with the same text see the same committed transactions, so the same replays
+        return hashlib.sha1(snapshot.encode()).hexdigest()[:20]
+
+    async def get_stats_version(self) -> str:
+        """The version a stats bundle computed now would carry, changes once a write commits."""
+        async with self.acquire() as session:
+            return self.snapshot_version((await session.execute(text("SELECT pg_current_snapshot()::text"))).scalar())
+
+    async def get_stats_bundle(self) -> typing.Dict[str, typing.Any]:
+        """Everything the stats page shows, from one snapshot."""
+        version = await self.get_stats_version()
+        if self.stats_bundle is not None and self.stats_bundle["version"] == version:
+            return self.stats_bundle
+
+        if self.stats_engine is not None:
+            bundle = await self.get_engine_stats_bundle()
+            self.stats_bundle = bundle
+            logger.info(f"Computed stats bundle {bundle['version']} in process")
+            return bundle
+
+        sections = {
+            "total_replays": self.get_total_replays,
+            "total_players": self.get_total_unique_players,
+            "total_per_character": self.get_total_replays_per_character,
+            "character_usage": self.get_character_usage_statistics,
+            "matchup_rarity": self.get_matchup_rarity,
+            "matchup_stats": self.get_matchup_statistics,
+            "replays_per_hour": self.get_replays_per_hour,
+        }
+
+        async with self.independent_session() as leader:
+            await self.begin_snapshot(leader)
+            snapshot_id, snapshot = (await leader.execute(
+                text("SELECT pg_export_snapshot(), pg_current_snapshot()::text")
+            )).one()
+
+            async def on_snapshot(method):
+                async with self.independent_session() as session:
+                    await self.begin_snapshot(session, snapshot_id)
+                    return await method(session=session)
+
+            # The exported snapshot stays importable while the leader's transaction is open, it runs a section too
+            first, *rest = sections.values()
+            results = await asyncio.gather(first(session=leader), *(on_snapshot(method) for method in rest))
+
+        bundle = {"version": self.snapshot_version(snapshot), **dict(zip(sections, results))}
+        self.stats_bundle = bundle
+        logger.info(f"Computed stats bundle {bundle['version']}")
+        return bundle
+
+    async def get_engine_stats_bundle(self) -> typing.Dict[str, typing.Any]:
+        engine = self.stats_engine
+        async with self.independent_session() as session:
+            await self.begin_snapshot(session)
+            snapshot = (await session.execute(text("SELECT pg_current_snapshot()::text"))).scalar()
+            # Its own fetch even when another refresh is running, that one may not see this snapshot's writes
+            columns = await engine.refresh(session, wait=True)
+
+        # Every section from the columns that refresh left, whatever refreshes other requests run meanwhile
+        sections = {
+            "total_replays": engine.total_replays,
+            "total_players": engine.total_players,
+            "total_per_character": engine.total_replays_per_character,
+            "character_usage": engine.character_usage,
+            "matchup_rarity": engine.matchup_rarity,
+            "matchup_stats": engine.matchup_statistics,
+            "replays_per_hour": engine.replays_per_hour,
+        }
+        return {"version": self.snapshot_version(snapshot),
+                **{name: section(columns) for name, section in sections.items()}}
+
+    @staticmethod
+    def trend_bucket(day_column, bucket: str):
+        # The rollup days are dates, truncated as plain timestamps so no zone shifts them
+        return cast(func.date_trunc(bucket, cast(day_column, sqlalchemy.TIMESTAMP)), sqlalchemy.Date).label("bucket_start")
+
+    async def get_character_trend(self, character_id: int, bucket: str = "day", start: date = None, end: date = None,
+                                  side: int = None):
+        """A character's matches, win rate and share of sides played per `bucket`."""
+        async with self.acquire() as session:
+            bucket_start = self.trend_bucket(CharacterDailyStats.day, bucket)
+            selected = CharacterDailyStats.character_id == character_id
+            matches = func.coalesce(func.sum(CharacterDailyStats.matches).filter(selected), 0)
+            wins = func.coalesce(func.sum(CharacterDailyStats.wins).filter(selected), 0)
+            query = (
                 select(
-                    Replay.p2_character_id.label("character_id"),
-                    func.count().label("matches_played"),
-                    func.round(
-                        func.avg(
-                            case(
-                                # If p2 is the recorder and Replay.winner == 1, p2 won
-                                (Replay.recorder_steamid64 == Replay.p2_steamid64, Replay.winner),
-                                else_=0
-                            )
-                        ) * 100, 2
-                    ).label("win_rate")
+                    bucket_start,
+                    matches.label("matches"),
+                    wins.label("wins"),
+                    self.percentage(wins, matches).label("win_rate"),
+                    self.percentage(matches, func.sum(CharacterDailyStats.matches)).label("usage_rate")
                 )
-                .group_by(Replay.p2_character_id)
+                .where(*self.in_days(CharacterDailyStats.day, start, end))
+                .group_by("bucket_start")
+                .order_by("bucket_start")
             )
+            if side is not None:
+                query = query.where(CharacterDailyStats.side == side)
 
-            # Combine both queries with UNION to get overall statistics
-            combined_query = p1_query.union_all(p2_query).subquery()
+            results = (await session.execute(query)).fetchall()
+            logger.info(f"Returned usage trend of character {character_id}.")
+            return results
 
-            # Summarize combined results by character_id
-            final_query = (
+    async def get_matchup_trend(self, character_1_id: int, character_2_id: int, bucket: str = "day",
+                                start: date = None, end: date = None):
+        """One matchup's matches and win rates per `bucket`."""
+        character_1_id, character_2_id = sorted((character_1_id, character_2_id))
+        async with self.acquire() as session:
+            bucket_start = self.trend_bucket(MatchupDailyStats.day, bucket)
+            matches = func.sum(MatchupDailyStats.matches)
+            query = (
                 select(
-                    combined_query.c.character_id,
-                    func.sum(combined_query.c.matches_played).label("total_matches"),
-                    func.round(func.avg(combined_query.c.win_rate), 2).label("average_win_rate")
+                    bucket_start,
+                    matches.label("matches"),
+                    self.percentage(func.sum(MatchupDailyStats.character_1_wins), matches).label("p1_win_rate"),
+                    self.percentage(func.sum(MatchupDailyStats.character_2_wins), matches).label("p2_win_rate")
                 )
-                .group_by(combined_query.c.character_id)
-                .order_by(func.sum(combined_query.c.matches_played).desc())
+                .where(MatchupDailyStats.character_1_id == character_1_id,
+                       MatchupDailyStats.character_2_id == character_2_id,
+                       *self.in_days(MatchupDailyStats.day, start, end))
+                .group_by("bucket_start")
+                .order_by("bucket_start")
             )
 
-            results = (await session.execute(final_query)).fetchall()
-            logger.info(f"Returned character usage statistics.")
-
+            results = (await session.execute(query)).fetchall()
+            logger.info(f"Returned trend of matchup {character_1_id} vs {character_2_id}.")
             return results
 
-    async def get_all_replay_timestamps(self):
+    async def backfill_daily_stats(self, start: date = None, end: date = None,
+                                   progress: typing.Callable[[date, date], None] = None) -> int:
+        """Recompute the daily rollups a month per transaction, returns the months recomputed."""
+        if start is None or end is None:
+            async with self.acquire() as session:
+                first, last = (await session.execute(
+                    select(func.min(Replay.recorded_at), func.max(Replay.recorded_at))
+                )).one()
+            if first is None:
+                return 0
+            start = start or utc_day(first)
+            end = end or utc_day(last) + timedelta(days=1)
+
+        months = 0
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(date(chunk_start.year, chunk_start.month, 1) + relativedelta(months=1), end)
+            async with self.acquire() as session:
+                await backfill_daily_stats(session, *(datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+                                                      for day in (chunk_start, chunk_end)))
+                await session.commit()
+            if progress is not None:
+                progress(chunk_start, chunk_end)
+            months += 1
+            chunk_start = chunk_end
+
+        logger.info(f"Backfilled daily stats from {start} to {end}")
+        return months
+
+    async def check_character_stats(self, repair=False) -> typing.List[dict]:
+        """Diff the character and matchup counters against the replays, rebuild them with `repair`."""
+        async with self.acquire() as session:
+            differences = await diff_character_stats(session)
+            if repair and any(difference["table"] in AGGREGATES for difference in differences):
+                await rebuild_character_stats(session)
+                await session.commit()
+                logger.info(f"Rebuilt character stats over {len(differences)} differing rows")
+        if repair and any(difference["table"] in DAILY_AGGREGATES for difference in differences):
+            await self.backfill_daily_stats()
+        return differences
+
+    async def get_player_profile(self, steamid64: int, limit=10, recent=50) -> typing.Dict[str, typing.Any]:
+        """A player's name, stats and `recent` latest replays."""
         async with self.acquire() as session:
-            query = select(Replay.recorded_at)
+            player = await session.get(Player, steamid64)
+            characters = (await session.scalars(
+                select(PlayerCharacterStats)
+                .where(PlayerCharacterStats.steamid64 == steamid64, PlayerCharacterStats.matches > 0)
+                .order_by(desc(PlayerCharacterStats.matches))
+            )).all()
+            if player is None and not characters:
+                raise NoResultFound("Player not found")
+
+            opponents = (await session.execute(
+                select(PlayerOpponentStats, Player.name)
+                .outerjoin(Player, Player.steamid64 == PlayerOpponentStats.opponent_steamid64)
+                .where(PlayerOpponentStats.steamid64 == steamid64, PlayerOpponentStats.matches > 0)
+                .order_by(desc(PlayerOpponentStats.matches)).limit(limit)
+            )).all()
+            matchups = (await session.scalars(
+                select(PlayerMatchupStats)
+                .where(PlayerMatchupStats.steamid64 == steamid64, PlayerMatchupStats.matches > 0)
+                .order_by(desc(PlayerMatchupStats.matches)).limit(limit)
+            )).all()
+            replays = (await session.scalars(
+                self.with_replay_data(select(Replay))
+                .where(or_(Replay.p1_steamid64 == steamid64, Replay.p2_steamid64 == steamid64))
+                .order_by(desc(Replay.recorded_at), desc(Replay.replay_id)).limit(recent)
+            )).all()
+
+        logger.info(f"Returned profile of player {steamid64}")
+        return {"player": player, "characters": characters, "opponents": opponents, "matchups": matchups,
+                "replays": replays}
+
+    async def rebuild_player_stats(self) -> None:
+        async with self.acquire() as session:
+            await rebuild_stats(session)
+            await session.commit()
+        logger.info("Rebuilt player stats")
+
+    async def get_activity(self, bucket: str = "day", start: datetime = None, end: datetime = None,
+                           tz: str = "UTC") -> typing.List[typing.Tuple[datetime, int]]:
+        """Replays recorded per `bucket` of `tz`'s wall clock, as (bucket start, count) pairs."""
+        params = {"bucket": bucket, "tz": tz, "from": start, "to": end}
+        key = self.activity_cache.key(params)
+        cached = self.activity_cache.get(key)
+        if cached is not None:
+            self.activity_cache.record_hit(key, 0.0)
+            return cached
+
+        generation = self.activity_cache.generation
+        began = time.perf_counter()
+        async with self.acquire() as session:
+            bucket_start = func.date_trunc(bucket, Replay.recorded_at, tz).label("bucket_start")
+            query = select(bucket_start, func.count().label("count")).where(Replay.recorded_at.isnot(None))
+            if start is not None:
+                query = query.where(Replay.recorded_at >= start)
+            if end is not None:
+                query = query.where(Replay.recorded_at < end)
+            # By the output column, the expression repeated would bind its own parameters and no longer match
+            query = query.group_by("bucket_start").order_by("bucket_start")
+            activity = [(row.bucket_start, row.count) for row in await session.execute(query)]
+
+        self.activity_cache.set(key, params, activity, time.perf_counter() - began, generation)
+        logger.info(f"Returned activity per {bucket}.")
+        return activity
+
+    def get_activity_cache_stats(self) -> dict:
+        return self.activity_cache.stats()
 
-            async for replay in self._stream_replays(query, session):
-                yield replay
+    @staticmethod
+    def with_replay_data(query, include_replay_data=False):
+        if include_replay_data:
+            return query
+        return query.options(defer(Replay.replay, raiseload=True))
+
+    def attach_replay_data(self, replay: Replay) -> Replay:
+        """Fill in a replay's raw bytes without marking the row as changed."""
+        data = replay.replay
+        if data is None and self.blob_store is not None:
+            data = self.blob_store.get(replay.filename)
+        if data is not None:
+            set_committed_value(replay, "replay", replay_codec.decode(data))
+        return replay
 
-            logger.info(f"Returned all replay timestamps.")
+    @staticmethod
+    def paginate(query, per_page=None, page=1, cursor: typing.Optional[tuple[datetime, int]] = None):
+        """Offset pagination by page, or keyset pagination after a (recorded_at, replay_id) cursor."""
+        if cursor is not None:
+            query = query.where(tuple_(Replay.recorded_at, Replay.replay_id) < tuple_(*cursor))
+            return query.limit(per_page) if per_page else query
+
+        if per_page:
+            offset = (page - 1) * per_page
+            query = query.limit(per_page).offset(offset)
+        return query
 
     async def get_replays(self, query_params: typing.Dict[str, typing.Union[int, str, bytes]],
-                          per_page=None, page=1) -> typing.AsyncGenerator[Replay, None]:
+                          per_page=None, page=1, include_replay_data=False,
+                          cursor: typing.Optional[tuple[datetime, int]] = None) -> typing.AsyncGenerator[Replay, None]:
         async with self.acquire() as session:
 
-            query = self.build_query(Replay, query_params)
-
-            if per_page:  # Add pagination to the query
-                offset = (page - 1) * per_page
-                query = query.limit(per_page).offset(offset)
+            query = self.build_query(Replay, await self.resolve_player_names(session, query_params))
+            query = self.with_replay_data(query, include_replay_data)
+            query = self.paginate(query, per_page=per_page, page=page, cursor=cursor)
 
             replay_ids = []
 
             async for replay in self._stream_replays(query, session):
-                yield replay
+                yield self.attach_replay_data(replay) if include_replay_data else replay
                 replay_ids.append(str(replay.replay_id))
 
             if replay_ids:
                 logger.info(f"Returned replay(s) with ID(s): {','.join(replay_ids)}")
 
-    async def get_all_replays(self, per_page=None, page=1) -> typing.AsyncGenerator[Replay, None]:
+    async def get_replay_page(self, query_params: typing.Optional[typing.Dict[str, typing.Union[int, str, bytes]]],
+                              per_page: int, page=1, include_replay_data=False,
+                              cursor: typing.Optional[tuple[datetime, int]] = None, count="exact") \
+            -> tuple[typing.List[Replay], typing.Optional[int], bool]:
+        """One page of replays as (replays, total, has_more), total is None unless `count` is exact."""
+        if count not in COUNT_MODES:
+            raise ValueError(f"Unknown count mode {count}, expected one of {COUNT_MODES}")
+        # The total behind a cursor would only count the rows left
+        exact = count == "exact" and cursor is None
+
+        key = self.count_cache.key(query_params)
+        cached_total = self.count_cache.get(key) if exact else None
+        count_rows = exact and cached_total is None
+        generation = self.count_cache.generation
+
+        start = time.perf_counter()
         async with self.acquire() as session:
+            base_query = self.build_query(Replay, await self.resolve_player_names(session, query_params or {}))
+            count_query = base_query.with_only_columns(func.count(), maintain_column_froms=True)
+            query = self.with_replay_data(base_query, include_replay_data)
+            if count_rows:
+                query = query.add_columns(count_query.scalar_subquery().label("total"))
+            if cursor is not None:
+                query = self.paginate(query, per_page=per_page + 1, cursor=cursor)
+            else:
+                query = query.limit(per_page + 1).offset((page - 1) * per_page)
+            query = query.order_by(desc(Replay.recorded_at), desc(Replay.replay_id))
+
+            rows = (await session.execute(query)).all()
+
+            total = None
+            if not count_rows:
+                total = cached_total
+            elif rows:
+                total = rows[0].total
+            elif page > 1:
+                # Past the last page the total has no row to ride on, count separately to report max_page
+                total = (await session.execute(count_query)).scalar()
+            else:
+                total = 0
+        elapsed = time.perf_counter() - start
 
-            query = select(Replay)
+        if count_rows:
+            self.count_cache.set(key, query_params, total, elapsed, generation)
+        elif exact:
+            self.count_cache.record_hit(key, elapsed)
 
-            if per_page:  # Apply pagination
-                offset = (page - 1) * per_page
-                query = select(Replay).limit(per_page).offset(offset)
+        replays = [row[0] for row in rows[:per_page]]
+        if include_replay_data:
+            replays = [self.attach_replay_data(replay) for replay in replays]
+
+        logger.info(f"Returned page of {len(replays)} replay(s), count {count}")
+        return replays, total, len(rows) > per_page
+
+    async def get_all_replays(self, per_page=None, page=1, include_replay_data=False,
+                              cursor: typing.Optional[tuple[datetime, int]] = None) \
+            -> typing.AsyncGenerator[Replay, None]:
+        async with self.acquire() as session:
+
+            query = self.with_replay_data(select(Replay), include_replay_data)
+            query = self.paginate(query, per_page=per_page, page=page, cursor=cursor)
 
             async for replay in self._stream_replays(query, session):
-                yield replay
+                yield self.attach_replay_data(replay) if include_replay_data else replay
 
             if per_page:
                 logger.info(f"Returned all replays for page {page}")
             else:
                 logger.info(f"Returned all replays")
 
-    async def create_replay(self, replay_create: ReplayCreate) -> Replay:
+    @staticmethod
+    async def upsert_players(session, rows: typing.Iterable, chunk_size=5000) -> None:
+        """Record the players of new replays and the names they played under, in the caller's transaction."""
+        names = {}
+        for row in rows:
+            recorded_at = ReplayService._row_value(row, "recorded_at")
+            for side in ("p1", "p2", "recorder"):
+                name = ReplayService._row_value(row, side)
+                steamid64 = ReplayService._row_value(row, f"{side}_steamid64")
+                if name is None or steamid64 is None:
+                    continue
+                seen = names.setdefault((steamid64, name), [recorded_at, recorded_at])
+                seen[0], seen[1] = min(seen[0], recorded_at), max(seen[1], recorded_at)
+        if not names:
+            return
+
+        # Key order, so concurrent batches lock shared players in the same order
+        players = {}
+        for (steamid64, name), (first_seen, last_seen) in sorted(names.items()):
+            player = players.setdefault(steamid64, {"steamid64": steamid64, "name": name, "first_seen": first_seen,
+                                                    "last_seen": last_seen})
+            if last_seen > player["last_seen"]:
+                player["name"] = name
+            player["first_seen"] = min(player["first_seen"], first_seen)
+            player["last_seen"] = max(player["last_seen"], last_seen)
+
+        for chunk in chunks(list(players.values()), chunk_size):
+            statement = insert(Player).values(chunk)
+            await session.execute(statement.on_conflict_do_update(index_elements=[Player.steamid64], set_={
+                "name": case((statement.excluded.last_seen >= Player.last_seen, statement.excluded.name),
+                             else_=Player.name),
+                "first_seen": func.least(Player.first_seen, statement.excluded.first_seen),
+                "last_seen": func.greatest(Player.last_seen, statement.excluded.last_seen),
+            }))
+
+        history = [{"steamid64": steamid64, "name": name, "first_seen": first_seen, "last_seen": last_seen}
+                   for (steamid64, name), (first_seen, last_seen) in sorted(names.items())]
+        for chunk in chunks(history, chunk_size):
+            statement = insert(PlayerName).values(chunk)
+            await session.execute(statement.on_conflict_do_update(index_elements=[PlayerName.steamid64,
+                                                                                  PlayerName.name], set_={
+                "first_seen": func.least(PlayerName.first_seen, statement.excluded.first_seen),
+                "last_seen": func.greatest(PlayerName.last_seen, statement.excluded.last_seen),
+            }))
+
+    async def create_replay(self, replay_create: ReplayCreate) -> typing.Optional[Replay]:
+        if settings.filename_filter_capacity and \
+                replay_create.filename in await self.existing_filenames([replay_create.filename]):
+            logger.info(f"Skipped existing replay {replay_create.filename}")
+            return
+
+        data = replay_codec.encode(replay_create.replay, settings.replay_compression_level)
+        if self.blob_store is not None:
+            self.blob_store.put(replay_create.filename, data)
+
         new_replay = Replay(
-            replay=replay_create.replay,
+            replay=None if self.blob_store is not None else data,
             recorded_at=replay_create.recorded_at,
             winner=replay_create.winner,
             p1=replay_create.p1,
@@ -363,38 +1122,178 @@ class ReplayService:
 
         async with self.acquire() as session:
             session.add(new_replay)
+            await self.upsert_players(session, [new_replay])
+            await apply_stats(session, [new_replay])
+            await apply_character_stats(session, [new_replay])
             await session.commit()
             await session.refresh(new_replay)
+            self.remember_filenames([new_replay.filename])
+            self.invalidate_counts([new_replay])
+            self.index_players([new_replay])
+            self.mark_stats([new_replay.replay_id])
             logger.info(f"Created new replay with ID: {new_replay.replay_id}")
             return new_replay
 
+    async def create_replays(self, replay_creates: typing.Sequence[ReplayCreate]) -> typing.List[sqlalchemy.Row]:
+        """Insert replays in one statement, skipping existing filenames, returns the rows inserted."""
+        if settings.filename_filter_capacity:
+            # Known duplicates are dropped before their blobs are sent, ON CONFLICT catches the rest
+            existing = await self.existing_filenames([replay_create.filename for replay_create in replay_creates])
+            replay_creates = [replay_create for replay_create in replay_creates
+                              if replay_create.filename not in existing]
+
+        if not replay_creates:
+            return []
+
+        upload_date = datetime.now(timezone.utc)
+        values = [{**replay_create.model_dump(), "upload_date": upload_date} for replay_create in replay_creates]
+        for value in values:
+            # A no-op for replays the ingest workers already compressed
+            value["replay"] = replay_codec.encode(value["replay"], settings.replay_compression_level)
+        if self.blob_store is not None:
+            # Blobs are written before their rows, a row never points at bytes that are not there. A blob whose
+            # row turns out to be a duplicate is the same content under the same key, so nothing is wasted
+            self.blob_store.put_many((value["filename"], value["replay"]) for value in values)
+            for value in values:
+                value["replay"] = None
+        statement = (
+            insert(Replay)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=[Replay.filename])
+            .returning(Replay.replay_id, Replay.filename)
+        )
+
+        async with self.acquire() as session:
+            rows = (await session.execute(statement)).fetchall()
+            inserted = {row.filename for row in rows}
+            inserted_values = [value for value in values if value["filename"] in inserted]
+            await self.upsert_players(session, inserted_values)
+            await apply_stats(session, inserted_values)
+            await apply_character_stats(session, inserted_values)
+            await session.commit()
+            self.remember_filenames(row.filename for row in rows)
+            self.invalidate_counts(inserted_values)
+            self.index_players(inserted_values)
+            self.mark_stats(row.replay_id for row in rows)
+            logger.info(f"Created {len(rows)} new replay(s) out of {len(replay_creates)}")
+            return rows
+
     async def update_replay(self, replay_id: int, replay_update: ReplayUpdate) -> Replay:
         async with self.acquire() as session:
-            replay = await anext(self.get_replays({"replay_id": replay_id}))
+            # Loaded in this session, so the changes below are what it commits
+            replay = await session.get(Replay, replay_id, options=[defer(Replay.replay)])
+            if not replay:
+                raise NoResultFound("Replay not found")
+            # Counts of filters the row leaves change too, not just those it enters
+            before = {column.key: getattr(replay, column.key) for column in Replay.__table__.columns
+                      if column.key != "replay"}
 
             for key, value in replay_update.dict(exclude_unset=True).items():
                 setattr(replay, key, value)
 
+            await self.upsert_players(session, [replay])
+            # One delta per counter row, so the upserts lock rows in key order like every other writer
+            await apply_stats(session, [replay], replaced=[before])
+            await apply_character_stats(session, [replay], replaced=[before])
             await session.commit()
             await session.refresh(replay)
-            logger.info(f"Updated replay with ID: {replay.id}")
+            self.invalidate_counts([before, replay])
+            self.index_players([before], count=-1)
+            self.index_players([replay])
+            self.mark_stats([replay.replay_id])
+            logger.info(f"Updated replay with ID: {replay.replay_id}")
             return replay
 
     async def delete_replay(self, replay_id: int) -> None:
         async with self.acquire() as session:
             replay = await self.get_replay(replay_id)
             await session.delete(replay)
+            await apply_stats(session, [replay], sign=-1)
+            await apply_character_stats(session, [replay], sign=-1)
             await session.commit()
-            logger.info(f"Deleted user with ID: {replay.id}")
+            self.invalidate_counts([replay])
+            self.index_players([replay], count=-1)
+            self.mark_stats([replay.replay_id])
+            logger.info(f"Deleted replay with ID: {replay.replay_id}")
+
+    async def load_replay(self, replay_id: int) -> tuple[typing.Union[BytesIO, BlobIO], str, str]:
+        if self.blob_store is None:
+            replay = await self.get_replay(replay_id)
+            view = None
+        else:
+            async with self.acquire() as session:
+                replay = await session.get(Replay, replay_id, options=[defer(Replay.replay)])
+                if not replay:
+                    raise NoResultFound("Replay not found")
+                view = self.blob_store.get(replay.filename)
+                if view is None:
+                    # Not migrated to the blob store yet
+                    await session.refresh(replay, ["replay"])
 
-    async def load_replay(self, replay_id: int) -> tuple[BytesIO, str, str]:
-        replay = await self.get_replay(replay_id)
         filename, mimetype = friendly_file(replay)
-        buffer = BytesIO(replay.replay)
+        if view is not None and not replay_codec.is_encoded(view):
+            return BlobIO(view, name=replay.filename), filename, mimetype
+
+        buffer = BytesIO(replay_codec.decode(replay.replay if view is None else view))
         buffer.seek(0)
         buffer.name = replay.filename
         return buffer, filename, mimetype
 
+    async def migrate_blobs(self, batch_size=500) -> typing.AsyncGenerator[int, None]:
+        """Move replay bytes from the replays table into the blob store, yields the number moved per batch."""
+        if self.blob_store is None:
+            raise ValueError("No blob store configured, set BLOB_STORE to move replays out of the database")
+
+        while True:
+            async with self.acquire() as session:
+                query = (
+                    select(Replay.replay_id, Replay.filename, Replay.replay)
+                    .where(Replay.replay.isnot(None))
+                    .order_by(Replay.replay_id)
+                    .limit(batch_size)
+                )
+                rows = (await session.execute(query)).fetchall()
+                if not rows:
+                    return
+
+                self.blob_store.put_many((row.filename, row.replay) for row in rows)
+                replay_ids = [row.replay_id for row in rows]
+                await session.execute(
+                    sqlalchemy.update(Replay).where(Replay.replay_id.in_(replay_ids)).values(replay=None)
+                )
+                await session.commit()
+
+            logger.info(f"Moved {len(rows)} replay blob(s) up to ID {replay_ids[-1]} to the blob store")
+            yield len(rows)
+
+    async def store_raw(self, replay_ids: typing.Collection[int], raw=True) -> int:
+        """Rewrite replays uncompressed, or compressed again with raw=False, returns how many changed."""
+        level = 0 if raw else settings.replay_compression_level
+        rewritten = 0
+
+        async with self.acquire() as session:
+            query = select(Replay.replay_id, Replay.filename, Replay.replay).where(Replay.replay_id.in_(replay_ids))
+            for replay_id, filename, data in (await session.execute(query)).all():
+                in_store = data is None and self.blob_store is not None
+                if in_store:
+                    data = self.blob_store.get(filename)
+                if data is None:
+                    continue
+
+                stored = replay_codec.encode(replay_codec.decode(data), level)
+                if stored == data:
+                    continue
+                # The filename is the hash of the raw bytes, so it stays the same whichever way they are stored
+                if in_store:
+                    self.blob_store.put_many([(filename, stored)], replace=True)
+                else:
+                    await session.execute(update(Replay).where(Replay.replay_id == replay_id).values(replay=stored))
+                rewritten += 1
+            await session.commit()
+
+        logger.info(f"Stored {rewritten} replay(s) {'raw' if raw else 'compressed'}")
+        return rewritten
+
     async def load_replays(self, replay_ids: typing.Collection[int]) -> typing.Generator[BytesIO, str, str]:
         for ri in replay_ids:
             yield await self.load_replay(ri)
@@ -0,0 +1,256 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import re
+import threading
+import time
+import typing
+import uuid
+
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from app.services.ingest_service import IngestPipeline
+from app.utils.cache import cache
+from app.utils.constants import REPLAY_SIZE
+
+logger = logging.getLogger(__name__)
+
+TICKET_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+@contextmanager
+def _locked(path: str, blocking=True):
+    """Exclusive flock on a lock file, shared by every process using the same spool directory."""
+    with open(path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_json(path: str, data: dict) -> None:
+    temp = f"{path}.tmp"
+    with open(temp, "w") as file:
+        json.dump(data, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, path)
+
+
+class UploadSpool:
+    """
+    Durable on-disk queue for uploads, drained into the database by a background writer.
+
+    Layout of the spool directory:
+        spool.dat     replays appended back to back, every record is REPLAY_SIZE bytes so record n is at n * REPLAY_SIZE
+        spool.idx     one "first count ticket" line per upload, appended together with its records
+        cursor        number of records already written to the database
+        tickets/      a JSON status file per ticket
+
+    Uploads are fsynced before they are acknowledged. The writer inserts whole tickets with ON CONFLICT DO NOTHING,
+    writes their results and only then advances the cursor. A restart skips tickets whose results were written and
+    re-drains at most the ones in flight, never inserting a record twice.
+    """
+
+    def __init__(self, directory: str, service, batch_size=2000, poll_interval=0.5, ticket_ttl=7 * 24 * 3600):
+        self.directory = directory
+        self.service = service
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.ticket_ttl = ticket_ttl
+        self.data_path = os.path.join(directory, "spool.dat")
+        self.index_path = os.path.join(directory, "spool.idx")
+        self.cursor_path = os.path.join(directory, "cursor")
+        self.tickets_path = os.path.join(directory, "tickets")
+        self.append_lock = os.path.join(directory, "append.lock")
+        self.writer_lock = os.path.join(directory, "writer.lock")
+        self.wakeup = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        os.makedirs(self.tickets_path, exist_ok=True)
+
+    def _ticket_path(self, ticket: str) -> str:
+        return os.path.join(self.tickets_path, f"{ticket}.json")
+
+    def append(self, records: typing.Sequence[bytes]) -> str:
+        """Durably queue replays and return the ticket to poll for their results."""
+        ticket = uuid.uuid4().hex
+
+        with _locked(self.append_lock):
+            with open(self.data_path, "ab") as data_file:
+                size = data_file.seek(0, os.SEEK_END)
+                # A crash mid-append leaves a partial record that was never acknowledged, drop it
+                if size % REPLAY_SIZE:
+                    size -= size % REPLAY_SIZE
+                    data_file.truncate(size)
+                for record in records:
+                    data_file.write(record)
+                data_file.flush()
+                os.fsync(data_file.fileno())
+
+            first = size // REPLAY_SIZE
+            # A compaction cut short after emptying the spool leaves the cursor past its end
+            if self._read_cursor() > first:
+                self._write_cursor(0)
+            _write_json(self._ticket_path(ticket), {"ticket": ticket, "status": "queued", "count": len(records),
+                                                    "queued_at": time.time()})
+            with open(self.index_path, "a+b") as index_file:
+                # Likewise for a line cut short, lines are far shorter than the tail read back
+                end = index_file.seek(0, os.SEEK_END)
+                index_file.seek(max(0, end - 128))
+                tail = index_file.read()
+                if tail and not tail.endswith(b"\n"):
+                    index_file.truncate(end - len(tail) + tail.rfind(b"\n") + 1)
+                index_file.write(f"{first} {len(records)} {ticket}\n".encode("ascii"))
+                index_file.flush()
+                os.fsync(index_file.fileno())
+
+        self.wakeup.set()
+        logger.info(f"Spooled {len(records)} replay(s) under ticket {ticket}")
+        return ticket
+
+    def status(self, ticket: str) -> Optional[Dict[str, Any]]:
+        # Tickets become file names, never let one point outside the tickets directory
+        if not TICKET_PATTERN.fullmatch(ticket):
+            return
+
+        try:
+            with open(self._ticket_path(ticket)) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return
+
+    def _read_cursor(self) -> int:
+        try:
+            with open(self.cursor_path) as file:
+                return int(file.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_cursor(self, cursor: int) -> None:
+        temp = f"{self.cursor_path}.tmp"
+        with open(temp, "w") as file:
+            file.write(str(cursor))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, self.cursor_path)
+
+    def _pending_tickets(self, cursor: int) -> typing.List[tuple[int, int, str]]:
+        """Whole tickets from the cursor on, up to batch_size records (always at least one ticket)."""
+        tickets = []
+        total = 0
+        try:
+            with open(self.index_path) as index_file:
+                for line in index_file:
+                    # Not terminated yet, an append in progress or one a crash cut short
+                    if not line.endswith("\n"):
+                        break
+                    first, count, ticket = line.split()
+                    first, count = int(first), int(count)
+                    if first < cursor:
+                        continue
+                    if tickets and total + count > self.batch_size:
+                        break
+                    tickets.append((first, count, ticket))
+                    total += count
+        except FileNotFoundError:
+            pass
+        return tickets
+
+    def _read_records(self, first: int, count: int) -> typing.List[bytes]:
+        with open(self.data_path, "rb") as data_file:
+            data_file.seek(first * REPLAY_SIZE)
+            data = data_file.read(count * REPLAY_SIZE)
+        return [data[offset:offset + REPLAY_SIZE] for offset in range(0, len(data), REPLAY_SIZE)]
+
+    async def drain(self) -> int:
+        """Write every queued ticket to the database, returns the number of records drained."""
+        pipeline = IngestPipeline(self.service, batch_size=self.batch_size)
+        drained = 0
+
+        while True:
+            cursor = self._read_cursor()
+            tickets = self._pending_tickets(cursor)
+            if not tickets:
+                self._compact(cursor)
+                return drained
+
+            last_first, last_count, _ = tickets[-1]
+            # Already written before a crash kept the cursor from moving, their results stand
+            tickets = [(first, count, ticket) for first, count, ticket in tickets
+                       if (self.status(ticket) or {}).get("status") != "done"]
+
+            records = []
+            for first, count, _ in tickets:
+                records.extend(self._read_records(first, count))
+
+            results = [result async for result in pipeline.run(records)] if records else []
+            offset = 0
+            for first, count, ticket in tickets:
+                ticket_results = results[offset:offset + count]
+                for result in ticket_results:
+                    result["index"] -= offset
+                offset += count
+                _write_json(self._ticket_path(ticket), self._done(ticket, ticket_results))
+
+            self._write_cursor(last_first + last_count)
+            # One cache clear per batch instead of one per replay
+            cache.clear()
+            drained += len(records)
+            logger.info(f"Drained {len(records)} spooled replay(s) from {len(tickets)} ticket(s)")
+
+    @staticmethod
+    def _done(ticket: str, results: typing.List[Dict[str, Any]]) -> Dict[str, Any]:
+        totals = {"created": 0, "duplicate": 0, "corrupt": 0}
+        for result in results:
+            totals[result["status"]] += 1
+        return {"ticket": ticket, "status": "done", "count": len(results), "done_at": time.time(),
+                "results": results, **totals}
+
+    def _compact(self, cursor: int) -> None:
+        """Once everything is drained, start the spool over and forget old tickets."""
+        if not cursor:
+            return
+
+        with _locked(self.append_lock):
+            # Re-check under the lock, an upload may have landed since the writer last looked
+            if os.path.exists(self.data_path) and os.path.getsize(self.data_path) > cursor * REPLAY_SIZE:
+                return
+            # Index first so a crash part way through never leaves old tickets to drain again, append resets a cursor
+            # left past the end of an emptied spool
+            for path in (self.index_path, self.data_path):
+                if os.path.exists(path):
+                    os.truncate(path, 0)
+            self._write_cursor(0)
+
+        expired = time.time() - self.ticket_ttl
+        for entry in os.scandir(self.tickets_path):
+            if entry.is_file() and entry.stat().st_mtime < expired:
+                os.remove(entry.path)
+
+    def start(self) -> None:
+        """Start the background writer thread for this process."""
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name="upload-spool-writer", daemon=True)
+            self.thread.start()
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        while True:
+            try:
+                # Only one process drains at a time, the others stand by in case it goes away
+                with _locked(self.writer_lock, blocking=False) as acquired:
+                    if acquired:
+                        loop.run_until_complete(self.drain())
+            except Exception:
+                logger.exception("Upload spool writer failed, retrying")
+
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
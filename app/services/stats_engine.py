@@ -0,0 +1,341 @@
+import asyncio
+import threading
+import time
+import typing
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+from sqlalchemy import BIGINT, case, cast, func, or_
+from sqlalchemy.future import select
+
+from app.models.replay import Replay
+from app.utils.constants import CHARACTERS
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Stands in for a NULL timestamp, reads back as NaT through datetime64
+NULL_TIME = np.iinfo(np.int64).min
+MICROSECONDS_PER_HOUR = 3600 * 1000000
+CHARACTER_COUNT = len(CHARACTERS)
+
+# Column: dtype it is held in. NULL ids, characters and steam ids are -1, winner is -1 unless 0 (p1) or 1 (p2)
+COLUMNS = {
+    "replay_id": np.int64,
+    "p1_character_id": np.int8,
+    "p2_character_id": np.int8,
+    "winner": np.int8,
+    "p1_steamid64": np.int64,
+    "p2_steamid64": np.int64,
+    "recorder_steamid64": np.int64,
+    "recorded_at": np.int64,
+}
+
+TWO_PLACES = Decimal("0.01")
+
+
+def microseconds(column):
+    # Exact, extract's numeric epoch keeps the microseconds a float would round off
+    return func.coalesce(cast(func.extract("epoch", column) * 1000000, BIGINT), NULL_TIME)
+
+
+def to_microseconds(value: typing.Optional[typing.Union[datetime, date]]) -> int:
+    # Naive timestamps are UTC, like utc_day reads them, a date is its UTC midnight
+    if value is None:
+        return NULL_TIME
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def percentage(part: int, whole: int) -> typing.Optional[Decimal]:
+    # round(numeric, 2) in Postgres rounds halves away from zero, Decimal does it exactly the same way
+    if not whole:
+        return None
+    return (Decimal(int(part) * 100) / Decimal(int(whole))).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+
+
+class CharacterTotal(typing.NamedTuple):
+    total: int
+    character_id: int
+
+
+class CharacterUsage(typing.NamedTuple):
+    character_id: int
+    total_matches: int
+    average_win_rate: typing.Optional[Decimal]
+
+
+class MatchupStatistics(typing.NamedTuple):
+    character_1_id: int
+    character_2_id: int
+    matches_played: int
+    p1_win_rate: typing.Optional[Decimal]
+    p2_win_rate: typing.Optional[Decimal]
+
+
+class MatchupRarity(typing.NamedTuple):
+    character_1_id: int
+    character_2_id: int
+    matchup_count: int
+    percentage: typing.Optional[Decimal]
+
+
+class StatsEngine:
+    """
+    The stats page computed in process, over the replays' metadata held as one NumPy array per column.
+
+    Rows come in by upload_date, each refresh fetches what was uploaded since the last one plus an overlap for
+    transactions that committed late, and replaces any rows it already held. Replays written through this process
+    are re-fetched by id on the next refresh, writes from other processes to existing rows are caught by the full
+    reload every reload_interval seconds. Results have the same columns, order and rounding as the SQL methods of
+    ReplayService, so either can feed the controller.
+    """
+
+    def __init__(self, refresh_interval=5.0, reload_interval=3600.0, overlap=60.0):
+        self.columns: typing.Dict[str, np.ndarray] = {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+        # Newest upload_date held, in microseconds since the epoch
+        self.watermark: typing.Optional[int] = None
+        self.refresh_interval = refresh_interval
+        self.reload_interval = reload_interval
+        self.overlap = overlap
+        self.refreshed_at: typing.Optional[float] = None
+        self.reloaded_at: typing.Optional[float] = None
+        # Replays written through this process since the last refresh, re-fetched by id
+        self.dirty: typing.Set[int] = set()
+        self.stale = True
+        # Only guards swapping the columns, readers take the dict once and never see a half applied refresh
+        self.lock = threading.Lock()
+        # Set while a refresh runs, in any thread, so refreshes never overlap and merge over each other
+        self.refreshing = False
+
+    def __len__(self):
+        return len(self.columns["replay_id"])
+
+    def mark(self, replay_ids: typing.Iterable[int] = ()) -> None:
+        """Refresh on the next read, re-fetching `replay_ids` whatever their upload_date."""
+        with self.lock:
+            self.dirty.update(replay_ids)
+            self.stale = True
+
+    def due(self) -> bool:
+        return self.stale or self.refreshed_at is None or \
+            time.monotonic() - self.refreshed_at >= self.refresh_interval
+
+    @staticmethod
+    def query(since: datetime = None, replay_ids: typing.Collection[int] = (), after: int = None, limit: int = None):
+        """
+        The replays uploaded from `since` on plus `replay_ids`, or every replay, or `limit` of them by replay_id
+        from after `after`, as one row holding an array per column and the upload dates.
+        """
+        rows = select(
+            Replay.replay_id.label("replay_id"),
+            func.coalesce(Replay.p1_character_id, -1).label("p1_character_id"),
+            func.coalesce(Replay.p2_character_id, -1).label("p2_character_id"),
+            case((Replay.winner.in_((0, 1)), Replay.winner), else_=-1).label("winner"),
+            func.coalesce(Replay.p1_steamid64, -1).label("p1_steamid64"),
+            func.coalesce(Replay.p2_steamid64, -1).label("p2_steamid64"),
+            func.coalesce(Replay.recorder_steamid64, -1).label("recorder_steamid64"),
+            microseconds(Replay.recorded_at).label("recorded_at"),
+            microseconds(Replay.upload_date).label("upload_date"),
+        )
+        if since is not None:
+            conditions = [Replay.upload_date >= since]
+            if replay_ids:
+                conditions.append(Replay.replay_id.in_(list(replay_ids)))
+            rows = rows.where(or_(*conditions))
+        if after is not None:
+            rows = rows.where(Replay.replay_id > after)
+        if limit is not None:
+            rows = rows.order_by(Replay.replay_id).limit(limit)
+        rows = rows.subquery()
+        # asyncpg decodes an integer array in one go, building a row object per replay would take most of a load
+        return select(*(func.array_agg(column) for column in rows.c))
+
+    @staticmethod
+    def to_columns(row: typing.Sequence[typing.Optional[list]]) \
+            -> typing.Tuple[typing.Dict[str, np.ndarray], typing.Optional[int]]:
+        """The row of query() as columns, and the newest upload_date among them."""
+        columns = {name: np.array(values or (), dtype) for (name, dtype), values in zip(COLUMNS.items(), row)}
+        uploaded = np.array(row[-1] or (), np.int64)
+        uploaded = uploaded[uploaded != NULL_TIME]
+        return columns, int(uploaded.max()) if len(uploaded) else None
+
+    async def fetch(self, session, since: datetime = None, replay_ids: typing.Collection[int] = (),
+                    chunk_size=1000000) -> typing.Tuple[typing.Dict[str, np.ndarray], typing.Optional[int]]:
+        """Columns of the replays query() selects, a full load in chunks of `chunk_size` by replay_id."""
+        if since is not None:
+            return self.to_columns((await session.execute(self.query(since, replay_ids))).one())
+
+        parts, watermark, after = [], None, None
+        while True:
+            columns, newest = self.to_columns(
+                (await session.execute(self.query(after=after, limit=chunk_size))).one())
+            parts.append(columns)
+            if newest is not None:
+                watermark = newest if watermark is None else max(watermark, newest)
+            if len(columns["replay_id"]) < chunk_size:
+                break
+            after = int(columns["replay_id"].max())
+        return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}, watermark
+
+    async def refresh(self, session, full=False, wait=False) -> typing.Dict[str, np.ndarray]:
+        """
+        Bring the columns up to date through `session`, returns the columns this refresh put in place. One refresh
+        runs at a time, a caller arriving meanwhile gets the columns held, waiting only when nothing is loaded yet.
+        With `wait` it waits its turn and always fetches through its own session.
+        """
+        waited = False
+        while True:
+            with self.lock:
+                if not wait and self.refreshed_at is not None and (self.refreshing or waited):
+                    return self.columns
+                if not self.refreshing:
+                    self.refreshing = True
+                    break
+            waited = True
+            await asyncio.sleep(0.05)
+
+        try:
+            return await self._refresh(session, full)
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+    async def _refresh(self, session, full: bool) -> typing.Dict[str, np.ndarray]:
+        now = time.monotonic()
+        full = full or self.watermark is None or self.reloaded_at is None or \
+            now - self.reloaded_at >= self.reload_interval
+        with self.lock:
+            replay_ids, self.dirty = self.dirty, set()
+            self.stale = False
+            since = None if full else EPOCH + timedelta(microseconds=self.watermark - int(self.overlap * 1000000))
+
+        fetched, watermark = await self.fetch(session, since, replay_ids)
+
+        with self.lock:
+            if full:
+                self.columns = fetched
+                self.reloaded_at = now
+            else:
+                self.columns = self.merge(self.columns, fetched, replay_ids)
+            if watermark is not None:
+                self.watermark = watermark if full or self.watermark is None else max(self.watermark, watermark)
+            self.refreshed_at = now
+            return self.columns
+
+    @staticmethod
+    def merge(current: typing.Dict[str, np.ndarray], fetched: typing.Dict[str, np.ndarray],
+              replay_ids: typing.Collection[int] = ()) -> typing.Dict[str, np.ndarray]:
+        """`current` with the rows fetched again replaced, and the re-fetched ids that are gone dropped."""
+        replaced = np.union1d(fetched["replay_id"], np.fromiter(replay_ids, np.int64, len(replay_ids)))
+        if not len(replaced):
+            return current
+        ids = current["replay_id"]
+        # Re-fetched rows are mostly the newest, only the ids from the smallest one up are looked through
+        keep = ids < replaced[0]
+        candidates = ~keep
+        keep[candidates] = ~np.isin(ids[candidates], replaced, assume_unique=True)
+        return {name: np.concatenate([current[name][keep], fetched[name]]) for name in COLUMNS}
+
+    def snapshot(self, columns: typing.Dict[str, np.ndarray] = None, start: date = None,
+                 end: date = None) -> typing.Dict[str, np.ndarray]:
+        """
+        `columns`, the current ones by default, narrowed to replays recorded on the UTC days from `start` up to `end`
+        when either is given. Everything computed from one snapshot agrees, whatever refreshes run meanwhile.
+        """
+        columns = self.columns if columns is None else columns
+        if start is None and end is None:
+            return columns
+        recorded_at = columns["recorded_at"]
+        mask = recorded_at != NULL_TIME
+        if start is not None:
+            mask &= recorded_at >= to_microseconds(start)
+        if end is not None:
+            mask &= recorded_at < to_microseconds(end)
+        return {name: column[mask] for name, column in columns.items()}
+
+    @staticmethod
+    def character_counts(columns: typing.Dict[str, np.ndarray]) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Per character id: the replays it appears in (a mirror match once), the sides it played and won."""
+        p1, p2, winner = columns["p1_character_id"], columns["p2_character_id"], columns["winner"]
+        # One bincount per side over (character + 1, won) codes, a NULL character falls in the dropped bucket 0
+        sides = sum(np.bincount((character_id.astype(np.int16) + 1) * 2 + (winner == side),
+                                minlength=(CHARACTER_COUNT + 1) * 2)
+                    for side, character_id in enumerate((p1, p2))).reshape(-1, 2)[1:]
+        matches, wins = sides.sum(axis=1), sides[:, 1]
+        mirrors = np.bincount((p2.astype(np.int16) + 1) * (p1 == p2), minlength=CHARACTER_COUNT + 1)[1:]
+        return matches - mirrors, matches, wins
+
+    @staticmethod
+    def matchup_matrix(columns: typing.Dict[str, np.ndarray]) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Matches, character 1 wins and character 2 wins as 36 x 36 matrices indexed [character_1_id,
+        character_2_id], filled above the diagonal and on it. In a mirror match the p1 side is character 1.
+        """
+        p1, p2 = columns["p1_character_id"].astype(np.int16), columns["p2_character_id"].astype(np.int16)
+        winner = columns["winner"]
+        size = CHARACTER_COUNT * CHARACTER_COUNT
+        # Replays missing a character go to the extra pair `size`, dropped below
+        pair = np.where((p1 >= 0) & (p2 >= 0), np.minimum(p1, p2) * CHARACTER_COUNT + np.maximum(p1, p2), size)
+        # 0 when character 1 won, 1 when character 2 did, 2 for no winner. Character 1 is p1 unless p1 > p2
+        outcome = np.where(winner < 0, 2, winner != (p1 > p2))
+        counts = np.bincount(pair * 3 + outcome, minlength=(size + 1) * 3).reshape(-1, 3)[:size]
+        shape = (CHARACTER_COUNT, CHARACTER_COUNT)
+        return counts.sum(axis=1).reshape(shape), counts[:, 0].reshape(shape), counts[:, 1].reshape(shape)
+
+    @staticmethod
+    def pairs(matches: np.ndarray, character_id: int = None) -> typing.List[typing.Tuple[int, int]]:
+        """The pairs played, most played first, ties by character ids."""
+        character_1, character_2 = np.nonzero(matches)
+        if character_id:
+            involved = (character_1 == character_id) | (character_2 == character_id)
+            character_1, character_2 = character_1[involved], character_2[involved]
+        order = np.lexsort((character_2, character_1, -matches[character_1, character_2]))
+        return [(int(character_1[i]), int(character_2[i])) for i in order]
+
+    def total_replays(self, columns: typing.Dict[str, np.ndarray] = None) -> int:
+        return len(self.snapshot(columns)["replay_id"])
+
+    def total_players(self, columns: typing.Dict[str, np.ndarray] = None) -> int:
+        recorders = self.snapshot(columns)["recorder_steamid64"]
+        return len(np.unique(recorders[recorders >= 0]))
+
+    def total_replays_per_character(self, columns: typing.Dict[str, np.ndarray] = None) -> typing.List[CharacterTotal]:
+        replays, _, _ = self.character_counts(self.snapshot(columns))
+        order = np.lexsort((np.arange(CHARACTER_COUNT), -replays))
+        return [CharacterTotal(int(replays[i]), int(i)) for i in order if replays[i] > 0]
+
+    def character_usage(self, columns: typing.Dict[str, np.ndarray] = None, start: date = None,
+                        end: date = None) -> typing.List[CharacterUsage]:
+        _, matches, wins = self.character_counts(self.snapshot(columns, start, end))
+        order = np.lexsort((np.arange(CHARACTER_COUNT), -matches))
+        return [CharacterUsage(int(i), int(matches[i]), percentage(wins[i], matches[i]))
+                for i in order if matches[i] > 0]
+
+    def matchup_statistics(self, columns: typing.Dict[str, np.ndarray] = None, character_id: int = None,
+                           start: date = None, end: date = None) -> typing.List[MatchupStatistics]:
+        matches, character_1_wins, character_2_wins = self.matchup_matrix(self.snapshot(columns, start, end))
+        return [MatchupStatistics(c1, c2, int(matches[c1, c2]), percentage(character_1_wins[c1, c2], matches[c1, c2]),
+                                  percentage(character_2_wins[c1, c2], matches[c1, c2]))
+                for c1, c2 in self.pairs(matches, character_id)]
+
+    def matchup_rarity(self, columns: typing.Dict[str, np.ndarray] = None) -> typing.List[MatchupRarity]:
+        matches, _, _ = self.matchup_matrix(self.snapshot(columns))
+        total = int(matches.sum())
+        # Least played first, the reverse of pairs()
+        character_1, character_2 = np.nonzero(matches)
+        order = np.lexsort((character_2, character_1, matches[character_1, character_2]))
+        return [MatchupRarity(int(character_1[i]), int(character_2[i]), int(matches[character_1[i], character_2[i]]),
+                              percentage(matches[character_1[i], character_2[i]], total))
+                for i in order]
+
+    def replays_per_hour(self, columns: typing.Dict[str, np.ndarray] = None) -> typing.List[int]:
+        recorded_at = self.snapshot(columns)["recorded_at"]
+        # Floor division keeps the hour right before 1970 too
+        hours = recorded_at[recorded_at != NULL_TIME] // MICROSECONDS_PER_HOUR % 24
+        return np.bincount(hours, minlength=24).tolist()
+
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values())
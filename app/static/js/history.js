@@ -98,7 +98,9 @@ window.addEventListener("popstate", (event) => {
     if (event.state) {
         const replayContainer = document.getElementById('replaysContainer')
         replayContainer.replaceChildren();
-        replayLoader.maxPage = event.state.maxPage;
+        replayLoader.maxPage = event.state.max_page;
+        replayLoader.cursor = event.state.next_cursor;
+        replayLoader.done = !replayLoader.cursor;
         replayLoader.replayString = new URLSearchParams(window.location.search);
         // Convert page to a number before adding 1
         replayLoader.page = Number(replayLoader.replayString.get('page')) + 1 || 1;
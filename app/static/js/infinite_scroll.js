@@ -2,6 +2,9 @@
 const replayLoader = {
     page: new URLSearchParams(window.location.search).get('page') || 1,
     maxPage: Infinity,
+    // Keyset cursor of the next page, deep pages cost the same as the first one
+    cursor: null,
+    done: false,
     loading: false,
     replayString: new URLSearchParams(window.location.search),
 
@@ -9,29 +12,35 @@ const replayLoader = {
 
         if (this.loading) return;
 
-        if (this.page > this.maxPage || params.get('page') > this.maxPage) {
-            this.page = 1;
-            return;
-        }
-
-        this.loading = true;
-
         if (params.toString() !== this.replayString.toString()) {
             this.page = 1;
             this.maxPage = Infinity;
+            this.cursor = null;
+            this.done = false;
             params.set('page', '1');
             this.replayString = new URLSearchParams(params);
         }
 
+        if (this.done) return;
+
+        this.loading = true;
+
+        // The first page goes by page number (links may carry one), the rest follow the cursor
+        const request = new URLSearchParams(params);
+        if (this.cursor) {
+            request.delete('page');
+            request.set('cursor', this.cursor);
+        }
+
         $('#loading').show();
 
         try {
 
-            const response = await fetch(`api/replay-sets?${params.toString()}`);
+            const response = await fetch(`api/replay-sets?${request.toString()}`);
             if (!response.ok) {
                 if (response.status == 404) {
                     // block the pagination
-                    this.maxPage = 0;
+                    this.done = true;
                     return;
                 }
                 console.error('Error: Response not OK', response.statusText);
@@ -40,20 +49,15 @@ const replayLoader = {
 
             const data = await response.json();
 
-            if (data.replays.length === 0) {
-                this.maxPage = this.page - 1;
-            } else {
-                data.replays.forEach(replay => {
-                    $('#replaysContainer').append(this.renderReplay(replay));
-                });
-            }
-
-            this.maxPage = data.max_page;
+            data.replays.forEach(replay => {
+                $('#replaysContainer').append(this.renderReplay(replay));
+            });
 
-            // do not block pagination if only one page is available
-            if (this.maxPage === 1) {
-                this.maxPage = Infinity;
+            if (data.max_page !== undefined) {
+                this.maxPage = data.max_page;
             }
+            this.cursor = data.next_cursor;
+            this.done = !this.cursor;
             // check if it's just not page for a parameter
             // if (Array.from(this.replayString.keys()).length !== 1)  {
             //    window.history.pushState(data, '', '?' + this.replayString.toString());
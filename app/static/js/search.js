@@ -13,8 +13,16 @@ const replayManager = {
 
     handleAnchorClick: function(event, icon, player, dropdownId) {
         event.preventDefault(); // Prevent the default link behavior
-        const characterId = icon.id;
-        this.replayString.set(`${player}_character_id`, characterId);
+        const characterId = String(icon.id);
+        const parameter = `${player}_character_id`;
+        // Ctrl/Cmd-click adds the character to those already picked, one request searches for any of them
+        if (event.ctrlKey || event.metaKey) {
+            if (!this.replayString.getAll(parameter).includes(characterId)) {
+                this.replayString.append(parameter, characterId);
+            }
+        } else {
+            this.replayString.set(parameter, characterId);
+        }
         this.replayString.set('page', '1');
 
         this.loadNewReplays();
@@ -28,7 +36,10 @@ const replayManager = {
         const currentValue = fieldInput;
         if (currentValue !== this.previousValues[parameter]) {
             if (currentValue) {
-                this.replayString.set(parameter, currentValue);
+                // Comma separated names search for any of them
+                this.replayString.delete(parameter);
+                currentValue.split(',').map(name => name.trim()).filter(Boolean)
+                    .forEach(name => this.replayString.append(parameter, name));
                 this.loadNewReplays();
             } else {
                 this.replayString.delete(parameter);
@@ -55,6 +66,36 @@ const replayManager = {
         }
     },
 
+    suggestTimer: null,
+
+    suggestPlayers: function(fieldInput) {
+        // Debounced, the last comma separated name is the one being typed
+        clearTimeout(this.suggestTimer);
+        this.suggestTimer = setTimeout(async () => {
+            const names = fieldInput.value.split(',');
+            const prefix = names.pop().trim();
+            const datalist = document.getElementById('playerSuggestions');
+            if (!prefix) {
+                datalist.replaceChildren();
+                return;
+            }
+            try {
+                const response = await fetch(`/api/players/suggest?q=${encodeURIComponent(prefix)}`);
+                if (!response.ok) return;
+                const suggestions = await response.json();
+                const typed = names.map(name => name.trim() + ', ').join('');
+                datalist.replaceChildren(...suggestions.map(suggestion => {
+                    const option = document.createElement('option');
+                    option.value = typed + suggestion.name;
+                    option.label = `${suggestion.replays} replays`;
+                    return option;
+                }));
+            } catch (error) {
+                console.error('Error fetching player suggestions', error);
+            }
+        }, 150);
+    },
+
     setupSearchFields: function() {
         if (window.location.href.includes('upload')) return;
         const playerInput = document.getElementById('playerInput');
@@ -74,10 +115,12 @@ const replayManager = {
 
             const startDate = picker.startDate.format('MMMM D, YYYY');
             const endDate = picker.endDate.format('MMMM D, YYYY');
-            let dateRange = JSON.stringify([picker.startDate.format('DD/MM/YYYY'),
-                                                  picker.endDate.format('DD/MM/YYYY')]);
+            // Whole days, both ends included, in the browser's timezone
+            let dateRange = JSON.stringify([picker.startDate.format('YYYY-MM-DD'),
+                                                  picker.endDate.format('YYYY-MM-DD')]);
             if (self.previousValues['recorded_at'] !== dateRange) {
                 self.replayString.set('recorded_at', dateRange);
+                self.replayString.set('tz', Intl.DateTimeFormat().resolvedOptions().timeZone);
                 self.previousValues.recorded_at = dateRange
                 self.loadNewReplays();
                 $(this).val(startDate + ' - ' + endDate);
@@ -86,6 +129,7 @@ const replayManager = {
 
         dateInput.on('cancel.daterangepicker', function() {
             self.replayString.delete('recorded_at');
+            self.replayString.delete('tz');
             self.previousValues.recorded_at = null;
             self.loadNewReplays();
             $(this).val('');
@@ -105,6 +149,9 @@ const replayManager = {
             self.setupFieldEvent(event, playerInput2, 'p2');
         });
 
+        playerInput.addEventListener('input', () => self.suggestPlayers(playerInput));
+        playerInput2.addEventListener('input', () => self.suggestPlayers(playerInput2));
+
         playerInput.addEventListener('blur', function() {
             self.handleFieldInputs(playerInput.value, 'p1');
         });
@@ -1,13 +1,16 @@
 document.addEventListener('DOMContentLoaded', async function() {
     try {
-        await setTotalReplays();
-        await setTotalPlayers();
-        await setPeakHours();
-        await getCharacterData();
-        await getReplayTimestamps();
-        await initializeIcons();
-        await matchupRarity();
-        await loadMatchups(); // No need to await if it doesn’t return a promise
+        // Every section comes from one snapshot, so the totals and breakdowns agree with each other
+        const bundle = await fetchData('/api/replay/stats-bundle', 'Error fetching stats: ');
+        ICONS = bundle.character_icons;
+        setTotalReplays(bundle.total_replays);
+        setTotalPlayers(bundle.total_players);
+        setPeakHours();
+        getCharacterData(bundle.total_per_character);
+        getReplayTimestamps(bundle.replays_per_hour);
+        matchupRarity(bundle.matchup_rarity);
+        loadMatchups(bundle.matchup_stats);
+        await loadActivity(90);
     } catch (error) {
         console.error("An error occurred during initialization:", error);
     }
@@ -28,19 +31,17 @@ async function fetchData(url, error_message) {
     }
 }
 
-async function setTotalReplays() {
-    const totalReplays = await fetchData('/api/replay/total', 'Error fetching total players: ');
+function setTotalReplays(totalReplays) {
     const totalReplayElement = document.querySelector('#totalReplays h3');
     totalReplayElement.textContent = `Total Replays: ${totalReplays}`;
 }
 
-async function setPeakHours() {
+function setPeakHours() {
     const totalReplayElement = document.querySelector('#peakHours h5');
     totalReplayElement.textContent = `Peak Hours`;
 }
 
-async function matchupRarity() {
-    const matchupRarity = await fetchData('/api/replay/matchup-rarity', 'Error fetching matchup rarity: ')
+function matchupRarity(matchupRarity) {
     const mostCommon = matchupRarity[matchupRarity.length - 1];
     const leastCommon = matchupRarity[0];
 
@@ -109,16 +110,8 @@ async function matchupRarity() {
 
 }
 
-async function getReplayTimestamps() {
-    const timestamps = await fetchData('api/replay-timestamps', 'Error fetching timestamps: ');
-    const hourCounts = Array(24).fill(0);
-
-    timestamps.forEach(timestamp => {
-        const date = new Date(timestamp);
-        const hour = date.getUTCHours();
-        hourCounts[hour]++;
-    });
-
+function getReplayTimestamps(hourCounts) {
+    // Replays per UTC hour, counted by the server instead of shipping every timestamp
     const labels = Array.from({length: 24}, (_, i) => `${i}:00`);  // ["0:00", "1:00", ..., "23:00"]
 
     const data = {
@@ -170,9 +163,38 @@ async function getReplayTimestamps() {
     new Chart(ctx, config);
 }
 
-async function getCharacterData() {
-    const totalCh = await fetchData('api/replay/total-per-character', 'Error fetching total per character: ');
+async function loadActivity(days) {
+    // Daily counts for the last `days` days, bucketed on the browser's own calendar
+    const from = new Date(Date.now() - days * 24 * 60 * 60 * 1000).toISOString().slice(0, 10);
+    const tz = Intl.DateTimeFormat().resolvedOptions().timeZone;
+    const params = new URLSearchParams({bucket: 'day', from: from, tz: tz});
+    const activity = await fetchData(`/api/replay/activity?${params}`, 'Error fetching activity: ');
+    if (!activity) return;
+
+    new Chart(document.getElementById('activityChart'), {
+        type: 'line',
+        data: {
+            labels: activity.buckets.map(bucket => bucket.start.slice(0, 10)),
+            datasets: [{
+                label: 'Replays',
+                data: activity.buckets.map(bucket => bucket.count),
+                backgroundColor: 'rgba(70, 70, 70, 0.9)',
+                borderColor: 'rgba(70, 70, 70, 1)',
+                borderWidth: 1
+            }]
+        },
+        options: {
+            maintainAspectRatio: false,
+            scales: {
+                x: {grid: {color: "black"}, ticks: {color: "black"}},
+                y: {beginAtZero: true, grid: {color: "black"}, ticks: {color: "black"}}
+            },
+            plugins: {legend: {display: false}}
+        }
+    });
+}
 
+function getCharacterData(totalCh) {
     const sortedData = totalCh.sort((a, b) => b.total - a.total);
 
     // Function to get labels and values based on the number of entries to display
@@ -246,20 +268,13 @@ async function getCharacterData() {
     });
 }
 
-async function setTotalPlayers() {
-    const totalPlayers = await fetchData('/api/replay/total-players', 'Error fetching total unique players:');
+function setTotalPlayers(totalPlayers) {
     const totalPlayersElement = document.querySelector('#totalPlayers h3');
-    totalPlayersElement.textContent = `Unique Players: ${totalPlayers.total}`;
+    totalPlayersElement.textContent = `Unique Players: ${totalPlayers}`;
 }
 
-async function initializeIcons() {
-    ICONS = await fetchData('/api/character-icons', 'Error fetching character icon:');
-}
-
-async function loadMatchups() {
-    const data = await fetchData('api/replay/character-matchup-stats', 'Error fetching replays')
+function loadMatchups(data) {
     populateMatchupList(data);
-
 }
 
 function fetchCharacterIcons(iconID) {
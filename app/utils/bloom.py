@@ -0,0 +1,61 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    Probabilistic set membership, `key in bloom` is either definitely False or probably True.
+
+    Sized up front from the expected number of keys and the false positive rate wanted at that many keys.
+    """
+    __slots__ = ("bits", "size", "hashes", "capacity", "error_rate", "count")
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Replay filenames are already hex SHA-256 digests, so slice them instead of hashing again
+        try:
+            first, second = int(key[:12], 16), int(key[12:24], 16)
+        except ValueError:
+            digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+            first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+        second |= 1  # Double hashing needs a step that is never 0
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def memory(self) -> int:
+        return len(self.bits)
+
+    @property
+    def expected_error_rate(self) -> float:
+        """False positive rate at the current number of keys."""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+    def stats(self) -> dict:
+        return {
+            "keys": self.count,
+            "capacity": self.capacity,
+            "memory_bytes": self.memory,
+            "hashes": self.hashes,
+            "configured_error_rate": self.error_rate,
+            "expected_error_rate": round(self.expected_error_rate, 6),
+        }
@@ -1,3 +1,6 @@
+# Every replay is a fixed-size record, the "replay_inputs" region starts at 0x8D0 and is 0xF730 bytes long
+REPLAY_SIZE = 0x8D0 + 0xF730
+
 CHARACTERS = {
     0: "Ragna",
     1: "Jin",
@@ -0,0 +1,118 @@
+import threading
+import time
+import typing
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from app.utils.date_range import DateRange
+
+
+class CountCache:
+    """
+    Row counts of replay filters, keyed by the filter alone so every page of an infinite scroll shares one entry.
+
+    Writes invalidate only the entries whose filter matches a written row, everything else stays cached. A count
+    computed while a write happened is not stored, since it may predate the write. Entries also expire after `ttl`
+    seconds, which bounds how stale a count can get from writes made by other processes. Safe to share between
+    request threads and the spool writer.
+    """
+    __slots__ = ("entries", "capacity", "ttl", "generation", "hits", "misses", "invalidations", "saved", "lock")
+
+    def __init__(self, capacity=1000, ttl=60.0):
+        # key -> (params, total, cost of computing it, time stored)
+        self.entries: "OrderedDict[tuple, tuple[Dict[str, Any], int, float, float]]" = OrderedDict()
+        self.capacity = capacity
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved = 0.0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _canonical(value):
+        if isinstance(value, str):
+            return value.strip().lower()
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, frozenset):
+            return ("any", *sorted((CountCache._canonical(element) for element in value), key=repr))
+        if isinstance(value, DateRange):
+            # Half-open, unlike a between pair of the same dates
+            return "[)", value.start.isoformat(), value.end.isoformat()
+        if isinstance(value, (list, tuple)):
+            return tuple(CountCache._canonical(element) for element in value)
+        return value
+
+    @staticmethod
+    def key(params: Optional[Dict[str, Any]]) -> tuple:
+        """Filters that build the same predicates share a key, p2=x searches both sides exactly like p1=x."""
+        items = []
+        for name, value in (params or {}).items():
+            if name.startswith("p"):
+                name = name.replace("2", "1")
+            items.append((name, CountCache._canonical(value)))
+        return tuple(sorted(items, key=repr))
+
+    def get(self, key: tuple) -> Optional[int]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.monotonic() - entry[3] > self.ttl:
+                self.entries.pop(key, None)
+                self.misses += 1
+                return
+
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def record_hit(self, key: tuple, elapsed: float) -> None:
+        """Count a hit, the time saved is what computing the count cost minus what the query cost without it."""
+        with self.lock:
+            entry = self.entries.get(key)
+            self.hits += 1
+            if entry is not None:
+                self.saved += max(0.0, entry[2] - elapsed)
+
+    def set(self, key: tuple, params: Dict[str, Any], total: int, cost: float, generation: int) -> None:
+        with self.lock:
+            # Something was written since the count started, it may or may not include the write
+            if generation != self.generation:
+                return
+
+            self.entries[key] = (dict(params or {}), total, cost, time.monotonic())
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, rows: typing.Iterable[Any], matches: Callable[[Dict[str, Any], Any], bool]) -> int:
+        """Drop the entries whose filter matches any of the written rows, returns how many were dropped."""
+        rows = list(rows)
+        with self.lock:
+            self.generation += 1
+            stale = [key for key, (params, _, _, _) in self.entries.items()
+                     if any(matches(params, row) for row in rows)]
+            for key in stale:
+                del self.entries[key]
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "avg_saved_ms": round(self.saved / self.hits * 1000, 3) if self.hits else 0.0,
+                "total_saved_ms": round(self.saved * 1000, 3),
+            }
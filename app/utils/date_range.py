@@ -0,0 +1,88 @@
+import typing
+from datetime import datetime, timezone
+
+import pytz
+from dateutil import parser
+from dateutil.relativedelta import relativedelta
+
+# Coarsest to finest, a date search covers one step of its granularity
+GRANULARITIES = ("year", "month", "day", "hour", "minute", "second")
+
+# Two defaults that differ in every field, a field parses the same under both only if the input gave it
+_DEFAULTS = (datetime(2000, 1, 1, 0, 0, 0), datetime(2001, 2, 2, 1, 1, 1))
+_FLOOR = {"month": 1, "day": 1, "hour": 0, "minute": 0, "second": 0}
+
+
+class DateRange(typing.NamedTuple):
+    """recorded_at >= start AND recorded_at < end, in UTC. Half-open so adjacent ranges never share a row."""
+    start: datetime
+    end: datetime
+
+    def contains(self, value: datetime) -> bool:
+        return self.start <= value < self.end
+
+
+def parse_with_granularity(text: str) -> tuple[datetime, str]:
+    """
+    Parse a written date and tell how precise it was: "2024" is a year, "May 2024" a month, "2024-05-01 10:30" a
+    minute. The fields given have to run from the year down, "10:30" or "May 5" alone are ambiguous.
+    """
+    try:
+        first, second = (parser.parse(text, default=default) for default in _DEFAULTS)
+    except (ValueError, OverflowError) as e:
+        raise ValueError(f"Invalid date `{text}`") from e
+
+    given = [getattr(first, field) == getattr(second, field) for field in GRANULARITIES]
+    precision = given.index(False) if False in given else len(given)
+    if precision == 0 or any(given[precision:]):
+        raise ValueError(f"Date `{text}` needs every field from the year down to its finest one")
+    return first, GRANULARITIES[precision - 1]
+
+
+def floor(value: datetime, granularity: str) -> datetime:
+    fields = GRANULARITIES[GRANULARITIES.index(granularity) + 1:]
+    return value.replace(microsecond=0, **{field: _FLOOR[field] for field in fields})
+
+
+def to_utc(value: datetime, zone: pytz.BaseTzInfo) -> datetime:
+    # Naive wall clock times are read in the client's zone, pytz picks the right offset on either side of DST
+    if value.tzinfo is None:
+        value = zone.localize(value)
+    return value.astimezone(timezone.utc)
+
+
+def date_range(value: typing.Union[str, datetime, typing.Sequence[typing.Union[str, datetime]]],
+               granularity: str = None, tz: str = None) -> DateRange:
+    """
+    The half-open UTC range a date search covers. A single date covers one step of its granularity, a pair covers
+    from the start of the first date's step to the end of the last's, so ["2024-05-01", "2024-05-03"] includes the
+    3rd. The granularity is inferred from how precisely each date is written unless given, datetime objects default
+    to the second. Dates without an offset are read in `tz`, UTC by default.
+    """
+    if granularity is not None and granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity `{granularity}`, expected one of {', '.join(GRANULARITIES)}")
+    try:
+        zone = pytz.timezone(tz or "UTC")
+    except pytz.UnknownTimeZoneError as e:
+        raise ValueError(f"Unknown timezone `{tz}`") from e
+
+    if isinstance(value, (str, datetime)):
+        value = (value, value)
+    if len(value) != 2:
+        raise ValueError("A date range needs a start and an end")
+
+    bounds = []
+    for element in value:
+        if isinstance(element, datetime):
+            bounds.append((element, granularity or "second"))
+        else:
+            parsed, precision = parse_with_granularity(str(element))
+            bounds.append((parsed, granularity or precision))
+
+    (start, start_granularity), (end, end_granularity) = bounds
+    # The end's step is added in wall clock time, a day is still a day across a DST change
+    start = to_utc(floor(start, start_granularity), zone)
+    end = to_utc(floor(end, end_granularity) + relativedelta(**{f"{end_granularity}s": 1}), zone)
+    if end <= start:
+        raise ValueError("A date range has to end after it starts")
+    return DateRange(start, end)
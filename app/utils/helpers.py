@@ -1,6 +1,8 @@
 import os
 import glob
-import struct
+import json
+import base64
+import binascii
 import hashlib
 import fnmatch
 import typing
@@ -16,6 +18,7 @@ import flask
 from flask import request, abort, current_app, Flask
 
 from app.models.replay import Replay
+from app.utils import replay_parser
 from app.utils.cache import cache
 from app.utils.constants import CHARACTERS
 
@@ -152,6 +155,42 @@ def chunks(lst, n):
         yield lst[i:i + n]
 
 
+def read_records(stream: typing.BinaryIO, size: int) -> typing.Generator[bytes, None, None]:
+    """Yield successive size-byte records from a stream as they arrive, the last one may be short."""
+    buffer = bytearray()
+    while True:
+        chunk = stream.read(size - len(buffer))
+        if not chunk:
+            break
+        buffer += chunk
+        if len(buffer) == size:
+            yield bytes(buffer)
+            buffer.clear()
+
+    if buffer:
+        yield bytes(buffer)
+
+
+def encode_cursor(recorded_at: datetime, replay_id: int) -> str:
+    """Opaque keyset cursor pointing just past the given row, in (recorded_at, replay_id) descending order."""
+    data = json.dumps([recorded_at.isoformat(), replay_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverse of encode_cursor, raises ValueError for anything that isn't a cursor we handed out."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        recorded_at, replay_id = json.loads(data)
+        recorded_at = datetime.fromisoformat(recorded_at)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+
+    if not isinstance(replay_id, int) or recorded_at.tzinfo is None:
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return recorded_at, replay_id
+
+
 def friendly_file(replay: typing.Type[Replay]) -> tuple[str, str]:
     p1 = replay.p1
     p2 = replay.p2
@@ -263,6 +302,11 @@ def get_character_icon(search: str) -> Union[bytes, str]:
     return icon
 
 
+def character_icons() -> typing.List[dict]:
+    return [{"id": key, "path": f"/static/img/{get_character_icon(val)}", "name": val}
+            for key, val in CHARACTERS.items()]
+
+
 def assign_icons(replay: dict):
     replay["p1icon"] = get_character_icon(CHARACTERS[replay["p1_character_id"]])
     replay["p2icon"] = get_character_icon(CHARACTERS[replay["p2_character_id"]])
@@ -297,50 +341,26 @@ def require_api_key(func):
 
 
 def parse_replay_data(data: typing.Union[bytearray, bytes]) -> typing.Dict:
-    bytes_metadata = {}
-
+    # Unpack every header field as raw bytes with the precompiled layout
+    bytes_metadata = dict(zip((name for name, _, _ in replay_parser.HEADER_FIELDS),
+                              replay_parser.RAW_HEADER.unpack_from(data)))
     bytes_metadata["replay"] = data
-
-    # Extract and unpack "recorded_at" as a string of 24 bytes
-    bytes_metadata["recorded_at"] = struct.unpack_from("24s", data, 0x38)[0]
-
-    # Extract and unpack "winner" as a single byte (unsigned char)
-    bytes_metadata["winner"] = struct.unpack_from("B", data, 0x98)[0]
-
-    # Extract and unpack "p1" and "p2" as sequence of 36 bytes each
-    bytes_metadata["p1"] = struct.unpack_from("36s", data, 0xA4)[0]
-    bytes_metadata["p2"] = struct.unpack_from("36s", data, 0x16E)[0]
-
-    # Extract and unpack "p1_character_id" and "p2_character_id" as  a 4-byte sequence
-    bytes_metadata["p1_character_id"] = struct.unpack_from("4s", data, 0x230)[0]
-    bytes_metadata["p2_character_id"] = struct.unpack_from("4s", data, 0x234)[0]
-    # Extract and unpack "recorder" as a string of 36 bytes
-    bytes_metadata["recorder"] = struct.unpack_from("36s", data, 0x240)[0]
-
-    # Extract and unpack "p1_steamid64", "p2_steamid64", and "recorder_steamid64" as 8-byte sequence
-    bytes_metadata["p1_steamid64"] = struct.unpack_from("8s", data, 0x9C)[0]
-    bytes_metadata["p2_steamid64"] = struct.unpack_from("8s", data, 0x166)[0]
-    bytes_metadata["recorder_steamid64"] = struct.unpack_from("8s", data, 0x238)[0]
-
-    # Extract and unpack "replay_inputs" as a sequence of 63280 bytes
-    bytes_metadata["replay_inputs"] = struct.unpack_from(f"{0xF730}s", data, 0x8D0)[0]
+    # "winner" is a single byte (unsigned char)
+    bytes_metadata["winner"] = bytes_metadata["winner"][0]
+    # View over the 63280 bytes of "replay_inputs" rather than a copy
+    bytes_metadata["replay_inputs"] = memoryview(data)[replay_parser.INPUTS_OFFSET:]
 
     return bytes_metadata
 
 
 def get_hashed_filename(data: typing.Union[bytearray, bytes, dict]) -> str:
     if not isinstance(data, dict):
-        data = parse_replay_data(data)
+        return replay_parser.hash_filename(data)
 
-    bytes_to_hash = (data["p1_character_id"] +
-                     data["p2_character_id"] +
-                     data["p1_steamid64"] +
-                     data["p2_steamid64"] +
-                     data["replay_inputs"])
-
-    # Hashing with SHA-256
+    # Hashing with SHA-256, fed piece by piece instead of concatenating the fields
     sha256 = hashlib.sha256()
-    sha256.update(bytes_to_hash)
+    for key in ("p1_character_id", "p2_character_id", "p1_steamid64", "p2_steamid64", "replay_inputs"):
+        sha256.update(data[key])
     hashed_data = sha256.hexdigest()
 
     # Truncate to keep the filename reasonably short
@@ -351,28 +371,19 @@ def get_hashed_filename(data: typing.Union[bytearray, bytes, dict]) -> str:
 
 def decode_replay(data: dict) -> None:
     data["filename"] = get_hashed_filename(data)
-    data["recorded_at"] = data["recorded_at"].decode("utf-8")
-    data["p1"] = data["p1"].decode("utf-16").split("\x00")[0]
-    data["p2"] = data["p2"].decode("utf-16").split("\x00")[0]
+    data["recorded_at"] = replay_parser.parse_recorded_at(data["recorded_at"])
+    data["p1"] = replay_parser.decode_name(data["p1"])
+    data["p2"] = replay_parser.decode_name(data["p2"])
     data["p1_character_id"] = int.from_bytes(data["p1_character_id"], byteorder="little")
     data["p2_character_id"] = int.from_bytes(data["p2_character_id"], byteorder="little")
-    data["recorder"] = data["recorder"].decode("utf-16").split("\x00")[0]
-
-    try:
-        data["recorded_at"] = datetime.strptime(data["recorded_at"], "%a, %d %b %Y %H:%M:%S %Z")
-    except ValueError:
-        data["recorded_at"] = datetime.strptime(data["recorded_at"], "%a %b %d %H:%M:%S %Y")
-
+    data["recorder"] = replay_parser.decode_name(data["recorder"])
     data["p1_steamid64"] = int.from_bytes(data["p1_steamid64"], byteorder="little")
     data["p2_steamid64"] = int.from_bytes(data["p2_steamid64"], byteorder="little")
     data["recorder_steamid64"] = int.from_bytes(data["recorder_steamid64"], byteorder="little")
 
 
 def read_data(data: typing.Union[bytearray, bytes]) -> typing.Dict:
-    data = parse_replay_data(data)
-    data["filename"] = get_hashed_filename(data)
-    decode_replay(data)
-    return data
+    return replay_parser.parse_replay(data)
 
 
 def process_network_response(response: flask.wrappers.Response) -> Union[Union[dict[str, str], dict[str, str]], Any]:
@@ -0,0 +1,91 @@
+import bisect
+import heapq
+import threading
+import typing
+from array import array
+
+# Separates the parts of a key, sorts below every character a name can hold so a prefix range never cuts a name
+SEPARATOR = "\x00"
+
+
+class NameIndex:
+    """
+    Prefix search over distinct player names, each with its steamid64 and how many replays it played.
+
+    Kept as one sorted list of "lowered name, steamid64, name" keys and a parallel array of counts, a prefix is a
+    bisect away and a name costs its string plus 12 bytes. Names used under several steam ids, or one steam id
+    under several casings, are separate entries. The keys and counts change together under a lock, a suggestion
+    never sees one without the other.
+    """
+    __slots__ = ("keys", "counts", "max_scan", "lock")
+
+    def __init__(self, max_scan=10000):
+        self.keys: typing.List[str] = []
+        self.counts = array("I")
+        # A prefix matching more names than this ranks only the first max_scan of them, in name order
+        self.max_scan = max_scan
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, steamid64: typing.Optional[int]) -> str:
+        return SEPARATOR.join((name.lower(), "" if steamid64 is None else str(steamid64), name))
+
+    @classmethod
+    def from_counts(cls, rows: typing.Iterable[tuple[str, typing.Optional[int], int]], **kwargs) -> "NameIndex":
+        """Build from (name, steamid64, replays) rows in one sort, rather than inserting them one at a time."""
+        index = cls(**kwargs)
+        merged = {}
+        for name, steamid64, count in rows:
+            if name:
+                key = cls._key(name, steamid64)
+                merged[key] = merged.get(key, 0) + count
+        index.keys = sorted(merged)
+        index.counts = array("I", (merged[key] for key in index.keys))
+        return index
+
+    def add(self, name: str, steamid64: typing.Optional[int], count=1) -> None:
+        if not name:
+            return
+        key = self._key(name, steamid64)
+        with self.lock:
+            position = bisect.bisect_left(self.keys, key)
+            if position < len(self.keys) and self.keys[position] == key:
+                self.counts[position] += count
+            else:
+                self.keys.insert(position, key)
+                self.counts.insert(position, count)
+
+    def remove(self, name: str, steamid64: typing.Optional[int], count=1) -> None:
+        if not name:
+            return
+        key = self._key(name, steamid64)
+        with self.lock:
+            position = bisect.bisect_left(self.keys, key)
+            if position == len(self.keys) or self.keys[position] != key:
+                return
+            if self.counts[position] > count:
+                self.counts[position] -= count
+            else:
+                del self.keys[position]
+                del self.counts[position]
+
+    def suggest(self, prefix: str, limit=10) -> typing.List[dict]:
+        """The names starting with `prefix`, case-insensitively, most played first."""
+        prefix = prefix.strip().lower()
+        if not prefix or limit < 1:
+            return []
+        with self.lock:
+            start = bisect.bisect_left(self.keys, prefix)
+            end = min(bisect.bisect_left(self.keys, prefix + "\U0010ffff", start), start + self.max_scan)
+
+            best = [(self.keys[position], self.counts[position])
+                    for position in heapq.nlargest(limit, range(start, end), key=self.counts.__getitem__)]
+        suggestions = []
+        for key, count in best:
+            _, steamid64, name = key.split(SEPARATOR, 2)
+            suggestions.append({"name": name, "steamid64": int(steamid64) if steamid64 else None,
+                                "replays": count})
+        return suggestions
+
+    def __len__(self):
+        return len(self.keys)
@@ -0,0 +1,75 @@
+import struct
+import typing
+import zlib
+
+import numpy as np
+
+from app.utils.constants import REPLAY_SIZE
+from app.utils.replay_parser import INPUTS_OFFSET, INPUTS_SIZE
+
+# Encoded blobs start with the magic, the delta stride and the length of the inputs before their zero tail was cut
+ENCODED_HEADER = struct.Struct("<4sBI")
+MAGIC = b"BBRZ"
+# Bytes per frame of inputs, each frame is XORed with the one before so held and idle inputs become runs of zeros
+DELTA_STRIDE = 4
+
+Blob = typing.Union[bytes, bytearray, memoryview]
+
+
+def is_encoded(data: Blob) -> bool:
+    """Raw replays are always exactly REPLAY_SIZE bytes, an encoded one is always smaller."""
+    return len(data) != REPLAY_SIZE
+
+
+def _delta(inputs: np.ndarray, stride: int) -> np.ndarray:
+    frames = inputs.reshape(-1, stride)
+    delta = frames.copy()
+    delta[1:] ^= frames[:-1]
+    return delta
+
+
+def _undelta(delta: np.ndarray, stride: int) -> np.ndarray:
+    return np.bitwise_xor.accumulate(delta.reshape(-1, stride), axis=0)
+
+
+def encode(data: Blob, level=6) -> Blob:
+    """
+    Compress a raw replay for storage. The header is kept as is, the inputs have their zero padding cut and are
+    delta coded frame to frame, then everything goes through zlib.
+
+    A level of 0 is a raw passthrough, and so is any replay that would not get smaller. Already encoded blobs are
+    returned unchanged, so encoding twice is harmless.
+    """
+    if not level or is_encoded(data):
+        return data
+
+    inputs = np.frombuffer(data, dtype=np.uint8, count=INPUTS_SIZE, offset=INPUTS_OFFSET)
+    nonzero = np.flatnonzero(inputs)
+    # Keep whole frames so the delta lines up
+    length = 0 if not len(nonzero) else -(-(int(nonzero[-1]) + 1) // DELTA_STRIDE) * DELTA_STRIDE
+
+    compressor = zlib.compressobj(level)
+    payload = compressor.compress(data[:INPUTS_OFFSET])
+    payload += compressor.compress(_delta(inputs[:length], DELTA_STRIDE).tobytes())
+    payload += compressor.flush()
+
+    encoded = ENCODED_HEADER.pack(MAGIC, DELTA_STRIDE, length) + payload
+    return encoded if len(encoded) < REPLAY_SIZE else data
+
+
+def decode(data: Blob) -> bytes:
+    """Inverse of encode, raw replays pass straight through."""
+    if not is_encoded(data):
+        return data if isinstance(data, bytes) else bytes(data)
+
+    magic, stride, length = ENCODED_HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not an encoded replay")
+
+    payload = zlib.decompress(memoryview(data)[ENCODED_HEADER.size:])
+    replay = bytearray(REPLAY_SIZE)
+    replay[:INPUTS_OFFSET] = payload[:INPUTS_OFFSET]
+    if length:
+        delta = np.frombuffer(payload, dtype=np.uint8, offset=INPUTS_OFFSET)
+        replay[INPUTS_OFFSET:INPUTS_OFFSET + length] = _undelta(delta, stride).tobytes()
+    return bytes(replay)
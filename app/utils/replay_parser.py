@@ -0,0 +1,116 @@
+import struct
+import hashlib
+import typing
+
+from datetime import datetime
+
+import numpy as np
+
+from app.utils.constants import REPLAY_SIZE
+
+# Header fields as (name, offset, struct format), in the order they appear in the record
+HEADER_FIELDS = (
+    ("recorded_at", 0x38, "24s"),
+    ("winner", 0x98, "B"),
+    ("p1_steamid64", 0x9C, "Q"),
+    ("p1", 0xA4, "36s"),
+    ("p2_steamid64", 0x166, "Q"),
+    ("p2", 0x16E, "36s"),
+    ("p1_character_id", 0x230, "I"),
+    ("p2_character_id", 0x234, "I"),
+    ("recorder_steamid64", 0x238, "Q"),
+    ("recorder", 0x240, "36s"),
+)
+
+INPUTS_OFFSET = 0x8D0
+INPUTS_SIZE = 0xF730
+
+# Regions fed to the filename hash, in hashing order: both character ids (adjacent), both steam ids, then the inputs
+HASHED_REGIONS = ((0x230, 0x238), (0x9C, 0xA4), (0x166, 0x16E), (INPUTS_OFFSET, INPUTS_OFFSET + INPUTS_SIZE))
+
+# Names are UTF-16 so they stay raw ("V"), "S" would trim them at the first null byte
+_NUMPY_FORMATS = {"B": "u1", "I": "<u4", "Q": "<u8", "24s": "S24", "36s": "V36"}
+
+
+def _compile_layout(raw: bool) -> struct.Struct:
+    """Build one struct covering every header field, pad bytes skip over the regions in between."""
+    layout = "<"
+    position = 0
+    for _, offset, fmt in HEADER_FIELDS:
+        size = struct.calcsize(f"<{fmt}")
+        layout += f"{offset - position}x" if offset > position else ""
+        layout += f"{size}s" if raw else fmt
+        position = offset + size
+    return struct.Struct(layout)
+
+
+HEADER = _compile_layout(raw=False)
+# Same layout with every field left as raw bytes, for callers that still want the undecoded values
+RAW_HEADER = _compile_layout(raw=True)
+
+# Structured dtype spanning a whole record, so a buffer of N replays maps onto N elements without copying
+RECORD_DTYPE = np.dtype({
+    "names": [name for name, _, _ in HEADER_FIELDS],
+    "formats": [_NUMPY_FORMATS[fmt] for _, _, fmt in HEADER_FIELDS],
+    "offsets": [offset for _, offset, _ in HEADER_FIELDS],
+    "itemsize": REPLAY_SIZE,
+})
+
+
+def iter_records(buffer: typing.Union[bytes, bytearray, memoryview]) -> typing.Iterator[memoryview]:
+    """Yield a memoryview per replay in a buffer of back-to-back records."""
+    view = memoryview(buffer)
+    if len(view) % REPLAY_SIZE:
+        raise ValueError(f"Buffer of {len(view)} bytes is not a whole number of {REPLAY_SIZE} byte replays")
+
+    for start in range(0, len(view), REPLAY_SIZE):
+        yield view[start:start + REPLAY_SIZE]
+
+
+def hash_filename(record: typing.Union[bytes, bytearray, memoryview]) -> str:
+    """Content hash used as the replay filename, fed straight from views over the record."""
+    view = memoryview(record)
+    sha256 = hashlib.sha256()
+    for start, end in HASHED_REGIONS:
+        sha256.update(view[start:end])
+
+    # Truncate to keep the filename reasonably short
+    return sha256.hexdigest()[:25] + ".dat"
+
+
+def decode_name(data: bytes) -> str:
+    return data.decode("utf-16").split("\x00")[0]
+
+
+def parse_recorded_at(data: bytes) -> datetime:
+    recorded_at = data.decode("utf-8")
+    try:
+        return datetime.strptime(recorded_at, "%a, %d %b %Y %H:%M:%S %Z")
+    except ValueError:
+        return datetime.strptime(recorded_at, "%a %b %d %H:%M:%S %Y")
+
+
+def parse_header(record: typing.Union[bytes, bytearray, memoryview]) -> typing.Dict[str, typing.Any]:
+    """Decode the header fields of a single replay."""
+    header = dict(zip((name for name, _, _ in HEADER_FIELDS), HEADER.unpack_from(record)))
+    header["recorded_at"] = parse_recorded_at(header["recorded_at"])
+    for name in ("p1", "p2", "recorder"):
+        header[name] = decode_name(header[name])
+    return header
+
+
+def parse_replay(record: typing.Union[bytes, bytearray, memoryview]) -> typing.Dict[str, typing.Any]:
+    """Decode a single replay into the fields of a ReplayCreate."""
+    replay = parse_header(record)
+    replay["filename"] = hash_filename(record)
+    replay["replay"] = record if isinstance(record, bytes) else bytes(record)
+    return replay
+
+
+def decode_batch(buffer: typing.Union[bytes, bytearray, memoryview]) -> np.ndarray:
+    """Map a buffer of N replays onto a structured array of their header fields, without copying."""
+    return np.frombuffer(buffer, dtype=RECORD_DTYPE)
+
+
+def hash_batch(buffer: typing.Union[bytes, bytearray, memoryview]) -> typing.List[str]:
+    return [hash_filename(record) for record in iter_records(buffer)]
@@ -1,6 +1,7 @@
-from app import create_app
+from app import create_app, start_background_work
 
 app = create_app()
 
 if __name__ == "__main__":
+    start_background_work()
     app.run(host="0.0.0.0", port=5000, debug=True)
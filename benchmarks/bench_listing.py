@@ -0,0 +1,63 @@
+"""Bytes and latency per listing page, loading whole rows versus metadata only.
+
+Needs a populated database, run from the repository root with the app's environment set:
+
+    python -m benchmarks.bench_listing --pages 20 --per-page 100
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from sqlalchemy import func, literal_column, select
+
+from app import db_manager
+from app.models.replay import Replay
+from app.services.replay_service import ReplayService
+
+
+async def measure(service: ReplayService, pages: int, per_page: int, include_replay_data: bool) -> tuple[float, float]:
+    latencies = []
+    sizes = []
+
+    for page in range(pages):
+        query = service.with_replay_data(select(Replay), include_replay_data)
+        query = query.order_by(Replay.recorded_at.desc()).limit(per_page).offset(page * per_page)
+
+        async with service.acquire() as session:
+            start = time.perf_counter()
+            rows = (await session.scalars(query)).all()
+            latencies.append(time.perf_counter() - start)
+
+            # Size of the rows as Postgres hands them out, a close proxy for what goes over the wire. Sized from the
+            # columns each mode actually selects, a subquery of the ORM query would drop the deferral and count the blob
+            columns = [column for column in Replay.__table__.c if include_replay_data or column.name != "replay"]
+            page_rows = (select(*columns).order_by(Replay.recorded_at.desc())
+                         .limit(per_page).offset(page * per_page).subquery("page"))
+            size_query = select(func.sum(func.pg_column_size(literal_column("page")))).select_from(page_rows)
+            sizes.append((await session.execute(size_query)).scalar() or 0)
+
+        if not rows:
+            break
+
+    return statistics.median(latencies) * 1000, statistics.mean(sizes) / 1024
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--per-page", type=int, default=100)
+    args = parser.parse_args()
+
+    db_manager.initialize(logging.getLogger(__name__))
+    service = ReplayService(db_manager)
+
+    print(f"{'columns':>10} {'median ms/page':>16} {'KiB/page':>12}")
+    for label, include in (("all", True), ("metadata", False)):
+        latency, size = await measure(service, args.pages, args.per_page, include)
+        print(f"{label:>10} {latency:>16.2f} {size:>12.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
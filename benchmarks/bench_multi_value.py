@@ -0,0 +1,75 @@
+"""Latency of one listing page filtered by any of N characters (or players): a single request with a multi-value
+filter bound as one array, versus the N single-value requests a client would otherwise send and merge.
+
+Needs a populated database, run from the repository root with the app's environment set:
+
+    python -m benchmarks.bench_multi_value --values 2 5 10 --per-page 100 --repeat 5
+"""
+import argparse
+import asyncio
+import heapq
+import logging
+import statistics
+import time
+
+from app import db_manager
+from app.services.replay_service import ReplayService
+
+
+async def timed(func, repeat: int) -> float:
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--values", type=int, nargs="+", default=[2, 5, 10])
+    parser.add_argument("--per-page", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--key", default="p1_character_id", help="p1_character_id, p1_steamid64 or p1.")
+    args = parser.parse_args()
+
+    db_manager.initialize(logging.getLogger(__name__))
+    service = ReplayService(db_manager)
+    per_page = args.per_page
+
+    async def candidates(count: int) -> list:
+        values = []
+        async for replay in service.get_all_replays(per_page=count * 50):
+            value = getattr(replay, args.key)
+            if value not in values:
+                values.append(value)
+            if len(values) == count:
+                break
+        return values
+
+    async def separate(values):
+        # One request per value, each with its own total, merged newest first client side
+        pages = [await service.get_replay_page({args.key: value}, per_page) for value in values]
+        merged = heapq.merge(*(replays for replays, _, _ in pages),
+                             key=lambda replay: (replay.recorded_at, replay.replay_id), reverse=True)
+        seen = {}
+        for replay in merged:
+            seen.setdefault(replay.replay_id, replay)
+        return list(seen.values())[:per_page]
+
+    async def combined(values):
+        replays, _, _ = await service.get_replay_page({args.key: frozenset(values)}, per_page)
+        return replays
+
+    print(f"{'values':>7} {'separate':>10} {'combined':>10}   (median ms, count cache off)")
+    for count in args.values:
+        values = await candidates(count)
+        # Every run recomputes its totals, like a cold request would
+        service.count_cache.ttl = -1
+        results = [await timed(lambda: separate(values), args.repeat),
+                   await timed(lambda: combined(values), args.repeat)]
+        print(f"{len(values):>7} " + " ".join(f"{result:>10.2f}" for result in results))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+"""Memory footprint and latency of the player name index, built from synthetic names:
+
+    python -m benchmarks.bench_name_index --names 500000
+"""
+import argparse
+import random
+import string
+import time
+import tracemalloc
+
+from app.utils.name_index import NameIndex
+
+
+def synthetic_names(count: int, seed=0) -> list[tuple[str, int, int]]:
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + "_-. "
+    names = set()
+    while len(names) < count:
+        names.add("".join(rng.choices(alphabet, k=rng.randint(3, 16))))
+    return [(name, 76561197960265728 + i, rng.randint(1, 500)) for i, name in enumerate(names)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--names", type=int, default=500_000)
+    parser.add_argument("--queries", type=int, default=10_000)
+    args = parser.parse_args()
+
+    rows = synthetic_names(args.names)
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = NameIndex.from_counts(rows)
+    build = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{len(index)} names, built in {build:.2f}s, {current / 1024 ** 2:.1f} MiB resident "
+          f"({current / len(index):.0f} bytes per name), {peak / 1024 ** 2:.1f} MiB peak while building")
+
+    rng = random.Random(1)
+    samples = [name for name, _, _ in rng.sample(rows, min(args.queries, len(rows)))]
+    for length in (1, 2, 3, 5):
+        prefixes = [name[:length] for name in samples]
+        start = time.perf_counter()
+        for prefix in prefixes:
+            index.suggest(prefix)
+        print(f"prefix of {length}: {(time.perf_counter() - start) / len(prefixes) * 1e6:.1f} us per suggest")
+
+    start = time.perf_counter()
+    for i in range(1000):
+        index.add(f"new player {i}", i)
+    print(f"insert: {(time.perf_counter() - start) / 1000 * 1e6:.1f} us per new name")
+
+
+if __name__ == "__main__":
+    main()
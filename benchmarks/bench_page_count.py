@@ -0,0 +1,62 @@
+"""Latency of a listing page plus its total: a separate COUNT query versus the same count as a scalar subquery of
+the page query, and the count modes that skip the total.
+
+Needs a populated database, run from the repository root with the app's environment set:
+
+    python -m benchmarks.bench_page_count --per-page 100 --pages 1 50 --repeat 5
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from app import db_manager
+from app.services.replay_service import ReplayService
+
+FILTERS = {
+    "none": {},
+    "character": {"p1_character_id": 3},
+}
+
+
+async def timed(func, repeat: int) -> float:
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--per-page", type=int, default=100)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 50])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    db_manager.initialize(logging.getLogger(__name__))
+    service = ReplayService(db_manager)
+    per_page = args.per_page
+
+    async def separate(query_params, page):
+        # The previous request path: a COUNT in one session, then the page in another
+        await service.get_total_pages(dict(query_params), per_page=per_page)
+        if query_params:
+            return [replay async for replay in service.get_replays(dict(query_params), per_page=per_page, page=page)]
+        return [replay async for replay in service.get_all_replays(per_page=per_page, page=page)]
+
+    print(f"{'filter':>10} {'page':>6} {'separate':>10} {'combined':>10} {'has_more':>10} {'none':>10}   (median ms)")
+    for name, query_params in FILTERS.items():
+        for page in args.pages:
+            results = [
+                await timed(lambda: separate(query_params, page), args.repeat),
+                *[await timed(lambda: service.get_replay_page(dict(query_params), per_page, page=page, count=count),
+                              args.repeat) for count in ("exact", "has_more", "none")],
+            ]
+            print(f"{name:>10} {page:>6} " + " ".join(f"{result:>10.2f}" for result in results))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
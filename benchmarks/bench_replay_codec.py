@@ -0,0 +1,75 @@
+"""Compression ratio and per-replay encode/decode cost of the storage codec.
+
+Point it at a directory of .dat replays to measure a real corpus, without one it falls back to synthetic replays
+with held inputs and zero padding:
+
+    python -m benchmarks.bench_replay_codec --corpus /path/to/replays --levels 1 6 9
+"""
+import argparse
+import pathlib
+import time
+
+from app.utils import replay_codec
+from app.utils.constants import REPLAY_SIZE
+from tests.helpers import generate_replay_data
+
+
+def synthetic_corpus(count: int) -> list[bytes]:
+    replays = []
+    for index in range(count):
+        frames = bytearray()
+        length = 4000 + index * 37 % 8000
+        for frame in range(length):
+            frames += bytes([(frame // (200 + index % 300)) % 16, 0, 0x20 if frame % (50 + index % 90) < 3 else 0, 0])
+        inputs = bytes(frames[:0xF730]) + bytes(max(0, 0xF730 - len(frames)))
+        replays.append(generate_replay_data(replay_inputs=inputs))
+    return replays
+
+
+def load_corpus(directory: str, limit: int) -> list[bytes]:
+    replays = []
+    for path in sorted(pathlib.Path(directory).rglob("*.dat")):
+        if path.stat().st_size == REPLAY_SIZE:
+            replays.append(path.read_bytes())
+        if len(replays) >= limit:
+            break
+    return replays
+
+
+def per_replay(func, count: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=None, help="Directory of .dat replays.")
+    parser.add_argument("--limit", type=int, default=2000)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 6, 9])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    replays = load_corpus(args.corpus, args.limit) if args.corpus else synthetic_corpus(min(args.limit, 500))
+    if not replays:
+        raise SystemExit(f"No {REPLAY_SIZE} byte .dat files under {args.corpus}")
+    raw_size = len(replays) * REPLAY_SIZE
+    print(f"{len(replays)} replays, {raw_size / 1024 ** 2:.1f} MiB raw, corpus: {args.corpus or 'synthetic'}")
+
+    print(f"{'level':>6} {'ratio':>8} {'avg bytes':>10} {'stored raw':>11} {'encode us':>10} {'decode us':>10}")
+    for level in args.levels:
+        encoded = [replay_codec.encode(replay, level) for replay in replays]
+        stored = sum(len(blob) for blob in encoded)
+        raw = sum(not replay_codec.is_encoded(blob) for blob in encoded)
+        encode = per_replay(lambda: [replay_codec.encode(replay, level) for replay in replays], len(replays),
+                            args.repeat)
+        decode = per_replay(lambda: [replay_codec.decode(blob) for blob in encoded], len(replays), args.repeat)
+        print(f"{level:>6} {raw_size / stored:>8.1f} {stored // len(encoded):>10} {raw:>11} {encode:>10.1f} "
+              f"{decode:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
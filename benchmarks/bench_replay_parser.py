@@ -0,0 +1,78 @@
+"""Per-replay parse + hash cost for batches of replays.
+
+Run from the repository root with the app's environment set:
+
+    python -m benchmarks.bench_replay_parser --sizes 1 100 10000
+"""
+import argparse
+import hashlib
+import os
+import struct
+import time
+
+from app.utils import replay_parser
+from app.utils.constants import REPLAY_SIZE
+from app.utils.helpers import read_data
+from tests.helpers import generate_replay_data
+
+
+def legacy_parse(data: bytes) -> dict:
+    """The parse + hash path as it was before the precompiled layout, kept here for comparison."""
+    metadata = {
+        "recorded_at": struct.unpack_from("24s", data, 0x38)[0],
+        "winner": struct.unpack_from("B", data, 0x98)[0],
+        "p1": struct.unpack_from("36s", data, 0xA4)[0],
+        "p2": struct.unpack_from("36s", data, 0x16E)[0],
+        "p1_character_id": struct.unpack_from("4s", data, 0x230)[0],
+        "p2_character_id": struct.unpack_from("4s", data, 0x234)[0],
+        "recorder": struct.unpack_from("36s", data, 0x240)[0],
+        "p1_steamid64": struct.unpack_from("8s", data, 0x9C)[0],
+        "p2_steamid64": struct.unpack_from("8s", data, 0x166)[0],
+        "recorder_steamid64": struct.unpack_from("8s", data, 0x238)[0],
+        "replay_inputs": struct.unpack_from(f"{0xF730}s", data, 0x8D0)[0],
+    }
+    for _ in range(2):  # read_data hashed twice, once directly and once through decode_replay
+        bytes_to_hash = (metadata["p1_character_id"] + metadata["p2_character_id"] +
+                         metadata["p1_steamid64"] + metadata["p2_steamid64"] + metadata["replay_inputs"])
+        metadata["filename"] = hashlib.sha256(bytes_to_hash).hexdigest()[:25] + ".dat"
+    return metadata
+
+
+def per_replay(func, count: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'batch':>8} {'legacy':>12} {'read_data':>12} {'views':>12} {'numpy+hash':>12}   (us per replay)")
+    for size in args.sizes:
+        # Distinct inputs per replay so hashing cannot be short-circuited by anything
+        buffer = bytearray(REPLAY_SIZE * size)
+        template = generate_replay_data(replay_inputs=bytes(0xF730))
+        for index in range(size):
+            offset = index * REPLAY_SIZE
+            buffer[offset:offset + REPLAY_SIZE] = template
+            buffer[offset + 0x8D0:offset + 0x8D0 + 64] = os.urandom(64)
+        records = [bytes(record) for record in replay_parser.iter_records(buffer)]
+
+        legacy = per_replay(lambda: [legacy_parse(record) for record in records], size, args.repeat)
+        current = per_replay(lambda: [read_data(record) for record in records], size, args.repeat)
+        views = per_replay(lambda: [(replay_parser.parse_header(record), replay_parser.hash_filename(record))
+                                    for record in replay_parser.iter_records(buffer)], size, args.repeat)
+        batch = per_replay(lambda: (replay_parser.decode_batch(buffer), replay_parser.hash_batch(buffer)),
+                           size, args.repeat)
+
+        print(f"{size:>8} {legacy:>12.2f} {current:>12.2f} {views:>12.2f} {batch:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
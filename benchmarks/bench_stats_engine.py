@@ -0,0 +1,128 @@
+"""Latency of the stats page sections computed by the numpy stats engine, versus the SQL path over the aggregate
+tables and the scan of the replays those tables replaced. Also times loading and refreshing the engine's columns.
+
+The database part needs a populated database, run from the repository root with the app's environment set:
+
+    python -m benchmarks.bench_stats_engine --repeat 5
+
+--synthetic times only the engine's compute over that many random replays per size, no database needed:
+
+    python -m benchmarks.bench_stats_engine --synthetic 1000000 10000000
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from app.migrations.m0007_character_stats import CHARACTER_STATS, MATCHUP_STATS
+from app.services.stats_engine import StatsEngine, COLUMNS, CHARACTER_COUNT, NULL_TIME
+
+
+async def timed(func, repeat: int) -> float:
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        if asyncio.iscoroutine(result):
+            await result
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+
+def synthetic_columns(size: int, seed=0) -> dict:
+    generator = np.random.default_rng(seed)
+    columns = {name: np.full(size, -1, dtype) for name, dtype in COLUMNS.items()}
+    columns["replay_id"] = np.arange(1, size + 1, dtype=np.int64)
+    # Uneven character picks, like a real roster
+    weights = generator.random(CHARACTER_COUNT) ** 2
+    for side in ("p1_character_id", "p2_character_id"):
+        columns[side] = generator.choice(CHARACTER_COUNT, size, p=weights / weights.sum()).astype(np.int8)
+    columns["winner"] = generator.integers(0, 2, size, dtype=np.int8)
+    columns["recorder_steamid64"] = generator.integers(0, max(size // 200, 1), size) + 76561197960265728
+    recorded_at = generator.integers(1_600_000_000, 1_730_000_000, size) * 1000000
+    recorded_at[generator.random(size) < 0.001] = NULL_TIME
+    columns["recorded_at"] = recorded_at
+    return columns
+
+
+def engine_sections(engine: StatsEngine, columns: dict) -> dict:
+    return {
+        "total_players": lambda: engine.total_players(columns),
+        "total_per_character": lambda: engine.total_replays_per_character(columns),
+        "character_usage": lambda: engine.character_usage(columns),
+        "matchup_stats": lambda: engine.matchup_statistics(columns),
+        "matchup_rarity": lambda: engine.matchup_rarity(columns),
+        "replays_per_hour": lambda: engine.replays_per_hour(columns),
+    }
+
+
+async def synthetic(sizes, repeat: int):
+    engine = StatsEngine()
+    print(f"{'replays':>10} {'section':>20} {'numpy':>10}   (median ms)")
+    for size in sizes:
+        columns = synthetic_columns(size)
+        megabytes = sum(column.nbytes for column in columns.values()) / 1e6
+        for name, func in engine_sections(engine, columns).items():
+            print(f"{size:>10} {name:>20} {await timed(func, repeat):>10.2f}")
+        print(f"{size:>10} {'columns (MB)':>20} {megabytes:>10.1f}")
+
+
+async def database(repeat: int):
+    from app import db_manager
+    from app.services.replay_service import ReplayService
+
+    db_manager.initialize(logging.getLogger(__name__))
+    service = ReplayService(db_manager)
+    engine = StatsEngine()
+
+    async with service.independent_session() as session:
+        start = time.perf_counter()
+        columns = await engine.refresh(session)
+        load = (time.perf_counter() - start) * 1000
+        refresh = await timed(lambda: engine.refresh(session), repeat)
+
+        async def scan(query):
+            await session.execute(text(query))
+
+        sql = {
+            "total_players": lambda: service.get_total_unique_players(session=session),
+            "total_per_character": lambda: service.get_total_replays_per_character(session=session),
+            "character_usage": lambda: service.get_character_usage_statistics(session=session),
+            "matchup_stats": lambda: service.get_matchup_statistics(session=session),
+            "matchup_rarity": lambda: service.get_matchup_rarity(session=session),
+            "replays_per_hour": lambda: service.get_replays_per_hour(session=session),
+        }
+        scans = {
+            "character_usage": lambda: scan(CHARACTER_STATS),
+            "matchup_stats": lambda: scan(MATCHUP_STATS),
+        }
+
+        print(f"{len(engine)} replays, engine columns {engine.nbytes() / 1e6:.1f} MB, "
+              f"load {load:.0f} ms, incremental refresh {refresh:.2f} ms")
+        print(f"{'section':>20} {'sql':>10} {'sql scan':>10} {'numpy':>10}   (median ms)")
+        for name, func in engine_sections(engine, columns).items():
+            results = [await timed(sql[name], repeat),
+                       await timed(scans[name], repeat) if name in scans else None,
+                       await timed(func, repeat)]
+            print(f"{name:>20} " + " ".join(f"{'-':>10}" if result is None else f"{result:>10.2f}"
+                                             for result in results))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--synthetic", type=int, nargs="+", help="Replay counts to time the engine on, no database.")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        await synthetic(args.synthetic, args.repeat)
+    else:
+        await database(args.repeat)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
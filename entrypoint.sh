@@ -5,4 +5,4 @@ set -e
 python manage.py init-db
 
 # Start the Gunicorn server
-exec gunicorn --bind 0.0.0.0:5000 "app.wsgi:create_app()"
\ No newline at end of file
+exec gunicorn --config gunicorn.conf.py --bind 0.0.0.0:5000 "app.wsgi:create_app()"
\ No newline at end of file
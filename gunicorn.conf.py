@@ -0,0 +1,7 @@
+# Read by gunicorn from the working directory, entrypoint.sh also passes it explicitly
+
+
+def post_worker_init(worker):
+    # Background threads belong to each worker, they would not survive the fork if started in the arbiter
+    from app import start_background_work
+    start_background_work()
@@ -1,6 +1,13 @@
 import asyncio
+from datetime import timedelta
+
+import click
 from flask.cli import FlaskGroup
-from app import create_app, init_models
+
+from app import create_app, init_models, run_migrations, replay_service, db_manager
+from app.config import settings
+from app.migrations import pending_migrations
+from app.services.import_service import ReplayImporter
 
 app = create_app()
 
@@ -11,8 +18,106 @@ cli = FlaskGroup(app)
 def init_db():
     loop = asyncio.get_event_loop()
     loop.run_until_complete(init_models())
+    loop.run_until_complete(run_migrations())
     print("Initialised database.")
 
 
+@cli.command()
+@click.option("--status", is_flag=True, help="List pending migrations without applying them.")
+def migrate(status):
+    """Apply pending schema migrations."""
+    loop = asyncio.get_event_loop()
+    if status:
+        pending = loop.run_until_complete(pending_migrations(db_manager.engine))
+        for migration in pending:
+            print(f"Pending {migration.version:04} {migration.name}")
+        print(f"{len(pending)} pending migration(s).")
+        return
+
+    applied = loop.run_until_complete(run_migrations())
+    print(f"Applied {len(applied)} migration(s).")
+
+
+@cli.command()
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option("--workers", type=int, default=None, help="Parser processes, defaults to INGEST_WORKERS.")
+@click.option("--batch-size", type=int, default=2000, show_default=True, help="Replays inserted per transaction.")
+@click.option("--checkpoint", type=click.Path(dir_okay=False), default=None,
+              help="Checkpoint file, defaults to .import-checkpoint inside the directory.")
+def import_replays(directory, workers, batch_size, checkpoint):
+    """Import every .dat replay under DIRECTORY, resuming from the last checkpoint."""
+    importer = ReplayImporter(replay_service, directory, checkpoint=checkpoint, workers=workers,
+                              batch_size=batch_size)
+    loop = asyncio.get_event_loop()
+    totals = loop.run_until_complete(importer.run())
+    print(f"Imported replays: {totals['created']} created, {totals['duplicate']} duplicate, "
+          f"{totals['corrupt']} corrupt.")
+
+
+@cli.command()
+@click.option("--repair", is_flag=True, help="Rebuild the counters from the replays if they differ.")
+def check_aggregates(repair):
+    """Recompute the stats page counters from the replays and list the rows that differ from the stored ones."""
+    loop = asyncio.get_event_loop()
+    differences = loop.run_until_complete(replay_service.check_character_stats(repair=repair))
+    for difference in differences:
+        print(f"{difference['table']} {difference['key']}: stored {difference['stored']}, "
+              f"expected {difference['expected']}")
+    if not differences:
+        print("Aggregates are consistent.")
+    elif repair:
+        print(f"Rebuilt the aggregates, {len(differences)} rows differed.")
+    else:
+        print(f"{len(differences)} rows differ, run with --repair to rebuild them.")
+        raise SystemExit(1)
+
+
+@cli.command()
+@click.option("--from", "start", type=click.DateTime(["%Y-%m-%d"]), help="First UTC day, defaults to the oldest replay.")
+@click.option("--to", "end", type=click.DateTime(["%Y-%m-%d"]), help="Last UTC day, defaults to the newest replay.")
+def backfill_daily_stats(start, end):
+    """Recompute the daily character and matchup rollups from the replays, a month per transaction."""
+    loop = asyncio.get_event_loop()
+    months = loop.run_until_complete(replay_service.backfill_daily_stats(
+        start.date() if start else None, end.date() + timedelta(days=1) if end else None,
+        progress=lambda first, after: print(f"Backfilled {first} to {after - timedelta(days=1)}")))
+    print(f"Backfilled {months} month(s) of daily stats.")
+
+
+@cli.command()
+def rebuild_player_stats():
+    """Recompute the per-player stats behind /api/player/<steamid64> from the replays."""
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(replay_service.rebuild_player_stats())
+    print("Rebuilt player stats.")
+
+
+@cli.command()
+@click.option("--batch-size", type=int, default=500, show_default=True, help="Replays moved per transaction.")
+def migrate_blobs(batch_size):
+    """Move replay bytes stored in the database into the configured blob store."""
+
+    async def run():
+        moved = 0
+        async for count in replay_service.migrate_blobs(batch_size=batch_size):
+            moved += count
+            print(f"Moved {moved} replay(s)")
+        return moved
+
+    loop = asyncio.get_event_loop()
+    moved = loop.run_until_complete(run())
+    print(f"Moved {moved} replay(s) to the {settings.blob_store} blob store.")
+
+
+@cli.command()
+@click.argument("replay_ids", nargs=-1, type=int, required=True)
+@click.option("--compress", is_flag=True, help="Compress the replays again instead.")
+def store_raw(replay_ids, compress):
+    """Store the replays REPLAY_IDS uncompressed, so hot replays are served without decoding them."""
+    loop = asyncio.get_event_loop()
+    rewritten = loop.run_until_complete(replay_service.store_raw(replay_ids, raw=not compress))
+    print(f"Stored {rewritten} replay(s) {'compressed' if compress else 'raw'}.")
+
+
 if __name__ == "__main__":
     cli()
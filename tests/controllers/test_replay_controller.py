@@ -0,0 +1,30 @@
+from io import BytesIO
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.controllers.replay_controller import ReplayController
+from app.utils.helpers import read_data
+from tests.helpers import generate_replay_data
+
+
+@pytest.mark.asyncio
+@pytest.mark.unit
+async def test_create_replays_reports_per_record_status():
+    first = generate_replay_data()
+    second = generate_replay_data(p1_character_id=5)
+    corrupt = generate_replay_data(p1_character_id=99)
+    stream = BytesIO(first + second + first + corrupt + b"\x00" * 10)
+
+    service = AsyncMock()
+    # The second replay already exists, so only the first one comes back from the insert
+    service.create_replays.return_value = [SimpleNamespace(replay_id=1, filename=read_data(first)["filename"])]
+    controller = ReplayController(service)
+
+    results = await controller.create_replays(stream)
+
+    assert [result["status"] for result in results] == ["created", "duplicate", "duplicate", "corrupt", "corrupt"]
+    assert [result["index"] for result in results] == [0, 1, 2, 3, 4]
+    assert results[0]["replay_id"] == 1
+    assert len(service.create_replays.call_args.args[0]) == 3
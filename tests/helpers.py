@@ -1,6 +1,9 @@
+import os
+import struct
 import typing
 from datetime import datetime
 from app.models.replay import Replay
+from app.utils.constants import REPLAY_SIZE
 
 
 async def async_generator_mock(data: typing.Iterable):
@@ -31,3 +34,22 @@ def generate_mock_replays_from_data(replays_data: dict) -> typing.List[Replay]:
         mock_replays.append(replay)
 
     return mock_replays
+
+
+# Function to build raw replay bytes laid out the way the game writes them
+def generate_replay_data(p1="Player1", p2="Player2", p1_character_id=0, p2_character_id=1,
+                         p1_steamid64=76561198000000001, p2_steamid64=76561198000000002, winner=0,
+                         recorded_at="Wed Oct 16 20:54:18 2024", replay_inputs=None) -> bytes:
+    data = bytearray(REPLAY_SIZE)
+    struct.pack_into("24s", data, 0x38, recorded_at.encode("utf-8"))
+    struct.pack_into("B", data, 0x98, winner)
+    struct.pack_into("<Q", data, 0x9C, p1_steamid64)
+    struct.pack_into("36s", data, 0xA4, p1.encode("utf-16-le"))
+    struct.pack_into("<Q", data, 0x166, p2_steamid64)
+    struct.pack_into("36s", data, 0x16E, p2.encode("utf-16-le"))
+    struct.pack_into("<I", data, 0x230, p1_character_id)
+    struct.pack_into("<I", data, 0x234, p2_character_id)
+    struct.pack_into("<Q", data, 0x238, p1_steamid64)
+    struct.pack_into("36s", data, 0x240, p1.encode("utf-16-le"))
+    data[0x8D0:] = replay_inputs if replay_inputs is not None else os.urandom(0xF730)
+    return bytes(data)
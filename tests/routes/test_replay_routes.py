@@ -0,0 +1,39 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app import replay_controller
+from app.core import limiter
+from app.routes.replay_routes import MAX_MANIFEST_SIZE
+
+
+@pytest.fixture()
+def unlimited(app):
+    # The limiter's storage is memcached, which tests don't have
+    limiter.enabled = False
+    yield
+    limiter.enabled = True
+
+
+@pytest.mark.unit
+def test_missing_replays_normalizes_and_validates_the_manifest(client, unlimited):
+    stored = "0123456789abcdef012345678.dat"
+    new = "fedcba9876543210fedcba987"
+
+    def missing_filenames(filenames):
+        return [filename for filename in filenames if filename != stored]
+
+    with patch.object(replay_controller.service, "missing_filenames", AsyncMock(side_effect=missing_filenames)) \
+            as missing:
+        response = client.post("/api/replay/missing", json={"filenames": [new.upper(), stored, f"{new}.dat"]})
+
+        assert response.status_code == 200
+        assert response.json == {"missing": [f"{new}.dat"], "checked": 3}
+        # Bare hashes gain the extension and the same replay twice is looked up once, in the order sent
+        assert missing.await_args.args[0] == [f"{new}.dat", stored]
+
+        for filenames in (["0123456789abcdef01234567"], [f"{new}.txt"], ["../" + new], [5], "not a list",
+                          [new] * (MAX_MANIFEST_SIZE + 1)):
+            response = client.post("/api/replay/missing", json={"filenames": filenames})
+            assert response.status_code == 400 and "error" in response.json
+        assert missing.await_count == 1
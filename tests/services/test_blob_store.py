@@ -0,0 +1,41 @@
+import pytest
+
+from app.services.blob_store import PackfileBlobStore, BlobIO
+
+
+@pytest.mark.unit
+def test_packfile_store_round_trips_across_segments_and_processes(tmp_path):
+    store = PackfileBlobStore(str(tmp_path), segment_size=250)
+    blobs = {f"{i:025x}.dat": bytes([i]) * 100 for i in range(5)}
+
+    store.put_many(blobs.items())
+    store.put(next(iter(blobs)), b"ignored")  # Content addressed, an existing key is never rewritten
+
+    for key, data in blobs.items():
+        assert bytes(store.get(key)) == data
+    assert len(list(tmp_path.glob("segment-*.pack"))) == 3
+    assert store.get("missing.dat") is None
+
+    # A half written index entry from a crashed append is ignored, and overwritten by the next append
+    with open(store.index_path, "ab") as index_file:
+        index_file.write(b"\x00" * 10)
+    other = PackfileBlobStore(str(tmp_path), segment_size=250)
+    assert other.index == store.index
+
+    other.put("new.dat", b"\x07" * 50)
+    assert bytes(store.get("new.dat")) == b"\x07" * 50  # Picked up from the log by the first store
+
+    # Replacing appends a later entry that wins once the log is read again
+    other.put_many([("new.dat", b"\x08" * 60)], replace=True)
+    assert bytes(other.get("new.dat")) == b"\x08" * 60
+    assert bytes(PackfileBlobStore(str(tmp_path), segment_size=250).get("new.dat")) == b"\x08" * 60
+
+
+@pytest.mark.unit
+def test_blob_io_reads_in_chunks():
+    blob = BlobIO(memoryview(bytes(range(256)) * 4), name="a.dat")
+
+    assert blob.read(10) == bytes(range(10))
+    blob.seek(0)
+    assert blob.read() == bytes(range(256)) * 4
+    assert blob.read() == b""
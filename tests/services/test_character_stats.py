@@ -0,0 +1,38 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from app.models.character_stats import CharacterStats, MatchupStats, CharacterDailyStats, MatchupDailyStats
+from app.services.character_stats import character_deltas
+
+
+@pytest.mark.unit
+def test_character_deltas_match_the_rebuild_queries():
+    replays = [
+        {"p1_character_id": 4, "p2_character_id": 2, "winner": 0},
+        # A mirror match appears in one replay but plays two sides, its p1 side is character 1
+        {"p1_character_id": 3, "p2_character_id": 3, "winner": 1},
+        {"p1_character_id": 2, "p2_character_id": 4, "winner": None},
+    ]
+    deltas = character_deltas(replays)
+
+    assert deltas[CharacterStats] == {(4,): [2, 2, 1], (2,): [2, 2, 0], (3,): [1, 2, 1]}
+    assert deltas[MatchupStats] == {(2, 4): [2, 0, 1], (3, 3): [1, 0, 1]}
+    assert character_deltas(replays[1:2], sign=-1)[CharacterStats] == {(3,): [-1, -2, -1]}
+    # An update nets the old row out against the new one
+    assert character_deltas([dict(replays[0], winner=1)], replaced=replays[:1])[MatchupStats] == {(2, 4): [0, 1, -1]}
+
+
+@pytest.mark.unit
+def test_character_deltas_roll_up_by_utc_day_and_side():
+    late = datetime(2024, 5, 1, 23, 30, tzinfo=timezone(timedelta(hours=-5)))
+    replays = [
+        {"p1_character_id": 4, "p2_character_id": 2, "winner": 1, "recorded_at": late},
+        {"p1_character_id": 2, "p2_character_id": 4, "winner": 1, "recorded_at": None},
+    ]
+    deltas = character_deltas(replays)
+
+    day = date(2024, 5, 2)
+    assert deltas[CharacterDailyStats] == {(day, 4, 0): [1, 0], (day, 2, 1): [1, 1]}
+    assert deltas[MatchupDailyStats] == {(day, 2, 4): [1, 1, 0]}
+    assert deltas[MatchupStats] == {(2, 4): [2, 1, 1]}
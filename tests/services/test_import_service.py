@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.services.import_service import ReplayImporter
+from tests.helpers import generate_replay_data
+
+
+class FlakyInsert:
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.inserted = []
+
+    def __call__(self, replay_creates):
+        if self.fail_after is not None and len(self.inserted) >= self.fail_after:
+            raise ConnectionError("lost connection")
+        self.inserted.extend(replay.filename for replay in replay_creates)
+        return [SimpleNamespace(replay_id=i, filename=replay.filename) for i, replay in enumerate(replay_creates)]
+
+
+def make_importer(path, insert):
+    service = AsyncMock()
+    service.create_replays.side_effect = insert
+    importer = ReplayImporter(service, str(path), workers=1, batch_size=4, report_every=0, out=lambda _: None)
+    importer.pipeline.chunk_size = 4
+    return importer
+
+
+@pytest.mark.asyncio
+@pytest.mark.unit
+async def test_interrupted_import_resumes_from_checkpoint(tmp_path):
+    for i in range(12):
+        (tmp_path / f"{i:02}.dat").write_bytes(generate_replay_data(p1_character_id=i))
+    (tmp_path / "short.dat").write_bytes(b"\x00" * 100)
+
+    with pytest.raises(ConnectionError):
+        await make_importer(tmp_path, FlakyInsert(fail_after=8)).run()
+    assert (tmp_path / ".import-checkpoint").exists()
+
+    insert = FlakyInsert()
+    totals = await make_importer(tmp_path, insert).run()
+
+    # Only the replays after the checkpoint are sent again
+    assert len(insert.inserted) == 4
+    assert totals["created"] == 12
+    assert not (tmp_path / ".import-checkpoint").exists()
+
+
+@pytest.mark.asyncio
+@pytest.mark.unit
+async def test_resumed_import_counts_each_corrupt_file_once(tmp_path):
+    for i in range(12):
+        (tmp_path / f"{i:02}.dat").write_bytes(generate_replay_data(p1_character_id=i))
+    # Sorted between 08.dat and 09.dat, past the checkpoint the failed run leaves
+    (tmp_path / "08a.dat").write_bytes(b"\x00" * 100)
+
+    with pytest.raises(ConnectionError):
+        await make_importer(tmp_path, FlakyInsert(fail_after=8)).run()
+
+    totals = await make_importer(tmp_path, FlakyInsert()).run()
+
+    assert totals == {"created": 12, "duplicate": 0, "corrupt": 1}
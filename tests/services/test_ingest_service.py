@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.services.ingest_service import IngestPipeline
+from app.utils.replay_parser import hash_filename
+from tests.helpers import generate_replay_data
+
+
+def insert_all(replay_creates):
+    return [SimpleNamespace(replay_id=i, filename=replay.filename) for i, replay in enumerate(replay_creates)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.unit
+async def test_pipeline_keeps_source_order_across_batches(tmp_path):
+    replays = [generate_replay_data(p1_character_id=i % 36) for i in range(50)]
+    path = tmp_path / "replay.dat"
+    path.write_bytes(replays[0])
+    sources = replays + [b"corrupt", str(path), str(tmp_path / "missing.dat")]
+
+    service = AsyncMock()
+    service.create_replays.side_effect = insert_all
+    pipeline = IngestPipeline(service, workers=2, chunk_size=4, batch_size=8, max_pending=2)
+
+    results = [result async for result in pipeline.run(sources)]
+
+    assert [result["index"] for result in results] == list(range(len(sources)))
+    assert all(result["status"] == "created" for result in results[:50])
+    assert results[0]["filename"] == hash_filename(replays[0])
+    assert [result["status"] for result in results[50:]] == ["corrupt", "created", "corrupt"]
+    assert all(len(call.args[0]) <= 8 + 4 for call in service.create_replays.call_args_list)
+
+
+@pytest.mark.asyncio
+@pytest.mark.unit
+async def test_pipeline_surfaces_writer_errors():
+    service = AsyncMock()
+    service.create_replays.side_effect = RuntimeError("database went away")
+    pipeline = IngestPipeline(service, workers=1, chunk_size=2, batch_size=2)
+
+    with pytest.raises(RuntimeError):
+        [result async for result in pipeline.run(generate_replay_data() for _ in range(20))]
@@ -0,0 +1,26 @@
+import pytest
+
+from app.models.player_stats import PlayerCharacterStats, PlayerOpponentStats, PlayerMatchupStats
+from app.services.player_stats import stat_deltas
+
+
+@pytest.mark.unit
+def test_stat_deltas_count_both_sides_and_cancel_on_delete():
+    replays = [
+        # winner 0 is a p1 win
+        {"p1_steamid64": 1, "p1_character_id": 10, "p2_steamid64": 2, "p2_character_id": 20, "winner": 0},
+        {"p1_steamid64": 2, "p1_character_id": 20, "p2_steamid64": 1, "p2_character_id": 11, "winner": 0},
+        {"p1_steamid64": None, "p1_character_id": 10, "p2_steamid64": 1, "p2_character_id": 10, "winner": 1},
+    ]
+    deltas = stat_deltas(replays)
+
+    assert deltas[PlayerCharacterStats] == {(1, 10): [2, 2], (2, 20): [2, 1], (1, 11): [1, 0]}
+    assert deltas[PlayerOpponentStats] == {(1, 2): [2, 1], (2, 1): [2, 1]}
+    assert deltas[PlayerMatchupStats] == {(1, 20): [2, 1], (2, 10): [1, 0], (2, 11): [1, 1], (1, 10): [1, 1]}
+
+    removed = stat_deltas(replays[:1], sign=-1)
+    assert removed[PlayerCharacterStats] == {(1, 10): [-1, -1], (2, 20): [-1, 0]}
+
+    # An update nets the old row out against the new one, a counter it leaves alone moves by nothing
+    updated = dict(replays[0], winner=1)
+    assert stat_deltas([updated], replaced=replays[:1])[PlayerCharacterStats] == {(1, 10): [0, -1], (2, 20): [0, 1]}
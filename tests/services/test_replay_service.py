@@ -0,0 +1,129 @@
+import contextlib
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import NoResultFound
+
+from app.models.replay import Replay
+from app.services.replay_service import ReplayService
+from app.utils.bloom import BloomFilter
+
+
+class FakeResult:
+    """Stands in for the AsyncScalarResult of a server side cursor."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.close = AsyncMock()
+
+    async def __aiter__(self):
+        for row in self.rows:
+            yield row
+
+
+def make_session(rows):
+    session = MagicMock()
+    session.stream_scalars = AsyncMock(return_value=FakeResult(rows))
+    return session
+
+
+@pytest.mark.asyncio
+@pytest.mark.unit
+async def test_stream_replays_executes_once():
+    session = make_session([1, 2, 3])
+
+    replays = [replay async for replay in ReplayService._stream_replays(select(Replay), session, yield_per=2)]
+
+    assert replays == [1, 2, 3]
+    session.stream_scalars.assert_awaited_once()
+    query = session.stream_scalars.await_args.args[0]
+    assert query.get_execution_options()["yield_per"] == 2
+    session.stream_scalars.return_value.close.assert_awaited_once()
+
+    empty = make_session([])
+    with pytest.raises(NoResultFound):
+        [replay async for replay in ReplayService._stream_replays(select(Replay), empty)]
+    empty.stream_scalars.assert_awaited_once()
+
+
+@pytest.mark.unit
+def test_multi_value_filters_bind_one_array():
+    service = ReplayService(None)
+
+    def compile_filter(characters):
+        query = service.build_query(Replay, {"p1_character_id": frozenset(characters), "p1": frozenset({"a", "b"})})
+        return query.compile(dialect=postgresql.dialect())
+
+    few, many = compile_filter({1, 2}), compile_filter(range(20))
+    # The same statement whatever the number of values
+    assert str(few) == str(many)
+    assert "= ANY (%(p1_character_id_values)s::SMALLINT[])" in str(few)
+    assert "LIKE ANY (%(p1_values)s::VARCHAR[])" in str(few)
+    assert many.params["p1_character_id_values"] == list(range(20))
+
+    row = {"p1": "Bee", "p2": "Cat", "p1_character_id": 7, "p2_character_id": 2}
+    assert ReplayService.row_matches({"p2_character_id": frozenset({2, 9})}, row)
+    assert not ReplayService.row_matches({"p1_character_id": frozenset({1, 3})}, row)
+
+
+@pytest.mark.asyncio
+@pytest.mark.unit
+async def test_upsert_players_batches_names_under_the_latest():
+    session = MagicMock()
+    session.execute = AsyncMock()
+    rows = [{"p1": name, "p2": "Cat", "recorder": name, "p1_steamid64": 1, "p2_steamid64": 2, "recorder_steamid64": 1,
+             "recorded_at": datetime(2024, 1, day, tzinfo=timezone.utc)} for name, day in (("New", 9), ("Old", 2))]
+
+    await ReplayService.upsert_players(session, rows)
+
+    players, names = [call.args[0].compile(dialect=postgresql.dialect()).params
+                      for call in session.execute.await_args_list]
+    assert (players["steamid64_m0"], players["name_m0"], players["steamid64_m1"]) == (1, "New", 2)
+    assert players["first_seen_m0"].day == 2 and players["last_seen_m0"].day == 9
+    assert [names[f"name_m{i}"] for i in range(3)] == ["New", "Old", "Cat"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.unit
+async def test_stats_bundle_is_reused_until_the_snapshot_changes():
+    service = ReplayService(MagicMock())
+    service.stats_bundle = {"version": service.snapshot_version("10:12:11"), "total_replays": 3}
+    service.get_stats_version = AsyncMock(return_value=service.snapshot_version("10:12:11"))
+
+    assert (await service.get_stats_bundle())["total_replays"] == 3
+    service.db_manager.session_factory.session_factory.assert_not_called()
+    assert service.snapshot_version("10:12:") != service.snapshot_version("10:12:11")
+
+
+@pytest.mark.unit
+def test_writes_only_drop_activity_histograms_covering_them():
+    march = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    row = {"recorded_at": datetime(2024, 3, 2, 12, tzinfo=timezone.utc)}
+
+    assert ReplayService.in_period({"from": None, "to": None}, row)
+    assert ReplayService.in_period({"from": march, "to": None}, row)
+    assert not ReplayService.in_period({"from": None, "to": march}, row)
+    assert not ReplayService.in_period({"from": march, "to": None}, {"recorded_at": None})
+
+
+@pytest.mark.asyncio
+@pytest.mark.unit
+async def test_missing_filenames_looks_every_name_up_in_order():
+    service = ReplayService(MagicMock())
+    # Empty, so it would answer "definitely new" for every name another worker stored
+    service.filename_filter = BloomFilter(100, 0.01)
+    session = MagicMock()
+    session.scalars = AsyncMock(return_value=MagicMock(all=MagicMock(return_value=["b.dat"])))
+
+    @contextlib.asynccontextmanager
+    async def acquire(session_=None):
+        yield session
+
+    service.acquire = acquire
+
+    assert await service.missing_filenames(["c.dat", "b.dat", "a.dat"]) == ["c.dat", "a.dat"]
+    looked_up = session.scalars.await_args.args[0].compile().params["filenames"]
+    assert looked_up == ["c.dat", "b.dat", "a.dat"]
@@ -0,0 +1,87 @@
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.services.spool_service import UploadSpool
+from tests.helpers import generate_replay_data
+
+
+def make_service():
+    stored = set()
+
+    def insert(replay_creates):
+        rows = [SimpleNamespace(replay_id=len(stored) + i, filename=replay.filename)
+                for i, replay in enumerate(replay_creates) if replay.filename not in stored]
+        stored.update(replay.filename for replay in replay_creates)
+        return rows
+
+    service = AsyncMock()
+    service.create_replays.side_effect = insert
+    return service, stored
+
+
+@pytest.mark.asyncio
+@pytest.mark.unit
+async def test_spool_drains_tickets_and_survives_a_failed_batch(tmp_path):
+    service, stored = make_service()
+    spool = UploadSpool(str(tmp_path), service, batch_size=3)
+
+    first = spool.append([generate_replay_data(), generate_replay_data()])
+    # A torn write from a crashed append must not shift the records after it
+    with open(spool.data_path, "ab") as data_file:
+        data_file.write(b"\x00" * 100)
+    second = spool.append([generate_replay_data(), b"\x01" * len(generate_replay_data())])
+    assert spool.status(first)["status"] == "queued"
+
+    service.create_replays.side_effect = ConnectionError("database is down")
+    with pytest.raises(ConnectionError):
+        await spool.drain()
+    assert spool.status(first)["status"] == "queued"
+
+    service.create_replays.side_effect = make_service()[0].create_replays.side_effect
+    assert await spool.drain() == 4
+
+    first_status, second_status = spool.status(first), spool.status(second)
+    assert first_status["status"] == "done" and first_status["created"] == 2
+    assert [result["status"] for result in second_status["results"]] == ["created", "corrupt"]
+    assert [result["index"] for result in second_status["results"]] == [0, 1]
+
+    # Fully drained spools start over
+    assert os.path.getsize(spool.data_path) == 0
+    assert spool.status("../../etc/passwd") is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.unit
+async def test_spool_recovers_from_crashes_without_redoing_tickets(tmp_path):
+    service, stored = make_service()
+    spool = UploadSpool(str(tmp_path), service)
+
+    first = spool.append([generate_replay_data()])
+    assert await spool.drain() == 1
+    # A crash after the results were written but before the cursor moved
+    with open(spool.index_path, "w") as index_file:
+        index_file.write(f"0 1 {first}\n")
+    spool._write_cursor(0)
+    with open(spool.data_path, "wb") as data_file:
+        data_file.write(generate_replay_data())
+
+    assert await spool.drain() == 0
+    assert spool.status(first)["created"] == 1
+
+    # A crash mid-append tears the index line, and one mid-compaction leaves the cursor past the emptied spool
+    with open(spool.index_path, "a") as index_file:
+        index_file.write("1 5")
+    assert spool._pending_tickets(0) == []
+    os.truncate(spool.data_path, 0)
+    os.truncate(spool.index_path, 0)
+    with open(spool.index_path, "a") as index_file:
+        index_file.write("12 5")
+    spool._write_cursor(1)
+
+    second = spool.append([generate_replay_data(), generate_replay_data()])
+    assert spool._pending_tickets(spool._read_cursor()) == [(0, 2, second)]
+    assert await spool.drain() == 2
+    assert spool.status(second)["created"] == 2
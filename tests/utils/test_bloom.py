@@ -0,0 +1,22 @@
+import hashlib
+
+import pytest
+
+from app.utils.bloom import BloomFilter
+
+
+def filename(i: int) -> str:
+    return hashlib.sha256(str(i).encode()).hexdigest()[:25] + ".dat"
+
+
+@pytest.mark.unit
+def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives():
+    bloom = BloomFilter(capacity=10_000, error_rate=0.01)
+    for i in range(10_000):
+        bloom.add(filename(i))
+
+    assert all(filename(i) in bloom for i in range(10_000))
+    false_positives = sum(filename(i) in bloom for i in range(10_000, 20_000))
+    assert false_positives < 10_000 * 0.02
+    assert bloom.expected_error_rate == pytest.approx(0.01, rel=0.2)
+    assert "not-a-hash" not in bloom
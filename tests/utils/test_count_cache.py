@@ -0,0 +1,40 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.services.replay_service import ReplayService
+from app.utils.count_cache import CountCache
+
+
+@pytest.mark.unit
+def test_count_cache_invalidates_only_matching_filters():
+    cache = CountCache()
+    assert cache.key({"p2": " Ragna "}) == cache.key({"p1": "ragna"})
+
+    filters = {"ragna": {"p1": "ragna"}, "jin": {"p1_character_id": 3}, "all": {}}
+    for params in filters.values():
+        cache.set(cache.key(params), params, 10, 0.05, cache.generation)
+
+    row = {"p1": "Noel", "p2": "RagnaTheBloodedge", "p1_character_id": 5, "p2_character_id": 1,
+           "recorded_at": datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)}
+    assert cache.invalidate([row], ReplayService.row_matches) == 2
+    assert cache.get(cache.key(filters["jin"])) == 10
+    assert cache.get(cache.key(filters["ragna"])) is None
+
+    # A count that started before a write is not stored
+    generation = cache.generation
+    cache.invalidate([row], ReplayService.row_matches)
+    cache.set(cache.key(filters["all"]), filters["all"], 11, 0.05, generation)
+    assert cache.get(cache.key(filters["all"])) is None
+
+    cache.record_hit(cache.key(filters["jin"]), 0.01)
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+    assert stats["avg_saved_ms"] == pytest.approx(40.0)
+
+
+@pytest.mark.unit
+def test_count_cache_entries_expire():
+    cache = CountCache(ttl=0)
+    cache.set(cache.key({}), {}, 1, 0.01, cache.generation)
+    assert cache.get(cache.key({})) is None
@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.utils.date_range import DateRange, date_range
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("value, granularity, tz, expected", [
+    ("2024", None, None, DateRange(utc(2024, 1, 1), utc(2025, 1, 1))),
+    ("May 2024", None, None, DateRange(utc(2024, 5, 1), utc(2024, 6, 1))),
+    ("2024-05-01 10:30", None, None, DateRange(utc(2024, 5, 1, 10, 30), utc(2024, 5, 1, 10, 31))),
+    ("2024-05-01 10:30:15", "hour", None, DateRange(utc(2024, 5, 1, 10), utc(2024, 5, 1, 11))),
+    ("2024-05-01T10:30+02:00", None, None, DateRange(utc(2024, 5, 1, 8, 30), utc(2024, 5, 1, 8, 31))),
+    # The day DST starts in New York is 23 hours long
+    ("2024-03-10", None, "America/New_York", DateRange(utc(2024, 3, 10, 5), utc(2024, 3, 11, 4))),
+    (["2024-05-01", "2024-05-03"], None, None, DateRange(utc(2024, 5, 1), utc(2024, 5, 4))),
+])
+def test_date_range_covers_the_precision_written(value, granularity, tz, expected):
+    assert date_range(value, granularity=granularity, tz=tz) == expected
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("value, granularity, tz", [
+    ("10:30", None, None),
+    ("May 5", None, None),
+    ("2024-05-01", "week", None),
+    ("2024-05-01", None, "Mars/Olympus_Mons"),
+    (["2024-05-03", "2024-05-01"], None, None),
+])
+def test_date_range_rejects_ambiguous_searches(value, granularity, tz):
+    with pytest.raises(ValueError):
+        date_range(value, granularity=granularity, tz=tz)
@@ -1,8 +1,12 @@
+from io import BytesIO
+from datetime import datetime, timezone
+
 import pytest
 
 from tests.constants import REPLAYS, REPlAYS_2ND, REPlAYS_3RD, REPLAYS_SET
 from tests.helpers import generate_mock_replays_from_data
-from app.utils.helpers import total_up_wins, collapse_replays_into_sets, order_by_criteria_replays
+from app.utils.helpers import total_up_wins, collapse_replays_into_sets, order_by_criteria_replays, read_records
+from app.utils.helpers import encode_cursor, decode_cursor
 
 
 @pytest.mark.unit
@@ -36,3 +40,26 @@ def test_order_replays_by_options():
     assert all(replay["p2"] == "Dark Souls II" for replay in replays)
     order_by_criteria_replays(replays, pos="LEFT", search=["Dark"], outcome="WON")
     assert all(replay["p1"] == "Dark Souls II" and replay["p1wins"] > replay["p2wins"] for replay in replays)
+
+
+@pytest.mark.unit
+def test_read_records():
+    class TrickleStream(BytesIO):
+        # Hands out at most 7 bytes per read, like a slow request body
+        def read(self, size=-1):
+            return super().read(min(size, 7))
+
+    records = list(read_records(TrickleStream(b"a" * 20 + b"b" * 20 + b"c" * 5), 20))
+    assert records == [b"a" * 20, b"b" * 20, b"c" * 5]
+    assert list(read_records(BytesIO(b""), 20)) == []
+
+
+@pytest.mark.unit
+def test_cursor_round_trip():
+    recorded_at = datetime(2024, 10, 16, 20, 54, 18, tzinfo=timezone.utc)
+    cursor = encode_cursor(recorded_at, 42)
+
+    assert decode_cursor(cursor) == (recorded_at, 42)
+    for invalid in ("", "garbage", cursor[:-3], encode_cursor(recorded_at.replace(tzinfo=None), 42)):
+        with pytest.raises(ValueError):
+            decode_cursor(invalid)
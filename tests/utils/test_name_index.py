@@ -0,0 +1,19 @@
+import pytest
+
+from app.utils.name_index import NameIndex
+
+
+@pytest.mark.unit
+def test_name_index_suggests_by_prefix_most_played_first():
+    index = NameIndex.from_counts([("Ragna", 1, 5), ("ragnarok", 2, 9), ("Rachel", 3, 20), ("Jin", 4, 1)])
+    index.add("Ragna", 1)
+    index.add("RAGE", 5, 3)
+
+    assert [(s["name"], s["replays"]) for s in index.suggest(" rag")] == [("ragnarok", 9), ("Ragna", 6), ("RAGE", 3)]
+    assert index.suggest("ra", limit=1) == [{"name": "Rachel", "steamid64": 3, "replays": 20}]
+    assert index.suggest("") == [] and index.suggest("x") == []
+
+    index.remove("ragnarok", 2, 9)
+    index.remove("Ragna", 1)
+    assert [(s["name"], s["replays"]) for s in index.suggest("ragn")] == [("Ragna", 5)]
+    assert len(index) == 4
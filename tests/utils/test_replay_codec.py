@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from app.utils import replay_codec
+from app.utils.constants import REPLAY_SIZE
+from tests.helpers import generate_replay_data
+
+
+def idle_inputs() -> bytes:
+    """Mostly held inputs with a few changes, then zero padding like a short match."""
+    frames = bytearray()
+    for frame in range(6000):
+        frames += bytes([frame // 500 % 16, 0, 0x20 if frame % 97 < 3 else 0, 0])
+    return bytes(frames) + bytes(0xF730 - len(frames))
+
+
+@pytest.mark.unit
+def test_encode_round_trips_and_compresses():
+    raw = generate_replay_data(replay_inputs=idle_inputs())
+
+    encoded = replay_codec.encode(raw)
+    assert replay_codec.is_encoded(encoded)
+    assert len(encoded) < REPLAY_SIZE // 10
+    assert replay_codec.encode(encoded) is encoded
+    assert replay_codec.decode(encoded) == raw
+
+    empty = generate_replay_data(replay_inputs=bytes(0xF730))
+    assert replay_codec.decode(replay_codec.encode(empty)) == empty
+
+
+@pytest.mark.unit
+def test_encode_passes_raw_replays_through():
+    # Incompressible replays and level 0 are both stored raw
+    noisy = os.urandom(REPLAY_SIZE)
+    assert replay_codec.encode(noisy) is noisy
+    assert replay_codec.decode(noisy) is noisy
+
+    raw = generate_replay_data(replay_inputs=idle_inputs())
+    assert replay_codec.encode(raw, level=0) is raw
+
+    with pytest.raises(ValueError):
+        replay_codec.decode(b"\x00" * 100)
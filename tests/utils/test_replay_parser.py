@@ -0,0 +1,36 @@
+import hashlib
+
+import pytest
+
+from app.utils import replay_parser
+from tests.helpers import generate_replay_data
+
+
+@pytest.mark.unit
+def test_parse_replay_matches_field_layout():
+    data = generate_replay_data(p1="Tomato", p2="Maddie", p1_character_id=23, p2_character_id=0, winner=1)
+    replay = replay_parser.parse_replay(data)
+
+    assert replay["p1"] == "Tomato"
+    assert replay["p2"] == "Maddie"
+    assert replay["recorder"] == "Tomato"
+    assert replay["p1_character_id"] == 23
+    assert replay["winner"] == 1
+    assert replay["recorded_at"].year == 2024
+
+    expected = hashlib.sha256(data[0x230:0x238] + data[0x9C:0xA4] + data[0x166:0x16E] + data[0x8D0:]).hexdigest()
+    assert replay["filename"] == expected[:25] + ".dat"
+
+
+@pytest.mark.unit
+def test_decode_batch_views_every_record():
+    buffer = b"".join(generate_replay_data(p2_character_id=i, p2_steamid64=1000 + i) for i in range(3))
+    headers = replay_parser.decode_batch(buffer)
+
+    assert headers["p2_character_id"].tolist() == [0, 1, 2]
+    assert headers["p2_steamid64"].tolist() == [1000, 1001, 1002]
+    assert replay_parser.hash_batch(buffer) == [replay_parser.hash_filename(record)
+                                                for record in replay_parser.iter_records(buffer)]
+
+    with pytest.raises(ValueError):
+        list(replay_parser.iter_records(buffer[:-1]))